@@ -0,0 +1,84 @@
+"""
+Shared user resolution for JWT-authenticated REST requests and WebSockets.
+
+Users are looked up in a short-lived in-process LRU, then in the Redis
+cache, and only then in the database (with their company joined). Saving
+or deleting a User or Company invalidates the shared entries once the
+transaction commits, so they can't be refilled from the old rows; other
+processes' local entries expire after ``USER_CACHE_LOCAL_TTL`` seconds.
+"""
+import copy
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+from task_manager.caching import LocalTTLCache
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_TTL = getattr(settings, 'USER_CACHE_TTL', 60)
+
+local_users = LocalTTLCache(
+    maxsize=getattr(settings, 'USER_CACHE_LOCAL_SIZE', 4096),
+    ttl=getattr(settings, 'USER_CACHE_LOCAL_TTL', 5),
+)
+
+
+def user_cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def get_cached_user(user_id):
+    """Return the User with its company loaded, or None if it does not exist."""
+    user = local_users.get(user_id)
+    if user is None:
+        user = cache_get(user_cache_key(user_id))
+        if user is None:
+            try:
+                user = User.objects.select_related('company').get(pk=user_id)
+            except (User.DoesNotExist, ValueError):
+                return None
+            cache_set(user_cache_key(user_id), user)
+        local_users.set(user_id, user)
+    # Hand out a copy so per-request changes never leak into the cache.
+    return copy.copy(user)
+
+
+def invalidate_user(user_id):
+    local_users.delete(user_id)
+    cache_delete_many([user_cache_key(user_id)])
+
+
+def invalidate_company(company_id):
+    user_ids = list(User.objects.filter(company_id=company_id).values_list('id', flat=True))
+    for user_id in user_ids:
+        local_users.delete(user_id)
+    cache_delete_many([user_cache_key(user_id) for user_id in user_ids])
+
+
+# Redis being unreachable must degrade to database lookups, not failed logins.
+
+def cache_get(key):
+    try:
+        return cache.get(key)
+    except Exception:
+        logger.warning('User cache unavailable; falling back to the database', exc_info=True)
+        return None
+
+
+def cache_set(key, value):
+    try:
+        cache.set(key, value, USER_CACHE_TTL)
+    except Exception:
+        logger.warning('User cache unavailable; not caching %s', key, exc_info=True)
+
+
+def cache_delete_many(keys):
+    if not keys:
+        return
+    try:
+        cache.delete_many(keys)
+    except Exception:
+        logger.warning('User cache unavailable; could not invalidate %d key(s)', len(keys), exc_info=True)
@@ -1,5 +1,7 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 
 class Company(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -26,4 +28,25 @@ class User(AbstractUser):
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"{self.username} ({self.company.name if self.company else 'No Company'})"
\ No newline at end of file
+        return f"{self.username} ({self.company.name if self.company else 'No Company'})"
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed_handler(sender, instance, **kwargs):
+    """Signal handler to drop a changed user from the authentication cache"""
+    from .cache import invalidate_user
+    # Dropped before the commit, the entry could be re-read from the old row.
+    user_id = instance.pk
+    transaction.on_commit(lambda: invalidate_user(user_id))
+    # Task payloads embed user details; a login only touches last_login.
+    if kwargs.get('update_fields') != frozenset({'last_login'}):
+        from tasks import versions
+        versions.touch(instance.company_id, 'members')
+
+@receiver([post_save, post_delete], sender=Company)
+def company_changed_handler(sender, instance, **kwargs):
+    """Signal handler to drop a changed company's users from the authentication cache"""
+    from .cache import invalidate_company
+    company_id = instance.pk
+    transaction.on_commit(lambda: invalidate_company(company_id))
+    from tasks import versions
+    versions.touch(instance.pk, 'members')
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
+from task_manager.metrics import TimedSerializerMixin
 from .models import User, Company
 
 class CompanySerializer(serializers.ModelSerializer):
@@ -8,6 +9,17 @@ class CompanySerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'description', 'created_at']
         read_only_fields = ['id', 'created_at']
 
+    def to_representation(self, instance):
+        # Nested under a list of users, the same company would otherwise be
+        # serialized once per user; a 'company_cache' dict in the context
+        # makes it once per response.
+        cache = self.context.get('company_cache')
+        if cache is None:
+            return super().to_representation(instance)
+        if instance.pk not in cache:
+            cache[instance.pk] = super().to_representation(instance)
+        return cache[instance.pk]
+
 class UserRegistrationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, validators=[validate_password])
     password_confirm = serializers.CharField(write_only=True)
@@ -38,7 +50,7 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         user.save()
         return user
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     company = CompanySerializer(read_only=True)
 
     class Meta:
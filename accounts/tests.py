@@ -1,3 +1,81 @@
+from django.core.cache import cache
 from django.test import TestCase
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from .cache import local_users
+from .models import Company, User
+
+
+class AccountsTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Acme')
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pw', company=cls.company)
+
+    def setUp(self):
+        # Cached users would outlive each test's rollback.
+        cache.clear()
+        local_users.clear()
+        self.client = APIClient()
+
+
+class CompanyUsersTests(AccountsTestCase):
+
+    def test_lists_the_company_in_one_query(self):
+        for i in range(5):
+            User.objects.create_user(f'user{i}', f'user{i}@example.com', 'pw', company=self.company)
+        User.objects.create_user('mallory', 'mallory@example.com', 'pw', company=Company.objects.create(name='Other'))
+        self.client.force_authenticate(self.alice)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/auth/company-users/')
+
+        self.assertEqual(len(response.data), 6)
+        self.assertEqual({user['company']['name'] for user in response.data}, {'Acme'})
+
+
+class CachedAuthenticationTests(AccountsTestCase):
+
+    def login(self):
+        response = self.client.post('/api/auth/login/', {'username': 'alice', 'password': 'pw'})
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+
+    def test_tokens_resolve_their_user_from_the_cache(self):
+        self.login()
+        with self.assertNumQueries(1):
+            self.client.get('/api/auth/profile/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/auth/profile/')
+        self.assertEqual(response.data['company']['name'], 'Acme')
+
+    def test_saving_a_user_invalidates_the_cache(self):
+        self.login()
+        self.client.get('/api/auth/profile/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.first_name = 'Alice'
+            self.alice.save()
+
+        response = self.client.get('/api/auth/profile/')
+        self.assertEqual(response.data['first_name'], 'Alice')
+
+    def test_deactivated_users_are_rejected(self):
+        self.login()
+        self.client.get('/api/auth/profile/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.is_active = False
+            self.alice.save()
+
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, 401)
+
+    def test_company_changes_invalidate_the_cache_once_committed(self):
+        self.login()
+        self.client.get('/api/auth/profile/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.company.name = 'Acme Corp'
+            self.company.save()
+            response = self.client.get('/api/auth/profile/')
+            self.assertEqual(response.data['company']['name'], 'Acme')
+
+        response = self.client.get('/api/auth/profile/')
+        self.assertEqual(response.data['company']['name'], 'Acme Corp')
@@ -3,7 +3,8 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework_simplejwt.views import TokenObtainPairView
-from .models import User, Company
+from task_manager import db_router
+from .models import User
 from .serializers import UserRegistrationSerializer, UserSerializer
 
 class RegisterView(generics.CreateAPIView):
@@ -17,6 +18,7 @@ class CustomTokenObtainPairView(TokenObtainPairView):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def profile_view(request):
+    db_router.read_from_replica()
     serializer = UserSerializer(request.user)
     return Response(serializer.data)
 
@@ -24,10 +26,11 @@ def profile_view(request):
 @permission_classes([IsAuthenticated])
 def company_users_view(request):
     """Get all users from the same company"""
+    db_router.read_from_replica()
     if not request.user.company:
         return Response({'error': 'User not associated with any company'}, 
                        status=status.HTTP_400_BAD_REQUEST)
     
-    users = User.objects.filter(company=request.user.company)
+    users = User.objects.filter(company=request.user.company).select_related('company')
     serializer = UserSerializer(users, many=True)
     return Response(serializer.data)
\ No newline at end of file
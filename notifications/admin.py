@@ -1,9 +1,15 @@
 from django.contrib import admin
-from .models import EmailNotification
+from .models import EmailNotification, NotificationOutbox
 
 @admin.register(EmailNotification)
 class EmailNotificationAdmin(admin.ModelAdmin):
     list_display = ['recipient', 'subject', 'task', 'is_sent', 'sent_at']
     list_filter = ['is_sent', 'sent_at']
     search_fields = ['recipient__username', 'subject', 'task__title']
-    readonly_fields = ['sent_at']
\ No newline at end of file
+    readonly_fields = ['sent_at']
+
+
+@admin.register(NotificationOutbox)
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    list_display = ['task_id', 'created_at']
+    readonly_fields = ['task_id', 'created_at']
@@ -0,0 +1,58 @@
+"""
+Transactional outbox for new-task notifications.
+
+Creating a task inserts a NotificationOutbox row in the same transaction,
+so a notification exists exactly when its task was committed and the
+write never waits on the broker. ``relay()`` (run by Celery beat every
+``NOTIFICATION_RELAY_INTERVAL`` seconds, or by the long-running
+``relay_notifications`` command) drains the outbox in batches: each batch
+is locked, published as one ``send_task_notification_emails`` job and
+deleted in one transaction.
+
+Delivery is at least once: if the delete fails to commit after the job
+was published, the batch is published again. Concurrent relays skip rows
+another one has locked (on PostgreSQL), so they split the backlog.
+"""
+import logging
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import NotificationOutbox
+from .tasks import send_task_notification_emails
+
+logger = logging.getLogger(__name__)
+
+RELAY_BATCH_SIZE = getattr(settings, 'NOTIFICATION_RELAY_BATCH_SIZE', 500)
+
+
+def queue_task_notifications(tasks):
+    """Queue the new-task notifications of ``tasks`` in the current transaction."""
+    NotificationOutbox.objects.bulk_create(NotificationOutbox(task_id=task.pk) for task in tasks)
+
+
+def relay(batch_size=None):
+    """Publish the outbox in batches until it is empty; returns how many notifications were published."""
+    batch_size = batch_size or RELAY_BATCH_SIZE
+    total = 0
+    while True:
+        try:
+            published = relay_batch(batch_size)
+        except Exception:
+            logger.warning('Broker unavailable; notifications stay in the outbox', exc_info=True)
+            return total
+        total += published
+        if published < batch_size:
+            return total
+
+
+def relay_batch(batch_size):
+    with transaction.atomic():
+        entries = list(
+            NotificationOutbox.objects.select_for_update(skip_locked=True)
+            .order_by('id').values_list('id', 'task_id')[:batch_size]
+        )
+        if entries:
+            send_task_notification_emails.apply_async(args=[sorted({task_id for _, task_id in entries})])
+            NotificationOutbox.objects.filter(id__in=[pk for pk, _ in entries]).delete()
+    return len(entries)
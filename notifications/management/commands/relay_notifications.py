@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from notifications import dispatch
+
+
+class Command(BaseCommand):
+    help = (
+        'Publish queued new-task notifications from the outbox to the broker, continuously '
+        '(instead of, or next to, the Celery beat relay) or once with --once'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to wait after the outbox was found empty')
+        parser.add_argument('--batch-size', type=int, default=dispatch.RELAY_BATCH_SIZE,
+                            help='Notifications published per Celery job')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the outbox once and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            # Long-running: reconnect the way the request cycle would.
+            close_old_connections()
+            published = dispatch.relay(options['batch_size'])
+            if published and options['verbosity'] > 1:
+                self.stderr.write(f'Published {published} notification(s)')
+            if options['once']:
+                self.stdout.write(f'{published} notification(s) published')
+                return
+            time.sleep(options['interval'])
@@ -23,4 +23,20 @@ class EmailNotification(models.Model):
         ordering = ['-sent_at']
 
     def __str__(self):
-        return f"Email to {self.recipient.username}: {self.subject}"
\ No newline at end of file
+        return f"Email to {self.recipient.username}: {self.subject}"
+
+
+class NotificationOutbox(models.Model):
+    """
+    A created task whose notification has not been handed to Celery yet.
+
+    Written in the transaction that creates the task and deleted by the
+    relay once published (see notifications.dispatch).
+    """
+    # Not a foreign key: deleting tasks must not have to look here, and
+    # the email job skips tasks that no longer exist.
+    task_id = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Notification for task {self.task_id}"
@@ -1,3 +1,5 @@
+from collections import defaultdict
+
 from celery import shared_task
 from django.conf import settings
 from .models import EmailNotification
@@ -5,48 +7,127 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-@shared_task
-def send_task_notification_email(task_id, recipient_id):
-    try:
-        from tasks.models import Task
-        from accounts.models import User
-        
-        task = Task.objects.get(id=task_id)
-        recipient = User.objects.get(id=recipient_id)
-        subject = f"New Task Assigned: {task.title}"
-        message = f"""
-        Hello {recipient.first_name or recipient.username},
-        
+TASK_MESSAGE = """
+        Hello {name},
+
         You have been assigned a new task:
-        
+
         Title: {task.title}
         Description: {task.description}
-        Status: {task.get_status_display()}
-        Created by: {task.created_by.get_full_name() or task.created_by.username}
+        Status: {status}
+        Created by: {creator}
         Company: {task.company.name}
-        
+
+        Please log in to the task manager to view more details.
+
+        Best regards,
+        Task Manager Team
+        """
+
+DIGEST_MESSAGE = """
+        Hello {name},
+
+        You have been assigned {count} new tasks:
+
+{items}
+
         Please log in to the task manager to view more details.
-        
+
         Best regards,
         Task Manager Team
         """
-        
-        notification = EmailNotification.objects.create(
-            recipient=recipient,
-            subject=subject,
-            message=message,
-            task=task
-        )
-        logger.info(f"EMAIL NOTIFICATION SENT:")
-        logger.info(f"To: {recipient.email}")
-        logger.info(f"Subject: {subject}")
-        logger.info(f"Message: {message}")
-        
-        notification.is_sent = True
-        notification.save()
-        
-        return f"Email notification sent to {recipient.email}"
-        
+
+
+@shared_task
+def relay_task_notifications():
+    """Publish the notification outbox to the broker in batches (run by Celery beat)"""
+    from .dispatch import relay
+
+    published = relay()
+    if published:
+        logger.info(f"Published {published} task notification(s)")
+    return f"{published} task notification(s) published"
+
+
+@shared_task
+def send_task_notification_email(task_id, recipient_id):
+    """Kept for messages enqueued before notifications were batched"""
+    return send_task_notification_emails([task_id])
+
+
+@shared_task
+def send_task_notification_emails(task_ids, digest=None):
+    """
+    Send the new-task notifications for a batch of tasks.
+
+    Tasks, assignees, creators and companies are loaded in one query and
+    the EmailNotification rows are written with one bulk_create, already
+    marked as sent. With ``digest`` (default: the NOTIFICATION_DIGEST
+    setting) a recipient with several new tasks gets a single email.
+    """
+    from tasks.models import Task
+
+    if digest is None:
+        digest = getattr(settings, 'NOTIFICATION_DIGEST', False)
+
+    try:
+        tasks = Task.objects.filter(id__in=task_ids).select_related(
+            'assigned_to', 'created_by', 'company'
+        ).order_by('assigned_to_id', 'created_at')
+        by_recipient = defaultdict(list)
+        for task in tasks:
+            by_recipient[task.assigned_to].append(task)
+
+        notifications = []
+        for recipient, assigned in by_recipient.items():
+            if digest and len(assigned) > 1:
+                notifications.append(build_digest(recipient, assigned))
+            else:
+                notifications.extend(build_notification(recipient, task) for task in assigned)
+
+        for notification in notifications:
+            logger.info(f"EMAIL NOTIFICATION SENT:")
+            logger.info(f"To: {notification.recipient.email}")
+            logger.info(f"Subject: {notification.subject}")
+            logger.info(f"Message: {notification.message}")
+        EmailNotification.objects.bulk_create(notifications)
+
+        return f"{len(notifications)} email notification(s) sent to {len(by_recipient)} recipient(s)"
+
     except Exception as e:
-        logger.error(f"Failed to send email notification: {str(e)}")
-        return f"Failed to send email: {str(e)}"
+        logger.error(f"Failed to send email notifications: {str(e)}")
+        return f"Failed to send emails: {str(e)}"
+
+
+def build_notification(recipient, task):
+    message = TASK_MESSAGE.format(
+        name=recipient.first_name or recipient.username,
+        task=task,
+        status=task.get_status_display(),
+        creator=task.created_by.get_full_name() or task.created_by.username,
+    )
+    return EmailNotification(
+        recipient=recipient,
+        subject=f"New Task Assigned: {task.title}",
+        message=message,
+        task=task,
+        is_sent=True,
+    )
+
+
+def build_digest(recipient, tasks):
+    items = '\n'.join(
+        f"        - {task.title} ({task.get_status_display()}, {task.company.name})"
+        for task in tasks
+    )
+    message = DIGEST_MESSAGE.format(
+        name=recipient.first_name or recipient.username,
+        count=len(tasks),
+        items=items,
+    )
+    return EmailNotification(
+        recipient=recipient,
+        subject=f"{len(tasks)} New Tasks Assigned",
+        message=message,
+        is_sent=True,
+    )
@@ -1,3 +1,57 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+
+from accounts.models import Company, User
+from tasks.models import Task
+from .dispatch import relay
+from .models import EmailNotification, NotificationOutbox
+
+
+class OutboxTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Acme')
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pw', company=cls.company)
+        cls.bob = User.objects.create_user('bob', 'bob@example.com', 'pw', company=cls.company)
+
+    def create_task(self, assigned_to):
+        return Task.objects.create(title='task', company=self.company, created_by=self.alice, assigned_to=assigned_to)
+
+    def test_created_tasks_are_queued_in_the_outbox(self):
+        task = self.create_task(self.bob)
+        task.title = 'renamed'
+        task.save()
+
+        self.assertEqual(list(NotificationOutbox.objects.values_list('task_id', flat=True)), [task.pk])
+        self.assertFalse(EmailNotification.objects.exists())
+
+    def test_relay_publishes_in_batches_and_empties_the_outbox(self):
+        tasks = [self.create_task(user) for user in (self.bob, self.bob, self.alice)]
+
+        self.assertEqual(relay(batch_size=2), 3)
+
+        self.assertFalse(NotificationOutbox.objects.exists())
+        self.assertCountEqual(EmailNotification.objects.values_list('task_id', 'recipient_id'), [
+            (tasks[0].pk, self.bob.pk), (tasks[1].pk, self.bob.pk), (tasks[2].pk, self.alice.pk),
+        ])
+
+    @override_settings(NOTIFICATION_DIGEST=True)
+    def test_digests_group_the_tasks_of_each_recipient(self):
+        for user in (self.bob, self.bob, self.alice):
+            self.create_task(user)
+
+        relay()
+
+        self.assertEqual(EmailNotification.objects.filter(recipient=self.bob).count(), 1)
+        self.assertEqual(EmailNotification.objects.filter(recipient=self.alice).count(), 1)
+
+    def test_broker_failures_keep_the_outbox(self):
+        self.create_task(self.bob)
+
+        with mock.patch('notifications.dispatch.send_task_notification_emails.apply_async', side_effect=OSError), \
+                self.assertLogs('notifications.dispatch', 'WARNING'):
+            self.assertEqual(relay(), 0)
+
+        self.assertEqual(NotificationOutbox.objects.count(), 1)
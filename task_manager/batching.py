@@ -0,0 +1,83 @@
+import atexit
+import logging
+import os
+import threading
+import time
+
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class CoalescingBuffer:
+    """
+    Thread-safe buffer that merges items by key and flushes them in batches.
+
+    ``add()`` is cheap and never blocks on I/O: items are merged into a
+    dict and a background thread hands the whole dict to ``flush`` at most
+    once per ``window`` seconds. With ``window <= 0`` every ``add()``
+    flushes inline, which keeps tests and management commands synchronous.
+    The thread is a daemon, so what is still pending when the process exits
+    is flushed by an ``atexit`` hook instead.
+    """
+
+    def __init__(self, flush, window=0.25, name='coalescing-buffer'):
+        self.flush = flush
+        self.window = window
+        self.name = name
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pending = {}
+        self._thread = None
+        self._pid = None
+        atexit.register(self.drain)
+
+    def add(self, key, value, merge=None):
+        self.add_many({key: value}, merge)
+
+    def add_many(self, items, merge=None):
+        if self.window <= 0:
+            self._flush(dict(items))
+            return
+        with self._lock:
+            for key, value in items.items():
+                if merge is not None and key in self._pending:
+                    value = merge(self._pending[key], value)
+                self._pending[key] = value
+            self._ensure_thread()
+        self._wakeup.set()
+
+    def drain(self):
+        """Flush whatever is pending right now, on the calling thread."""
+        with self._lock:
+            items, self._pending = self._pending, {}
+        if items:
+            self._flush(items)
+
+    def _ensure_thread(self):
+        # Forked workers (Celery prefork, gunicorn) inherit a dead thread.
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            # Let the window fill up before collecting it.
+            time.sleep(self.window)
+            self._wakeup.clear()
+            # This thread outlives requests, so manage its DB connection
+            # the way the request cycle would.
+            close_old_connections()
+            try:
+                self.drain()
+            finally:
+                close_old_connections()
+
+    def _flush(self, items):
+        try:
+            self.flush(items)
+        except Exception:
+            logger.exception('%s: failed to flush %d item(s)', self.name, len(items))
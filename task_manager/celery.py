@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import task_postrun, task_prerun
 
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'task_manager.settings')
@@ -12,3 +13,15 @@ app.autodiscover_tasks()
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
+
+
+@task_prerun.connect
+def start_task_metrics(task=None, **kwargs):
+    from . import metrics
+    metrics.task_started(task.name)
+
+
+@task_postrun.connect
+def finish_task_metrics(state=None, **kwargs):
+    from . import metrics
+    metrics.task_finished(state)
@@ -0,0 +1,182 @@
+"""
+Routing of read-only traffic to PostgreSQL replicas.
+
+Nothing reads from a replica unless it asks to: views whose reads may lag
+the primary by a moment call :func:`read_from_replica`, and commands run
+inside :func:`replica_reads`. Everything else, and every write, goes to
+``default``, as does everything when ``REPLICA_DATABASES`` is empty.
+
+Users must still see their own writes, so reads stick to the primary
+
+* for the rest of a request or command once it has written anything (the
+  router sees every write);
+* for ``REPLICA_STICKY_SECONDS`` after a request that wrote, through a
+  short-lived cookie set by :class:`ReplicaRoutingMiddleware`;
+* whenever a caller knows the data changed very recently
+  (:func:`pin_primary`).
+
+A request reads from one replica throughout, so its queries see a single
+point in time. The routing state is a context variable holding a mutable
+object: it follows the request into ``sync_to_async`` threads, and what
+the view does there is seen by the middleware.
+"""
+import contextvars
+import random
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+REPLICAS = tuple(
+    alias for alias in getattr(settings, 'REPLICA_DATABASES', ()) if alias in settings.DATABASES
+)
+REPLICA_STICKY_SECONDS = getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+STICKY_COOKIE = 'db_primary'
+
+
+class Routing:
+    __slots__ = ('alias', 'pinned', 'wrote')
+
+    def __init__(self, pinned=False):
+        # The replica reads go to, once they may.
+        self.alias = None
+        self.pinned = pinned
+        self.wrote = False
+
+
+_routing = contextvars.ContextVar('db_routing', default=None)
+
+
+def read_from_replica():
+    """
+    Let the rest of the current request read from a replica.
+
+    Does nothing outside :class:`ReplicaRoutingMiddleware` or
+    :func:`replica_reads`, or without replicas.
+    """
+    routing = _routing.get()
+    if routing is not None and routing.alias is None and REPLICAS:
+        routing.alias = random.choice(REPLICAS)
+
+
+def pin_primary():
+    """Read from the primary for the rest of the current request."""
+    routing = _routing.get()
+    if routing is not None:
+        routing.pinned = True
+
+
+def read_alias():
+    """The database the current request or command reads from."""
+    routing = _routing.get()
+    if routing is None or routing.alias is None or routing.pinned:
+        return DEFAULT_DB_ALIAS
+    return routing.alias
+
+
+@contextmanager
+def replica_reads():
+    """Read from a replica inside the block (for commands and tasks; views use the middleware)."""
+    token = _routing.set(Routing())
+    try:
+        read_from_replica()
+        yield
+    finally:
+        _routing.reset(token)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if _routing.get() is None:
+            return None
+        return read_alias()
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None:
+            routing.wrote = routing.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema by replication.
+        if db in REPLICAS:
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Give every request its routing state, pinned to the primary while the
+    client's sticky cookie is alive, and set the cookie when it wrote.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        routing = Routing(pinned=STICKY_COOKIE in request.COOKIES)
+        token = _routing.set(routing)
+        try:
+            return self.finish(routing, self.get_response(request))
+        finally:
+            _routing.reset(token)
+
+    async def __acall__(self, request):
+        routing = Routing(pinned=STICKY_COOKIE in request.COOKIES)
+        token = _routing.set(routing)
+        try:
+            return self.finish(routing, await self.get_response(request))
+        finally:
+            _routing.reset(token)
+
+    def finish(self, routing, response):
+        if routing.wrote and REPLICAS:
+            response.set_cookie(
+                STICKY_COOKIE, '1', max_age=REPLICA_STICKY_SECONDS, httponly=True, samesite='Lax'
+            )
+        if response.streaming and routing.alias is not None:
+            # Streamed bodies are rendered after the request returns here.
+            route = arouted if response.is_async else routed
+            response.streaming_content = route(routing, response.streaming_content)
+        return response
+
+
+def routed(routing, content):
+    """Iterate ``content`` with ``routing`` in effect for each chunk."""
+    iterator = iter(content)
+    while True:
+        token = _routing.set(routing)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _routing.reset(token)
+        yield chunk
+
+
+async def arouted(routing, content):
+    """:func:`routed` for async streamed content (e.g. the export under ASGI)."""
+    iterator = aiter(content)
+    while True:
+        token = _routing.set(routing)
+        try:
+            chunk = await anext(iterator)
+        except StopAsyncIteration:
+            return
+        finally:
+            _routing.reset(token)
+        yield chunk
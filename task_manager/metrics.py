@@ -0,0 +1,406 @@
+"""
+In-process request metrics, exposed in the Prometheus text format.
+
+Every HTTP request (:class:`MetricsMiddleware`), TaskConsumer message and
+Celery task is measured: wall time, number and duration of database
+queries, time spent in DRF serializers and bytes sent. Each measurement is
+recorded into histograms labelled by kind (``http``, ``websocket``,
+``celery``), route (URL name, handler or task name) and company, and
+``/metrics`` renders them. They are per process: scrape every worker, or
+read them in aggregate only when running one.
+
+Queries are counted by an execute wrapper installed on every database
+connection; it reports to the measurement in a context variable, so
+queries made in ``sync_to_async`` threads count towards the request that
+made them. A measurement started inside another (an eager Celery task
+during a request) counts its queries towards both, and :func:`observe`
+counts those of a block without recording it (e.g. for benchmarks).
+
+A fraction (``METRICS_SLOW_SAMPLE_RATE``) of measurements also captures
+its SQL; sampled ones slower than ``METRICS_SLOW_SECONDS`` are logged with
+their statements to the ``task_manager.metrics.slow`` logger.
+"""
+import bisect
+import contextvars
+import logging
+import math
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+
+slow_logger = logging.getLogger(f'{__name__}.slow')
+
+METRICS_SLOW_SECONDS = getattr(settings, 'METRICS_SLOW_SECONDS', 0.5)
+METRICS_SLOW_SAMPLE_RATE = getattr(settings, 'METRICS_SLOW_SAMPLE_RATE', 0.1)
+# Label sets beyond this are recorded under company "other".
+METRICS_MAX_SERIES = getattr(settings, 'METRICS_MAX_SERIES', 10000)
+METRICS_ALLOWED_IPS = getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
+# Statements kept per sampled measurement, and characters per statement.
+MAX_STATEMENTS = 100
+MAX_STATEMENT_LENGTH = 2000
+
+PREFIX = 'task_manager'
+LABELS = ('kind', 'route', 'company')
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNTS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+
+    def __init__(self, name, help, buckets):
+        self.name = f'{PREFIX}_{name}'
+        self.help = help
+        self.buckets = buckets
+        # labels -> [per-bucket counts (the last one is +Inf), sum]
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                le = '+Inf' if bound == math.inf else repr(bound)
+                lines.append(f'{self.name}_bucket{{{format_labels(labels)},le="{le}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{format_labels(labels)}}} {total!r}')
+            lines.append(f'{self.name}_count{{{format_labels(labels)}}} {cumulative}')
+        return lines
+
+
+class Counter:
+
+    def __init__(self, name, help, label_names):
+        self.name = f'{PREFIX}_{name}'
+        self.help = help
+        self.label_names = label_names
+        self.series = {}
+
+    def inc(self, labels):
+        self.series[labels] = self.series.get(labels, 0) + 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self.series.items()):
+            lines.append(f'{self.name}{{{format_labels(labels, self.label_names)}}} {value}')
+        return lines
+
+
+def format_labels(values, names=LABELS):
+    return ','.join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Registry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.seen = set()
+        self.duration = Histogram('request_duration_seconds', 'Wall time of requests, messages and tasks', SECONDS)
+        self.db_queries = Histogram('request_db_queries', 'Database queries per request', COUNTS)
+        self.db_time = Histogram('request_db_seconds', 'Time spent in database queries per request', SECONDS)
+        self.serializer_time = Histogram(
+            'request_serializer_seconds', 'Time spent in DRF serializers per request', SECONDS
+        )
+        self.response_size = Histogram('response_bytes', 'Bytes sent per request', BYTES)
+        self.requests = Counter('requests_total', 'Requests by outcome', (*LABELS, 'status'))
+
+    def record(self, measurement, seconds):
+        labels = (measurement.kind, measurement.route or 'unknown', measurement.company_id or '')
+        with self._lock:
+            if labels not in self.seen:
+                if len(self.seen) >= METRICS_MAX_SERIES:
+                    labels = (*labels[:2], 'other')
+                self.seen.add(labels)
+            self.duration.observe(labels, seconds)
+            self.db_queries.observe(labels, measurement.queries)
+            self.db_time.observe(labels, measurement.db_seconds)
+            self.serializer_time.observe(labels, measurement.serializer_seconds)
+            if measurement.size is not None:
+                self.response_size.observe(labels, measurement.size)
+            self.requests.inc((*labels, str(measurement.status)))
+
+    def render(self):
+        with self._lock:
+            metrics = (
+                self.duration, self.db_queries, self.db_time, self.serializer_time, self.response_size,
+                self.requests,
+            )
+            lines = [line for metric in metrics for line in metric.render()]
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class Measurement:
+    __slots__ = (
+        'kind', 'route', 'company_id', 'status', 'size', 'started', 'queries', 'db_seconds',
+        'serializer_seconds', 'serializing', 'statements', 'token', 'parent',
+    )
+
+    def __init__(self, kind, route=None, company_id=None, parent=None):
+        self.kind = kind
+        self.route = route
+        self.company_id = company_id
+        self.status = 'ok'
+        self.size = None
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.serializing = False
+        # (seconds, sql) of the queries, for the sampled measurements only.
+        self.statements = [] if random.random() < METRICS_SLOW_SAMPLE_RATE else None
+        self.token = None
+        # The measurement this one was started inside of, if any.
+        self.parent = parent
+
+
+_current = contextvars.ContextVar('metrics_measurement', default=None)
+
+
+def start(kind, route=None, company_id=None):
+    """Measure what the current context does from now on, until :func:`finish`."""
+    measurement = Measurement(kind, route, company_id, _current.get())
+    measurement.token = _current.set(measurement)
+    return measurement
+
+
+def finish(measurement):
+    seconds = time.perf_counter() - measurement.started
+    if measurement.token is not None:
+        _current.reset(measurement.token)
+        measurement.token = None
+    registry.record(measurement, seconds)
+    if measurement.statements is not None and seconds >= METRICS_SLOW_SECONDS:
+        log_slow(measurement, seconds)
+
+
+@contextmanager
+def measure(kind, route, company_id=None, expected=()):
+    """Measure the block; exceptions other than ``expected`` ones mark it as an error."""
+    measurement = start(kind, route, company_id)
+    try:
+        yield measurement
+    except expected:
+        raise
+    except BaseException:
+        measurement.status = 'error'
+        raise
+    finally:
+        finish(measurement)
+
+
+@contextmanager
+def observe():
+    """Count the queries made in the block, measured ones included, without recording anything."""
+    measurement = Measurement('observed', parent=_current.get())
+    measurement.statements = None
+    token = _current.set(measurement)
+    try:
+        yield measurement
+    finally:
+        _current.reset(token)
+
+
+def tag_company(company_id):
+    """Label the current measurement with ``company_id`` (e.g. once a socket is authenticated)."""
+    measurement = _current.get()
+    if measurement is not None:
+        measurement.company_id = company_id
+
+
+def add_bytes(size):
+    measurement = _current.get()
+    if measurement is not None:
+        measurement.size = (measurement.size or 0) + size
+
+
+def log_slow(measurement, seconds):
+    statements = '\n'.join(
+        f'  {elapsed * 1000:8.1f} ms  {sql[:MAX_STATEMENT_LENGTH]}' for elapsed, sql in measurement.statements
+    )
+    slow_logger.warning(
+        'Slow %s %s (company %s): %.0f ms, %d queries in %.0f ms, serializers %.0f ms, %s bytes\n%s',
+        measurement.kind, measurement.route, measurement.company_id, seconds * 1000,
+        measurement.queries, measurement.db_seconds * 1000, measurement.serializer_seconds * 1000,
+        measurement.size, statements,
+    )
+
+
+# Database instrumentation.
+
+def record_query(execute, sql, params, many, context):
+    measurement = _current.get()
+    if measurement is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        while measurement is not None:
+            measurement.queries += 1
+            measurement.db_seconds += elapsed
+            statements = measurement.statements
+            if statements is not None and len(statements) < MAX_STATEMENTS:
+                statements.append((elapsed, sql))
+            measurement = measurement.parent
+
+
+def install_query_recorder(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(install_query_recorder, weak=False, dispatch_uid='metrics-query-recorder')
+for _connection in connections.all(initialized_only=True):
+    install_query_recorder(_connection)
+
+
+class TimedSerializerMixin:
+    """Count the time a DRF serializer spends rendering towards the current measurement."""
+
+    def to_representation(self, instance):
+        measurement = _current.get()
+        # Nested serializers are part of their parent's time.
+        if measurement is None or measurement.serializing:
+            return super().to_representation(instance)
+        measurement.serializing = True
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            measurement.serializer_seconds += time.perf_counter() - started
+            measurement.serializing = False
+
+
+# HTTP
+
+class MetricsMiddleware:
+    """Measure every request; streamed responses are measured until their last chunk."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        measurement = start('http')
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            measurement.status = 500
+            finish(measurement)
+            raise
+        return self.finish(request, response, measurement)
+
+    async def __acall__(self, request):
+        measurement = start('http')
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            measurement.status = 500
+            finish(measurement)
+            raise
+        return self.finish(request, response, measurement)
+
+    def finish(self, request, response, measurement):
+        match = request.resolver_match
+        measurement.route = match.view_name if match else 'unmatched'
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            measurement.company_id = user.company_id
+        measurement.status = response.status_code
+        if response.streaming:
+            _current.reset(measurement.token)
+            measurement.token = None
+            stream = ameasured_stream if response.is_async else measured_stream
+            response.streaming_content = stream(measurement, response.streaming_content)
+        else:
+            if not response.streaming:
+                measurement.size = len(response.content)
+            finish(measurement)
+        return response
+
+
+def measured_stream(measurement, content):
+    """Iterate ``content``, counting its bytes and queries, and finish ``measurement`` at the end."""
+    measurement.size = 0
+    iterator = iter(content)
+    try:
+        while True:
+            token = _current.set(measurement)
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                _current.reset(token)
+            measurement.size += len(chunk)
+            yield chunk
+    finally:
+        finish(measurement)
+
+
+async def ameasured_stream(measurement, content):
+    """:func:`measured_stream` for async streamed content (e.g. the export under ASGI)."""
+    measurement.size = 0
+    iterator = aiter(content)
+    try:
+        while True:
+            token = _current.set(measurement)
+            try:
+                chunk = await anext(iterator)
+            except StopAsyncIteration:
+                return
+            finally:
+                _current.reset(token)
+            measurement.size += len(chunk)
+            yield chunk
+    finally:
+        finish(measurement)
+
+
+def metrics_view(request):
+    """Prometheus text exposition of this process' metrics."""
+    if request.META.get('REMOTE_ADDR') not in METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Celery
+
+def task_started(name):
+    start('celery', name)
+
+
+def task_finished(state):
+    measurement = _current.get()
+    if measurement is not None and measurement.kind == 'celery':
+        measurement.status = (state or 'unknown').lower()
+        finish(measurement)
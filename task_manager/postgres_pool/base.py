@@ -0,0 +1,167 @@
+"""
+PostgreSQL backend with a process-wide connection pool (experimental).
+
+Under Daphne every request runs its sync code (DRF views, ``sync_to_async``,
+``database_sync_to_async``) on a thread of its own, so Django's persistent
+connections (``CONN_MAX_AGE``) are never reused: each request connects and
+disconnects. With this backend, closing a connection (at the end of every
+request, with ``CONN_MAX_AGE = 0``) hands it back to a pool shared by all
+threads of the process instead, and the next connect takes an idle one.
+
+``DATABASES[alias]["POOL"]`` configures it:
+
+* ``SIZE``: at most this many connections per process; connects beyond it
+  wait up to ``TIMEOUT`` seconds for one to be returned, then fail.
+* ``MAX_LIFETIME``: connections older than this many seconds are replaced.
+* ``CHECK_AFTER``: connections idle for longer than this are checked with
+  ``SELECT 1`` before reuse and replaced if the server dropped them.
+
+The pool has only been exercised with stand-in connections, not against a
+PostgreSQL server; treat it as experimental until it has.
+"""
+import collections
+import os
+import threading
+import time
+
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+DEFAULTS = {'SIZE': 10, 'TIMEOUT': 10.0, 'MAX_LIFETIME': 1800.0, 'CHECK_AFTER': 30.0}
+
+
+class PoolTimeout(base.Database.OperationalError):
+    pass
+
+
+class ConnectionPool:
+
+    def __init__(self, size, timeout, max_lifetime, check_after):
+        self.size = size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        # (connection, created_at, returned_at); the most recently returned
+        # connection is reused first so surplus ones age out.
+        self._idle = collections.deque()
+        self._created = {}
+
+    def acquire(self, connect):
+        """An idle connection, or a new one from ``connect()``; blocks while ``size`` are in use."""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f'No database connection became free within {self.timeout}s (pool size {self.size})')
+        try:
+            while True:
+                with self._lock:
+                    item = self._idle.pop() if self._idle else None
+                if item is None:
+                    connection = connect()
+                    self._created[id(connection)] = time.monotonic()
+                    return connection
+                connection, created_at, returned_at = item
+                now = time.monotonic()
+                if connection.closed or now - created_at > self.max_lifetime or (
+                    now - returned_at > self.check_after and not self.usable(connection)
+                ):
+                    self.discard(connection)
+                    continue
+                return connection
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, connection):
+        """Take back a connection from ``acquire()``, dropping it if it is broken."""
+        try:
+            status = connection.info.transaction_status if not connection.closed else None
+            if status in (extensions.TRANSACTION_STATUS_INTRANS, extensions.TRANSACTION_STATUS_INERROR):
+                connection.rollback()
+                status = connection.info.transaction_status
+            if status == extensions.TRANSACTION_STATUS_IDLE:
+                created_at = self._created.get(id(connection), time.monotonic())
+                with self._lock:
+                    self._idle.append((connection, created_at, time.monotonic()))
+                return
+        except base.Database.Error:
+            pass
+        finally:
+            self._slots.release()
+        self.discard(connection)
+
+    def usable(self, connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if connection.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+            return True
+        except base.Database.Error:
+            return False
+
+    def drop(self, connection):
+        """Give up a connection from ``acquire()`` without reusing it."""
+        try:
+            self.discard(connection)
+        finally:
+            self._slots.release()
+
+    def discard(self, connection):
+        self._created.pop(id(connection), None)
+        try:
+            connection.close()
+        except base.Database.Error:
+            pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+# Pools inherited from a parent process. Their connections are never used
+# here, but are kept referenced: closing them (even by garbage collection)
+# would end the parent's sessions.
+_inherited = []
+
+
+def get_pool(alias, options):
+    with _pools_lock:
+        pool, pid = _pools.get(alias, (None, None))
+        # A forked worker must not share its parent's sockets.
+        if pool is None or pid != os.getpid():
+            if pool is not None:
+                _inherited.append(pool)
+            options = {**DEFAULTS, **options}
+            pool = ConnectionPool(
+                int(options['SIZE']), float(options['TIMEOUT']),
+                float(options['MAX_LIFETIME']), float(options['CHECK_AFTER']),
+            )
+            _pools[alias] = (pool, os.getpid())
+        return pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def pool(self):
+        return get_pool(self.alias, self.settings_dict.get('POOL', {}))
+
+    def get_new_connection(self, conn_params):
+        connection = self.pool().acquire(
+            lambda: super(DatabaseWrapper, self).get_new_connection(conn_params)
+        )
+        # Set by the parent's get_new_connection on fresh connections only.
+        options = self.settings_dict['OPTIONS']
+        self.isolation_level = base.IsolationLevel(
+            options.get('isolation_level', base.IsolationLevel.READ_COMMITTED)
+        )
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        with self.wrap_database_errors:
+            if self.in_atomic_block:
+                # Django keeps using a connection closed inside atomic() until
+                # the block exits, so it can't be handed to another thread.
+                self.pool().drop(self.connection)
+            else:
+                self.pool().release(self.connection)
@@ -43,8 +43,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "task_manager.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "corsheaders.middleware.CorsMiddleware",
+    "task_manager.db_router.ReplicaRoutingMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -76,17 +78,52 @@ ASGI_APPLICATION = "task_manager.asgi.application"
 
 
 
+# DB_POOL_SIZE > 0 switches to the experimental pooled backend
+# (task_manager.postgres_pool; not yet tested against a PostgreSQL server):
+# connections are returned to a per-process pool of at most DB_POOL_SIZE at
+# the end of each request, instead of being closed, and checked before reuse.
+# Without it, DB_CONN_MAX_AGE keeps per-thread connections open, which only
+# helps under WSGI; under Daphne each request runs on a thread of its own.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "0"))
+
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql",
+        "ENGINE": "task_manager.postgres_pool" if DB_POOL_SIZE else "django.db.backends.postgresql",
         "NAME": os.getenv("DB_NAME", "multi"),
         "USER": os.getenv("DB_USER", "postgres"),
         "PASSWORD": os.getenv("DB_PASSWORD", "admin"),
         "HOST": os.getenv("DB_HOST", "localhost"),
         "PORT": os.getenv("DB_PORT", "5432"),
+        # The pool reuses connections itself; Django must hand them back.
+        "CONN_MAX_AGE": 0 if DB_POOL_SIZE else int(os.getenv("DB_CONN_MAX_AGE", "0")),
+        "CONN_HEALTH_CHECKS": os.getenv("DB_CONN_HEALTH_CHECKS", "true").lower() == "true",
+        "POOL": {
+            "SIZE": DB_POOL_SIZE,
+            "TIMEOUT": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+            "MAX_LIFETIME": float(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+            "CHECK_AFTER": float(os.getenv("DB_POOL_CHECK_AFTER", "30")),
+        },
     }
 }
 
+# Read replicas (comma-separated hosts streaming from the primary) serve the
+# read-only task, profile and company user endpoints and task_analytics;
+# see task_manager.db_router. After a request writes, the client reads from
+# the primary for DB_REPLICA_STICKY_SECONDS, which must cover replica lag.
+REPLICA_DATABASES = []
+for index, host in enumerate(host for host in os.getenv("DB_REPLICA_HOSTS", "").split(",") if host):
+    alias = "replica" if index == 0 else f"replica{index + 1}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "HOST": host.strip(),
+        "PORT": os.getenv("DB_REPLICA_PORT", DATABASES["default"]["PORT"]),
+        "TEST": {"MIRROR": "default"},
+    }
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ["task_manager.db_router.ReplicaRouter"]
+REPLICA_STICKY_SECONDS = int(os.getenv("DB_REPLICA_STICKY_SECONDS", "5"))
+
 
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -128,11 +165,14 @@ AUTH_USER_MODEL = "accounts.User"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "accounts.authentication.CachedJWTAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
+    "DEFAULT_THROTTLE_CLASSES": [
+        "task_manager.throttling.TenantRateThrottle",
+    ],
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 20,
 }
@@ -151,6 +191,58 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": REDIS_URL,
+        "KEY_PREFIX": "task_manager",
+    }
+}
+
+# Per-process request metrics at /metrics (task_manager.metrics), readable
+# from METRICS_ALLOWED_IPS. METRICS_SLOW_SAMPLE_RATE of the requests capture
+# their SQL, and those slower than METRICS_SLOW_SECONDS are logged with it.
+METRICS_ALLOWED_IPS = os.getenv("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",")
+METRICS_SLOW_SECONDS = float(os.getenv("METRICS_SLOW_SECONDS", "0.5"))
+METRICS_SLOW_SAMPLE_RATE = float(os.getenv("METRICS_SLOW_SAMPLE_RATE", "0.1"))
+
+# Token buckets of authenticated API requests (task_manager.throttling):
+# each company and each user refills RATE tokens per second up to BURST.
+# A request costs THROTTLE_COSTS[url name] tokens (default 1). "local" keeps
+# the buckets in process memory instead of Redis (single process only).
+THROTTLE_BACKEND = os.getenv("THROTTLE_BACKEND", "redis")
+THROTTLE_COMPANY_RATE = float(os.getenv("THROTTLE_COMPANY_RATE", "100"))
+THROTTLE_COMPANY_BURST = float(os.getenv("THROTTLE_COMPANY_BURST", "300"))
+THROTTLE_USER_RATE = float(os.getenv("THROTTLE_USER_RATE", "20"))
+THROTTLE_USER_BURST = float(os.getenv("THROTTLE_USER_BURST", "60"))
+THROTTLE_COSTS = {
+    "task-export": 20,
+    "task-statistics": 5,
+    "task-search": 3,
+    "task-lead-time": 3,
+    "task-cycle-time": 3,
+    "task-trends": 2,
+    "task-bulk-create": 5,
+    "task-bulk-update": 5,
+    "task-bulk-delete": 5,
+    "external_tasks": 2,
+}
+
+# Seconds a resolved JWT user stays in Redis and in each process' local LRU.
+USER_CACHE_TTL = 60
+USER_CACHE_LOCAL_TTL = 5
+
+# Cached task list/statistics responses: served while the company's
+# generation is unchanged and younger than RESPONSE_CACHE_TTL seconds.
+# Outdated statistics are served for up to RESPONSE_CACHE_STALE_TTL more
+# seconds while one worker recomputes them.
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "300"))
+RESPONSE_CACHE_STALE_TTL = int(os.getenv("RESPONSE_CACHE_STALE_TTL", "600"))
+RESPONSE_CACHE_LOCAL_TTL = 30
+
+
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
@@ -160,9 +252,49 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Seconds task changes are coalesced before one batched WebSocket event is
+# sent per company; 0 sends on commit from the request thread.
+TASK_BROADCAST_WINDOW = float(os.getenv("TASK_BROADCAST_WINDOW", "0.25"))
+
+# Every broadcast is numbered per company and its last TASK_REPLAY_LOG_SIZE
+# events kept in a Redis stream, so WebSocket clients can resume with
+# ?since=<seq>. "local" keeps the log in process memory (single process only).
+TASK_REPLAY_LOG = os.getenv("TASK_REPLAY_LOG", "redis")
+TASK_REPLAY_LOG_SIZE = int(os.getenv("TASK_REPLAY_LOG_SIZE", "1000"))
+
+# New-task emails are queued in an outbox table with the task and published
+# by Celery beat every NOTIFICATION_RELAY_INTERVAL seconds, as one job per
+# NOTIFICATION_RELAY_BATCH_SIZE tasks; with NOTIFICATION_DIGEST a recipient
+# gets one email per batch.
+NOTIFICATION_RELAY_INTERVAL = float(os.getenv("NOTIFICATION_RELAY_INTERVAL", "10"))
+NOTIFICATION_RELAY_BATCH_SIZE = int(os.getenv("NOTIFICATION_RELAY_BATCH_SIZE", "500"))
+NOTIFICATION_DIGEST = os.getenv("NOTIFICATION_DIGEST", "False") == "True"
+
+# External todo API merged into /api/tasks/external-tasks/. Responses are
+# fresh for EXTERNAL_TASKS_CACHE_TTL seconds, then served stale (while one
+# background request refreshes them) for up to EXTERNAL_TASKS_STALE_TTL.
+EXTERNAL_TASKS_URL = os.getenv("EXTERNAL_TASKS_URL", "https://jsonplaceholder.typicode.com/todos")
+EXTERNAL_TASKS_CACHE_TTL = float(os.getenv("EXTERNAL_TASKS_CACHE_TTL", "30"))
+EXTERNAL_TASKS_STALE_TTL = float(os.getenv("EXTERNAL_TASKS_STALE_TTL", "300"))
+EXTERNAL_TASKS_TIMEOUT = float(os.getenv("EXTERNAL_TASKS_TIMEOUT", "2"))
+
 CELERY_BROKER_URL = "redis://localhost:6379/0"
 CELERY_RESULT_BACKEND = "redis://localhost:6379/0"
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = "UTC"
+CELERY_BEAT_SCHEDULE = {
+    "update-task-rollups": {
+        "task": "tasks.tasks.update_task_rollups",
+        "schedule": float(os.getenv("TASK_ROLLUP_INTERVAL", "60")),
+    },
+    "relay-task-notifications": {
+        "task": "notifications.tasks.relay_task_notifications",
+        "schedule": NOTIFICATION_RELAY_INTERVAL,
+    },
+}
+
+# Task transitions younger than this many seconds are left for the next
+# rollup run, so rows from transactions still in flight are not skipped.
+TASK_ROLLUP_LAG = float(os.getenv("TASK_ROLLUP_LAG", "60"))
@@ -0,0 +1,47 @@
+"""
+Self-contained settings for ``manage.py benchmark_api`` without PostgreSQL or Redis.
+
+SQLite, the in-memory channel layer, a local-memory cache, an in-process
+replay log and eager Celery tasks; everything runs in one process.
+"""
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.getenv("BENCHMARK_DB", str(BASE_DIR / "benchmark.sqlite3")),  # noqa: F405
+        # Concurrent benchmark threads wait for the write lock instead of failing.
+        "OPTIONS": {"timeout": 30},
+    },
+    # Not a replica of anything: REPLICA_DATABASES stays empty, so only the
+    # router tests read from it, on a test database of its own.
+    "replica": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.getenv("BENCHMARK_DB", str(BASE_DIR / "benchmark.sqlite3")),  # noqa: F405
+        "OPTIONS": {"timeout": 30},
+    },
+}
+REPLICA_DATABASES = []
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+CHANNEL_LAYERS = {
+    "default": {
+        "BACKEND": "channels.layers.InMemoryChannelLayer",
+    }
+}
+
+TASK_REPLAY_LOG = "local"
+
+# Measure the endpoints, not the rate limits.
+REST_FRAMEWORK = {**REST_FRAMEWORK, "DEFAULT_THROTTLE_CLASSES": []}  # noqa: F405
+
+CELERY_BROKER_URL = "memory://"
+CELERY_RESULT_BACKEND = "cache+memory://"
+CELERY_TASK_ALWAYS_EAGER = True
+
+DEBUG = False
@@ -0,0 +1,300 @@
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.http import StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from psycopg2 import extensions
+from rest_framework.test import APIClient
+
+from accounts.models import Company, User
+from tasks.models import Task
+from tasks.views import TaskViewSet
+from . import batching, metrics, throttling
+from .postgres_pool import base as pool_base
+
+
+class StandInConnection:
+    """Enough of a psycopg2 connection for the pool: status, rollback, close."""
+
+    def __init__(self, rollback_fails=False):
+        self.closed = 0
+        self.info = mock.Mock(transaction_status=extensions.TRANSACTION_STATUS_IDLE)
+        self.rollback_fails = rollback_fails
+        self.select_fails = False
+        self.rollbacks = 0
+
+    def rollback(self):
+        self.rollbacks += 1
+        if self.rollback_fails:
+            raise pool_base.base.Database.OperationalError('server closed the connection')
+        self.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def cursor(self):
+        cursor = mock.MagicMock()
+        if self.select_fails:
+            cursor.__enter__.return_value.execute.side_effect = pool_base.base.Database.OperationalError()
+        return cursor
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def setUp(self):
+        self.pool = pool_base.ConnectionPool(size=2, timeout=0.01, max_lifetime=60.0, check_after=30.0)
+        self.opened = []
+        self.now = 1000.0
+        patcher = mock.patch.object(pool_base.time, 'monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def connect(self, **kwargs):
+        self.opened.append(StandInConnection(**kwargs))
+        return self.opened[-1]
+
+    def test_returned_connections_are_reused(self):
+        first = self.pool.acquire(self.connect)
+        self.pool.release(first)
+
+        self.assertIs(self.pool.acquire(self.connect), first)
+        self.assertEqual(len(self.opened), 1)
+        self.assertFalse(first.closed)
+
+    def test_open_transactions_are_rolled_back_before_reuse(self):
+        first = self.pool.acquire(self.connect)
+        first.info.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+        self.pool.release(first)
+
+        self.assertEqual(first.rollbacks, 1)
+        self.assertIs(self.pool.acquire(self.connect), first)
+
+    def test_broken_connections_are_closed_not_reused(self):
+        closed = self.pool.acquire(self.connect)
+        failed = self.pool.acquire(lambda: self.connect(rollback_fails=True))
+        closed.closed = 1
+        failed.info.transaction_status = extensions.TRANSACTION_STATUS_INERROR
+        self.pool.release(closed)
+        self.pool.release(failed)
+
+        self.assertEqual(failed.rollbacks, 1)
+        self.assertTrue(failed.closed)
+        lost = self.pool.acquire(self.connect)
+        lost.info.transaction_status = extensions.TRANSACTION_STATUS_UNKNOWN
+        self.pool.release(lost)
+        self.assertTrue(lost.closed)
+        self.assertNotIn(self.pool.acquire(self.connect), (closed, failed, lost))
+
+    def test_idle_connections_are_checked_then_replaced_when_dropped(self):
+        first = self.pool.acquire(self.connect)
+        self.pool.release(first)
+        first.select_fails = True
+
+        self.now += 10
+        self.assertIs(self.pool.acquire(self.connect), first)
+        self.pool.release(first)
+        self.now += 31
+        replacement = self.pool.acquire(self.connect)
+        self.assertIsNot(replacement, first)
+        self.assertTrue(first.closed)
+
+    def test_old_connections_are_replaced(self):
+        first = self.pool.acquire(self.connect)
+        self.pool.release(first)
+
+        self.now += 61
+        self.assertIsNot(self.pool.acquire(self.connect), first)
+        self.assertTrue(first.closed)
+
+    def test_at_most_size_connections_are_handed_out(self):
+        first = self.pool.acquire(self.connect)
+        self.pool.acquire(self.connect)
+        with self.assertRaises(pool_base.PoolTimeout):
+            self.pool.acquire(self.connect)
+
+        self.pool.release(first)
+        self.assertIs(self.pool.acquire(self.connect), first)
+        self.assertEqual(len(self.opened), 2)
+
+    def test_failed_connects_give_their_slot_back(self):
+        def refuse():
+            raise pool_base.base.Database.OperationalError('connection refused')
+
+        for _ in range(3):
+            with self.assertRaises(pool_base.base.Database.OperationalError):
+                self.pool.acquire(refuse)
+        self.pool.acquire(self.connect)
+        self.pool.acquire(self.connect)
+
+
+class PooledDatabaseWrapperTests(SimpleTestCase):
+
+    def setUp(self):
+        settings_dict = {
+            **connection.settings_dict, 'ENGINE': 'task_manager.postgres_pool',
+            'OPTIONS': {}, 'POOL': {'SIZE': 1, 'TIMEOUT': 0.01},
+        }
+        self.wrapper = pool_base.DatabaseWrapper(settings_dict, 'pool-test')
+        self.addCleanup(pool_base._pools.pop, 'pool-test', None)
+        patcher = mock.patch.object(
+            pool_base.base.DatabaseWrapper, 'get_new_connection', side_effect=lambda params: StandInConnection(),
+        )
+        self.connect = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_closing_returns_the_connection_to_the_pool(self):
+        self.wrapper.connection = first = self.wrapper.get_new_connection({})
+        self.wrapper._close()
+
+        self.assertIs(self.wrapper.get_new_connection({}), first)
+        self.assertEqual(self.connect.call_count, 1)
+        self.assertEqual(self.wrapper.isolation_level, pool_base.base.IsolationLevel.READ_COMMITTED)
+
+    def test_connections_closed_inside_atomic_blocks_are_not_shared(self):
+        self.wrapper.connection = first = self.wrapper.get_new_connection({})
+        self.wrapper.in_atomic_block = True
+        self.wrapper._close()
+
+        self.assertTrue(first.closed)
+        self.assertIsNot(self.wrapper.get_new_connection({}), first)
+
+
+class MetricsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Acme')
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pw', company=cls.company)
+        Task.objects.create(title='task', company=cls.company, created_by=cls.alice, assigned_to=cls.alice)
+
+    def setUp(self):
+        patcher = mock.patch.object(metrics, 'registry', metrics.Registry())
+        self.registry = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def recorded(self, histogram, route):
+        """``(count, sum)`` of ``histogram`` for the one series of ``route``."""
+        (counts, total), = [series for labels, series in histogram.series.items() if labels[1] == route]
+        return sum(counts), total
+
+    def test_requests_are_counted_by_route_company_and_status(self):
+        with metrics.observe() as observed:
+            self.client.get('/api/tasks/')
+        self.client.get('/api/tasks/0/')
+
+        self.assertEqual(self.registry.requests.series, {
+            ('http', 'task-list', self.company.pk, '200'): 1,
+            ('http', 'task-detail', self.company.pk, '404'): 1,
+        })
+        self.assertEqual(self.recorded(self.registry.db_queries, 'task-list'), (1, observed.queries))
+
+    def test_streamed_responses_are_measured_until_their_last_chunk(self):
+        response = self.client.get('/api/tasks/export/')
+        self.assertEqual(self.registry.requests.series, {})
+
+        content = b''.join(response.streaming_content)
+        self.assertIn(b'task', content)
+        self.assertEqual(self.recorded(self.registry.response_size, 'task-export'), (1, len(content)))
+        # The rows are read while streaming, after the view has returned.
+        count, queries = self.recorded(self.registry.db_queries, 'task-export')
+        self.assertEqual(count, 1)
+        self.assertGreaterEqual(queries, 1)
+
+    def test_async_streams_are_measured_until_their_last_chunk(self):
+        async def view(request):
+            async def content():
+                yield b'%d tasks' % await Task.objects.acount()
+                yield b', done'
+            return StreamingHttpResponse(content())
+
+        async def stream():
+            response = await metrics.MetricsMiddleware(view)(RequestFactory().get('/'))
+            self.assertEqual(self.registry.requests.series, {})
+            return b''.join([chunk async for chunk in response.streaming_content])
+
+        self.assertEqual(async_to_sync(stream)(), b'1 tasks, done')
+        self.assertEqual(self.registry.requests.series, {('http', 'unmatched', '', '200'): 1})
+        self.assertEqual(self.recorded(self.registry.db_queries, 'unmatched'), (1, 1))
+        self.assertEqual(self.recorded(self.registry.response_size, 'unmatched'), (1, len(b'1 tasks, done')))
+
+
+class TenantRateThrottleTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        company = Company.objects.create(name='Acme')
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pw', company=company)
+        cls.bob = User.objects.create_user('bob', 'bob@example.com', 'pw', company=company)
+        cls.mallory = User.objects.create_user(
+            'mallory', 'mallory@example.com', 'pw', company=Company.objects.create(name='Other')
+        )
+
+    def setUp(self):
+        # The test settings disable throttling; enable it with slow-refilling buckets.
+        for patcher in (
+            mock.patch.object(TaskViewSet, 'throttle_classes', [throttling.TenantRateThrottle]),
+            mock.patch.object(throttling, 'limiter', throttling.Limiter(None, throttling.LocalBuckets())),
+            mock.patch.object(throttling, 'USER_LIMIT', (0.5, 3.0)),
+            mock.patch.object(throttling, 'COMPANY_LIMIT', (0.5, 5.0)),
+            mock.patch.object(throttling, 'THROTTLE_COSTS', {'task-statistics': 2}),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get(self, user, url='/api/tasks/'):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.get(url)
+
+    def test_drained_buckets_answer_429_with_retry_after(self):
+        for _ in range(3):
+            self.assertEqual(self.get(self.alice).status_code, 200)
+
+        response = self.get(self.alice)
+        self.assertEqual(response.status_code, 429)
+        # One token at 0.5 per second.
+        self.assertEqual(response['Retry-After'], '2')
+
+    def test_costs_are_looked_up_by_url_name(self):
+        self.assertEqual(self.get(self.alice, '/api/tasks/statistics/').status_code, 200)
+        self.assertEqual(self.get(self.alice, '/api/tasks/statistics/').status_code, 429)
+        # The rejected request took nothing.
+        self.assertEqual(self.get(self.alice).status_code, 200)
+        self.assertEqual(self.get(self.alice).status_code, 429)
+
+    def test_company_buckets_are_shared_by_its_users_only(self):
+        for user in (self.alice, self.alice, self.alice, self.bob, self.bob):
+            self.assertEqual(self.get(user).status_code, 200)
+
+        self.assertEqual(self.get(self.bob).status_code, 429)
+        self.assertEqual(self.get(self.mallory).status_code, 200)
+
+    def test_an_unreachable_store_falls_back_to_local_buckets(self):
+        shared = mock.Mock()
+        shared.take.side_effect = ConnectionError('redis is down')
+        limiter = throttling.Limiter(shared, throttling.LocalBuckets())
+
+        with mock.patch.object(throttling, 'limiter', limiter), self.assertLogs('task_manager.throttling', 'WARNING'):
+            for _ in range(3):
+                self.assertEqual(self.get(self.alice).status_code, 200)
+            self.assertEqual(self.get(self.alice).status_code, 429)
+        self.assertEqual(shared.take.call_count, 1)
+
+
+class CoalescingBufferTests(SimpleTestCase):
+
+    def test_pending_items_are_flushed_at_exit(self):
+        flush = mock.Mock()
+        with mock.patch.object(batching.atexit, 'register') as register:
+            buffer = batching.CoalescingBuffer(flush, window=60, name='test-buffer')
+        register.assert_called_once_with(buffer.drain)
+
+        buffer.add('a', 1)
+        buffer.add('a', 2, merge=lambda previous, current: previous + current)
+        buffer.add('b', 5)
+        flush.assert_not_called()
+        buffer.drain()
+        flush.assert_called_once_with({'a': 3, 'b': 5})
@@ -0,0 +1,173 @@
+"""
+Per-tenant rate limiting with token buckets.
+
+Every authenticated API request takes tokens from two buckets: its
+company's (``THROTTLE_COMPANY_RATE`` tokens per second, holding up to
+``THROTTLE_COMPANY_BURST``) and its user's (``THROTTLE_USER_*``), so one
+runaway script can neither starve its colleagues nor other tenants. A
+request costs ``THROTTLE_COSTS[url_name]`` tokens, 1 by default, which lets
+expensive routes (export, search, statistics) count for more. When either
+bucket is short the request is rejected with a 429 whose ``Retry-After``
+says when both will hold enough again; rejected requests take nothing.
+
+``THROTTLE_BACKEND = 'redis'`` (the default) keeps the buckets in Redis and
+refills and takes from both in one Lua script, so all processes share them
+and concurrent requests cannot overdraw. If Redis is unreachable, each
+process falls back to buckets of its own for ``THROTTLE_REDIS_RETRY``
+seconds: limits then hold per process instead of per deployment, which is
+looser but keeps requests flowing. ``'local'`` always uses process buckets
+(single process only).
+"""
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+COMPANY_LIMIT = (
+    getattr(settings, 'THROTTLE_COMPANY_RATE', 100.0), getattr(settings, 'THROTTLE_COMPANY_BURST', 300.0)
+)
+USER_LIMIT = (getattr(settings, 'THROTTLE_USER_RATE', 20.0), getattr(settings, 'THROTTLE_USER_BURST', 60.0))
+THROTTLE_COSTS = getattr(settings, 'THROTTLE_COSTS', {})
+THROTTLE_REDIS_RETRY = getattr(settings, 'THROTTLE_REDIS_RETRY', 5.0)
+
+
+class RedisBuckets:
+    """
+    Token buckets in Redis hashes (``tokens``, ``ts``), refilled lazily.
+
+    ``take`` returns 0 after taking ``cost`` from every bucket, or the
+    seconds until all of them will hold it. Clocks come from Redis, so the
+    web servers' clocks don't matter. A bucket left alone long enough to
+    fill up expires.
+    """
+    TAKE = """
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+    local cost = tonumber(ARGV[1])
+    local wait = 0
+    local levels = {}
+    for i, key in ipairs(KEYS) do
+        local rate = tonumber(ARGV[2 * i])
+        local burst = tonumber(ARGV[2 * i + 1])
+        local state = redis.call('HMGET', key, 'tokens', 'ts')
+        local tokens = tonumber(state[1]) or burst
+        local elapsed = math.max(0, now - (tonumber(state[2]) or now))
+        tokens = math.min(burst, tokens + elapsed * rate)
+        levels[i] = tokens
+        local need = math.min(cost, burst)
+        if tokens < need then
+            wait = math.max(wait, (need - tokens) / rate)
+        end
+    end
+    if wait > 0 then
+        return tostring(wait)
+    end
+    for i, key in ipairs(KEYS) do
+        local rate = tonumber(ARGV[2 * i])
+        local burst = tonumber(ARGV[2 * i + 1])
+        redis.call('HSET', key, 'tokens', tostring(levels[i] - math.min(cost, burst)), 'ts', tostring(now))
+        redis.call('EXPIRE', key, math.ceil(burst / rate) + 1)
+    end
+    return '0'
+    """
+
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self.take_script = self.client.register_script(self.TAKE)
+
+    def take(self, buckets, cost):
+        args = [cost]
+        for _, rate, burst in buckets:
+            args += [rate, burst]
+        return float(self.take_script(keys=[key for key, _, _ in buckets], args=args))
+
+
+class LocalBuckets:
+    """In-process equivalent of RedisBuckets, keeping the ``maxsize`` most recently used buckets."""
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        # key -> [tokens, monotonic time of the last refill]
+        self._buckets = OrderedDict()
+
+    def take(self, buckets, cost):
+        now = time.monotonic()
+        with self._lock:
+            levels, wait = [], 0.0
+            for key, rate, burst in buckets:
+                state = self._buckets.get(key) or [burst, now]
+                tokens = min(burst, state[0] + (now - state[1]) * rate)
+                levels.append(tokens)
+                need = min(cost, burst)
+                if tokens < need:
+                    wait = max(wait, (need - tokens) / rate)
+            if wait > 0:
+                return wait
+            for (key, rate, burst), tokens in zip(buckets, levels):
+                self._buckets[key] = [tokens - min(cost, burst), now]
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+            return 0.0
+
+
+class Limiter:
+    """Takes from the shared buckets, or from local ones while the shared store is down."""
+
+    def __init__(self, shared, local):
+        self.shared = shared
+        self.local = local
+        self.down_until = 0.0
+
+    def take(self, buckets, cost):
+        if self.shared is not None and time.monotonic() >= self.down_until:
+            try:
+                return self.shared.take(buckets, cost)
+            except Exception:
+                logger.warning(
+                    'Throttle store unavailable; using per-process buckets for %ss', THROTTLE_REDIS_RETRY,
+                    exc_info=True,
+                )
+                self.down_until = time.monotonic() + THROTTLE_REDIS_RETRY
+        return self.local.take(buckets, cost)
+
+
+def build_limiter():
+    if getattr(settings, 'THROTTLE_BACKEND', 'redis') == 'local':
+        return Limiter(None, LocalBuckets())
+    return Limiter(RedisBuckets(settings.REDIS_URL), LocalBuckets())
+
+
+def endpoint_cost(request):
+    match = request.resolver_match
+    return THROTTLE_COSTS.get(match.url_name if match else None, 1)
+
+
+class TenantRateThrottle(BaseThrottle):
+    """Token buckets per company and per user; anonymous requests are not limited here."""
+
+    def allow_request(self, request, view):
+        user = request.user
+        if not user or not user.is_authenticated:
+            return True
+        buckets = [(f'throttle:user:{user.pk}', *USER_LIMIT)]
+        if user.company_id is not None:
+            buckets.append((f'throttle:company:{user.company_id}', *COMPANY_LIMIT))
+        self.delay = limiter.take(buckets, endpoint_cost(request))
+        return self.delay <= 0
+
+    def wait(self):
+        # Retry-After is whole seconds; never tell clients to retry at once.
+        return max(1, math.ceil(self.delay))
+
+
+limiter = build_limiter()
@@ -0,0 +1,237 @@
+"""
+Per-company task analytics computed in one grouped pass.
+
+Each shard of companies is read with a single aggregate over the task
+table grouped by (company, assignee, status), so a company's tasks are
+scanned once. Daily creation counts for the trailing window come from the
+daily TaskRollup rows, plus a grouped count of the creations the rollups
+have not folded in yet (newer than their watermark, or all of them when
+Celery beat never ran) and of the part of the day ``since`` starts in.
+Users and company names come from one query each per shard. Shards are independent, so ``collect()`` can run
+them in a process pool and merge the results.
+"""
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, time, timedelta
+
+from django.db import connections
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDay
+from django.utils import timezone
+
+from accounts.models import User, Company
+from task_manager import db_router
+from . import rollups
+from .models import RollupWatermark, Task, TaskRollup, TaskTransition
+
+COMPLETED_STATUSES = ('done',)
+PENDING_STATUSES = ('todo', 'in_progress')
+DAILY_DAYS = 7
+
+COMPANY_COLUMNS = [
+    'company_id', 'company_name', 'total_tasks',
+    *[f'{status}_tasks' for status, _ in Task.STATUS_CHOICES],
+    'completed_tasks', 'pending_tasks', 'completion_rate',
+    'total_users', 'active_users', 'avg_tasks_per_user',
+]
+USER_COLUMNS = [
+    'company_id', 'company_name', 'user_id', 'username',
+    'total_tasks', 'completed_tasks', 'pending_tasks',
+]
+
+
+def day_starts(today=None, days=DAILY_DAYS):
+    """Aware datetimes for the start of each of the last ``days`` local days, oldest first."""
+    today = today or timezone.localdate()
+    return [
+        timezone.make_aware(datetime.combine(today - timedelta(days=offset), time.min))
+        for offset in range(days - 1, -1, -1)
+    ]
+
+
+def shard_metrics(company_ids, since=None, today=None, using=None):
+    """Return the metrics dict of every company in ``company_ids``, read from database ``using``."""
+    starts = day_starts(today)
+
+    tasks = Task.objects.using(using).filter(company_id__in=company_ids)
+    if since:
+        tasks = tasks.filter(created_at__gte=since)
+    rows = (
+        tasks.order_by()
+        .values('company_id', 'assigned_to_id', 'status')
+        .annotate(count=Count('id'))
+    )
+
+    companies = {
+        company_id: new_company(company_id, name, starts)
+        for company_id, name in Company.objects.using(using).filter(pk__in=company_ids).values_list('id', 'name')
+    }
+    usernames = {}
+    for user_id, username, company_id in User.objects.using(using).filter(
+        company_id__in=company_ids
+    ).values_list('id', 'username', 'company_id'):
+        usernames[user_id] = username
+        companies[company_id]['total_users'] += 1
+
+    per_user = {}
+    for row in rows:
+        company = companies[row['company_id']]
+        count = row['count']
+        company['total_tasks'] += count
+        company['by_status'][row['status']] += count
+
+        key = (row['company_id'], row['assigned_to_id'])
+        user = per_user.get(key)
+        if user is None:
+            user = per_user[key] = {
+                'id': row['assigned_to_id'],
+                # Assignees are company members, but stay robust to moves.
+                'username': usernames.get(row['assigned_to_id']) or str(row['assigned_to_id']),
+                'total_tasks': 0,
+                'completed_tasks': 0,
+                'pending_tasks': 0,
+            }
+            company['users'].append(user)
+        user['total_tasks'] += count
+        if row['status'] in COMPLETED_STATUSES:
+            user['completed_tasks'] += count
+        elif row['status'] in PENDING_STATUSES:
+            user['pending_tasks'] += count
+
+    for company_id, period_start, count in daily_created(company_ids, starts, since, using):
+        day = timezone.localtime(period_start).date().isoformat()
+        companies[company_id]['daily_created'][day] += count
+
+    return [finish_company(company) for company in companies.values()]
+
+
+def daily_created(company_ids, starts, since=None, using=None):
+    """``(company_id, day_start, created)`` rows for the days in ``starts``, from ``since`` on."""
+    window_start = max(starts[0], since) if since else starts[0]
+    full_days = [start for start in starts if start >= window_start]
+    position = RollupWatermark.objects.using(using).filter(
+        name=rollups.WATERMARK
+    ).values_list('position', flat=True).first() or 0
+
+    rolled_up = TaskRollup.objects.using(using).filter(
+        company_id__in=company_ids, granularity='day', period_start__in=full_days
+    ).values_list('company_id', 'period_start', 'created')
+    # Creations the rollups don't hold: past their watermark, or in a day
+    # that only partly falls after ``since``.
+    missing = Q(id__gt=position) | Q(at__lt=full_days[0]) if full_days else Q()
+    live = (
+        TaskTransition.objects.using(using).order_by()
+        .filter(missing, company_id__in=company_ids, from_status='', at__gte=window_start)
+        .annotate(day=TruncDay('at'))
+        .values_list('company_id', 'day')
+        .annotate(created=Count('id'))
+    )
+    return [*rolled_up, *live]
+
+
+def new_company(company_id, name, starts):
+    return {
+        'company_id': company_id,
+        'company_name': name,
+        'total_tasks': 0,
+        'by_status': Counter({status: 0 for status, _ in Task.STATUS_CHOICES}),
+        'total_users': 0,
+        'daily_created': {start.date().isoformat(): 0 for start in starts},
+        'users': [],
+    }
+
+
+def finish_company(company):
+    by_status = company['by_status']
+    total = company['total_tasks']
+    company['by_status'] = dict(by_status)
+    company['completed_tasks'] = sum(by_status[status] for status in COMPLETED_STATUSES)
+    company['pending_tasks'] = sum(by_status[status] for status in PENDING_STATUSES)
+    company['completion_rate'] = round(company['completed_tasks'] / total * 100, 1) if total else 0.0
+    company['active_users'] = len(company['users'])
+    company['avg_tasks_per_user'] = (
+        round(total / company['total_users'], 2) if company['total_users'] else 0.0
+    )
+    company['users'].sort(key=lambda user: (-user['total_tasks'], user['username']))
+    return company
+
+
+def make_shards(company_ids, count):
+    """Split company ids into at most ``count`` interleaved shards."""
+    count = max(1, min(count, len(company_ids)))
+    return [company_ids[i::count] for i in range(count)]
+
+
+def collect(company_ids=None, since=None, workers=1, shards=None):
+    """
+    Compute the metrics of the given companies (default: all), largest first.
+
+    With ``workers > 1`` the shards (default: four per worker, so a large
+    tenant does not leave the other processes idle) are processed by a
+    pool of worker processes, each with its own database connection.
+    Workers read from the same database as the caller (a replica inside
+    ``db_router.replica_reads()``).
+    """
+    if company_ids is None:
+        company_ids = list(Company.objects.order_by('pk').values_list('pk', flat=True))
+    else:
+        company_ids = sorted(company_ids)
+    today = timezone.localdate()
+    using = db_router.read_alias()
+
+    if workers <= 1:
+        results = [shard_metrics(company_ids, since, today, using)] if company_ids else []
+    else:
+        parts = make_shards(company_ids, shards or workers * 4)
+        # Forked workers must not share the parent's open connections.
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+            results = list(pool.map(
+                shard_metrics, parts, [since] * len(parts), [today] * len(parts), [using] * len(parts)
+            ))
+
+    companies = [company for result in results for company in result]
+    companies.sort(key=lambda company: (-company['total_tasks'], company['company_id']))
+    return companies
+
+
+def init_worker():
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+    connections.close_all()
+
+
+def summarize(companies):
+    by_status = Counter()
+    for company in companies:
+        by_status.update(company['by_status'])
+    return {
+        'total_tasks': sum(by_status.values()),
+        'by_status': dict(by_status),
+        'companies': len(companies),
+    }
+
+
+def company_rows(companies):
+    for company in companies:
+        row = {column: company.get(column) for column in COMPANY_COLUMNS}
+        for status, count in company['by_status'].items():
+            row[f'{status}_tasks'] = count
+        yield row
+
+
+def user_rows(companies):
+    for company in companies:
+        for user in company['users']:
+            yield {
+                'company_id': company['company_id'],
+                'company_name': company['company_name'],
+                'user_id': user['id'],
+                'username': user['username'],
+                'total_tasks': user['total_tasks'],
+                'completed_tasks': user['completed_tasks'],
+                'pending_tasks': user['pending_tasks'],
+            }
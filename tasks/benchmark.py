@@ -0,0 +1,287 @@
+"""
+Load generators behind the ``benchmark_api`` command.
+
+Requests go through the full Django stack in-process: REST scenarios
+through the test ``Client`` from a pool of threads (one database
+connection each, like a threaded WSGI server), the async external tasks
+endpoint through ``AsyncClient`` on one event loop, WebSockets through
+channels' ``WebsocketCommunicator`` on ``TaskConsumer``, and the Celery
+notification path by draining the outbox with the relay. Every request is
+authenticated with a real JWT.
+
+Database queries are counted per request by :func:`task_manager.metrics.observe`,
+so queries made in ``sync_to_async`` threads are attributed to the
+request that caused them.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+
+from task_manager import metrics
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(latencies, queries, errors, seconds, **extra):
+    ordered = sorted(latencies)
+    summary = {
+        **extra,
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': round(seconds, 3),
+        'throughput_per_second': round(len(latencies) / seconds, 1) if seconds else None,
+        'latency_ms': {
+            **{f'p{pct}': round(percentile(ordered, pct) * 1000, 2) for pct in PERCENTILES if ordered},
+            'max': round(ordered[-1] * 1000, 2) if ordered else None,
+        },
+    }
+    if queries is not None:
+        summary['queries_per_request'] = {
+            'mean': round(sum(queries) / len(queries), 2) if queries else None,
+            'max': max(queries, default=None),
+        }
+    return summary
+
+
+class Users:
+    """The seeded users with their access tokens, grouped by company."""
+
+    def __init__(self, users, rng):
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        self.rng = rng
+        self.users = users
+        self.tokens = {user.pk: f'Bearer {AccessToken.for_user(user)}' for user in users}
+        self.by_company = {}
+        for user in users:
+            self.by_company.setdefault(user.company_id, []).append(user)
+        self._lock = threading.Lock()
+
+    def pick(self):
+        with self._lock:
+            return self.rng.choice(self.users)
+
+    def colleague(self, user):
+        with self._lock:
+            return self.rng.choice(self.by_company[user.company_id])
+
+    def headers(self, user):
+        return {'Authorization': self.tokens[user.pk]}
+
+
+def run_http(send, requests, concurrency, warmup=0):
+    """
+    Call ``send(client)`` ``requests`` times from ``concurrency`` threads.
+
+    ``send`` returns a response; status codes of 400 and above count as
+    errors.
+    """
+    from django.test import Client
+
+    latencies, queries = [], []
+    errors = 0
+    lock = threading.Lock()
+
+    def worker(count, record):
+        nonlocal errors
+        client = Client()
+        try:
+            for _ in range(count):
+                started = time.perf_counter()
+                with metrics.observe() as observed:
+                    try:
+                        failed = send(client).status_code >= 400
+                    except Exception:
+                        failed = True
+                elapsed = time.perf_counter() - started
+                if record:
+                    with lock:
+                        latencies.append(elapsed)
+                        queries.append(observed.queries)
+                        errors += failed
+        finally:
+            connections.close_all()
+
+    if warmup:
+        worker(warmup, record=False)
+    shares = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker, share, True) for share in shares if share]:
+            future.result()
+    return summarize(latencies, queries, errors, time.perf_counter() - started, concurrency=concurrency)
+
+
+async def run_async_http(send, requests, concurrency, warmup=0):
+    """Like :func:`run_http` for ``AsyncClient``, with ``concurrency`` coroutines on one loop."""
+    from django.test import AsyncClient
+
+    latencies, queries = [], []
+    errors = 0
+
+    async def worker(count, record):
+        nonlocal errors
+        client = AsyncClient()
+        for _ in range(count):
+            started = time.perf_counter()
+            with metrics.observe() as observed:
+                try:
+                    failed = (await send(client)).status_code >= 400
+                except Exception:
+                    failed = True
+            if record:
+                latencies.append(time.perf_counter() - started)
+                queries.append(observed.queries)
+                errors += failed
+
+    if warmup:
+        await worker(warmup, record=False)
+    shares = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(share, True) for share in shares if share))
+    return summarize(latencies, queries, errors, time.perf_counter() - started, concurrency=concurrency)
+
+
+async def run_websockets(users, sockets, events, timeout=10.0, connect_concurrency=100):
+    """
+    Open ``sockets`` concurrent TaskConsumer connections spread over the
+    users, then make ``events`` task writes and time how long each
+    ``tasks_changed`` frame takes to reach every socket of the company.
+    """
+    from channels.testing import WebsocketCommunicator
+    from tasks import bulk
+    from tasks.broadcast import outbox
+    from tasks.consumers import TaskConsumer
+
+    application = TaskConsumer.as_asgi()
+    owners = [users.pick() for _ in range(sockets)]
+    communicators = []
+    connect_latencies = []
+    connect_errors = 0
+    gate = asyncio.Semaphore(connect_concurrency)
+
+    async def open_socket(user):
+        nonlocal connect_errors
+        token = users.tokens[user.pk].split(' ', 1)[1]
+        communicator = WebsocketCommunicator(application, f'/ws/tasks/?token={token}')
+        async with gate:
+            started = time.perf_counter()
+            connected, _ = await communicator.connect(timeout=timeout)
+            if connected:
+                await communicator.receive_json_from(timeout=timeout)  # connection_established
+                connect_latencies.append(time.perf_counter() - started)
+                communicators.append((user.company_id, communicator))
+            else:
+                connect_errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(open_socket(user) for user in owners))
+    connect_summary = summarize(connect_latencies, None, connect_errors, time.perf_counter() - started)
+
+    write = sync_to_async(lambda user: bulk.bulk_create_tasks(user, [{
+        'title': 'benchmark websocket task', 'assigned_to': users.colleague(user).pk,
+    }]))
+    delivery_latencies = []
+    missed = 0
+    # Broadcast on commit instead of after the coalescing window, so the
+    # measured latency is the server's, not the window's.
+    window, outbox.window = outbox.window, 0
+
+    async def receive(communicator, written_at):
+        nonlocal missed
+        try:
+            await communicator.receive_json_from(timeout=timeout)
+            delivery_latencies.append(time.perf_counter() - written_at)
+        except asyncio.TimeoutError:
+            missed += 1
+
+    started = time.perf_counter()
+    try:
+        for _ in range(events):
+            writer = users.rng.choice(owners)
+            receivers = [communicator for company_id, communicator in communicators
+                         if company_id == writer.company_id]
+            written_at = time.perf_counter()
+            await write(writer)
+            await asyncio.gather(*(receive(communicator, written_at) for communicator in receivers))
+    finally:
+        outbox.window = window
+    delivery_summary = summarize(delivery_latencies, None, missed, time.perf_counter() - started)
+    delivery_summary['frames'] = delivery_summary.pop('requests')
+    delivery_summary['missed'] = delivery_summary.pop('errors')
+    delivery_summary['frames_per_second'] = delivery_summary.pop('throughput_per_second')
+
+    await asyncio.gather(*(communicator.disconnect() for _, communicator in communicators))
+    return {
+        'sockets': sockets,
+        'events': events,
+        'connect': connect_summary,
+        'delivery': delivery_summary,
+    }
+
+
+def run_relay(task_ids, batch_size):
+    """
+    Queue a notification for each of ``task_ids`` in the outbox, then time
+    the relay draining it batch by batch.
+
+    Each batch publishes one ``send_task_notification_emails`` job. With
+    ``CELERY_TASK_ALWAYS_EAGER`` the job itself (loading the tasks and
+    writing the EmailNotification rows) runs inside the measured batch;
+    otherwise only the publish to the broker does.
+    """
+    from notifications.dispatch import relay_batch
+    from notifications.models import NotificationOutbox
+
+    NotificationOutbox.objects.bulk_create(
+        [NotificationOutbox(task_id=task_id) for task_id in task_ids], batch_size=1000
+    )
+    latencies, queries = [], []
+    published = 0
+    started = time.perf_counter()
+    while True:
+        batch_started = time.perf_counter()
+        with metrics.observe() as observed:
+            count = relay_batch(batch_size)
+        if not count:
+            break
+        latencies.append(time.perf_counter() - batch_started)
+        queries.append(observed.queries)
+        published += count
+    seconds = time.perf_counter() - started
+    summary = summarize(latencies, queries, 0, seconds, batch_size=batch_size)
+    summary['batches'] = summary.pop('requests')
+    summary['queries_per_batch'] = summary.pop('queries_per_request')
+    summary['notifications'] = published
+    summary['notifications_per_second'] = round(published / seconds, 1) if seconds else None
+    del summary['throughput_per_second']
+    return summary
+
+
+def mocked_fetcher(latency, ttl):
+    """An ExternalTaskFetcher whose upstream is an in-process mock answering after ``latency`` seconds."""
+    import httpx
+    from tasks.external import ExternalTaskFetcher
+
+    async def upstream(request):
+        await asyncio.sleep(latency)
+        limit = int(request.url.params.get('_limit', 5))
+        return httpx.Response(200, json=[
+            {'id': i, 'title': f'external task {i}', 'completed': i % 2 == 0} for i in range(1, limit + 1)
+        ])
+
+    return ExternalTaskFetcher(
+        'http://upstream.invalid/todos', ttl=ttl, stale_ttl=ttl, transport=httpx.MockTransport(upstream),
+    )
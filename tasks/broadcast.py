@@ -0,0 +1,127 @@
+"""
+Batched WebSocket broadcasting of task changes.
+
+Views queue ``(company, task, action)`` changes; nothing is sent until the
+surrounding transaction commits. Changes are then coalesced per task for
+``TASK_BROADCAST_WINDOW`` seconds and sent off the request path as one
+``tasks_changed`` event per company group, with all changed tasks loaded
+and serialized in a single query. Each event is numbered and logged per
+company first (see :mod:`tasks.replay`) so reconnecting clients can catch up.
+The changes of each assignee also go to a ``user_<id>`` group, for sockets
+subscribed to their own tasks only (see :mod:`tasks.subscriptions`).
+"""
+from collections import defaultdict
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+from task_manager.batching import CoalescingBuffer
+from . import replay, subscriptions
+from .models import Task
+from .serializers import TaskSerializer, attach_company
+
+
+def queue_task_change(task, action):
+    """Broadcast ``action`` ('created', 'updated' or 'deleted') for ``task`` once committed."""
+    queue_task_changes([task], action)
+
+
+def queue_task_changes(tasks, action):
+    changes = {(task.company_id, task.pk): describe(task, action) for task in tasks}
+    if changes:
+        transaction.on_commit(lambda: outbox.add_many(changes, merge=merge_changes))
+
+
+def describe(task, action):
+    """
+    What a broadcast needs to know about one change besides the task itself.
+
+    ``fields`` lists the changed fields of an update (None when unknown
+    or not an update) for compact payloads; ``previous`` holds the stored status and
+    assignee so subscribers filtering on them learn that a task left.
+    """
+    loaded = getattr(task, '_loaded_values', None)
+    return {
+        'action': action,
+        'fields': task.changed_fields() if action == 'updated' else None,
+        'previous': None if loaded is None else {
+            'status': loaded.get('status'), 'assigned_to': loaded.get('assigned_to_id'),
+        },
+    }
+
+
+def merge_changes(previous, current):
+    # A task created and then updated within one window is still news,
+    # and a deletion supersedes anything before it.
+    if current['action'] != 'deleted' and 'created' in (previous['action'], current['action']):
+        action = 'created'
+    else:
+        action = current['action']
+    fields = None
+    if action != 'created' and previous['fields'] is not None and current['fields'] is not None:
+        fields = sorted(set(previous['fields']) | set(current['fields']))
+    return {'action': action, 'fields': fields, 'previous': previous['previous'] or current['previous']}
+
+
+def send_changes(changes):
+    """
+    Send ``{(company_id, task_id): change}`` as one event per company group,
+    and the changes touching each (current or previous) assignee to that
+    user's group.
+    """
+    by_company = defaultdict(list)
+    live_ids = []
+    for (company_id, task_id), change in changes.items():
+        if change['action'] == 'deleted':
+            by_company[company_id].append({**change, 'task': {'id': task_id}})
+        else:
+            live_ids.append(task_id)
+
+    tasks = Task.objects.filter(pk__in=live_ids).select_related(
+        'company', 'assigned_to', 'created_by'
+    )
+    context = {'company_cache': {}}
+    for task in tasks:
+        attach_company(task, task.company)
+        by_company[task.company_id].append({
+            **changes[(task.company_id, task.pk)],
+            'task': TaskSerializer(task, context=context).data,
+        })
+
+    if by_company:
+        events = {}
+        for company_id, items in by_company.items():
+            seq = replay.append(company_id, items)
+            events[f"company_{company_id}"] = {"seq": seq, "changes": items}
+            for user_id, user_items in by_assignee(items).items():
+                events[f"user_{user_id}"] = {"seq": seq, "changes": user_items}
+        async_to_sync(group_send_all)(events)
+
+
+def by_assignee(items):
+    users = defaultdict(list)
+    for item in items:
+        for user_id in subscriptions.assignees(item):
+            users[user_id].append(item)
+    return users
+
+
+async def group_send_all(events):
+    channel_layer = get_channel_layer()
+    for group, event in events.items():
+        await channel_layer.group_send(
+            group,
+            {
+                "type": "tasks_changed",
+                **event,
+            }
+        )
+
+
+outbox = CoalescingBuffer(
+    send_changes,
+    window=getattr(settings, 'TASK_BROADCAST_WINDOW', 0.25),
+    name='task-broadcast',
+)
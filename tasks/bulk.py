@@ -0,0 +1,156 @@
+"""
+Set-based bulk writes for TaskViewSet.
+
+Each operation validates the whole batch up front (tenant membership of
+every ``assigned_to`` in a single query), writes with ``bulk_create`` /
+``bulk_update`` / one ``DELETE``, updates the statistics counters once per
+bucket, logs status transitions with one insert, bumps the company's
+version token once, queues the notifications with one outbox insert
+and queues one broadcast.
+Invalid items are reported by position and skipped; valid ones are still
+written.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from accounts.models import User
+from notifications.dispatch import queue_task_notifications
+from . import counters, transitions, versions
+from .broadcast import queue_task_changes
+from .models import Task
+from .serializers import TaskBulkItemSerializer
+
+MAX_BULK_ITEMS = 1000
+
+WRONG_COMPANY = 'Cannot assign task to user from different company'
+UPDATABLE_FIELDS = ['title', 'description', 'status', 'assigned_to']
+
+
+def check_batch(items):
+    if not isinstance(items, list):
+        raise serializers.ValidationError('Expected a list of items.')
+    if len(items) > MAX_BULK_ITEMS:
+        raise serializers.ValidationError(f'At most {MAX_BULK_ITEMS} items per request.')
+
+
+def company_members(company, user_ids):
+    """``{id: user}`` for the ``user_ids`` that belong to ``company``, in one query."""
+    if not user_ids:
+        return {}
+    return User.objects.filter(company=company).in_bulk(user_ids)
+
+
+def validate_items(items, partial=False):
+    valid, errors = [], []
+    for index, item in enumerate(items):
+        serializer = TaskBulkItemSerializer(data=item, partial=partial)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            errors.append({'index': index, 'errors': serializer.errors})
+    return valid, errors
+
+
+def bulk_create_tasks(user, items):
+    check_batch(items)
+    valid, errors = validate_items(items)
+    members = company_members(user.company, {data['assigned_to'] for _, data in valid})
+
+    tasks = []
+    for index, data in valid:
+        if data['assigned_to'] not in members:
+            errors.append({'index': index, 'errors': {'assigned_to': [WRONG_COMPANY]}})
+            continue
+        data.pop('id', None)
+        tasks.append(Task(
+            assigned_to=members[data.pop('assigned_to')],
+            created_by=user,
+            company=user.company,
+            **data
+        ))
+
+    with transaction.atomic():
+        Task.objects.bulk_create(tasks)
+        counters.record(Counter(counters.bucket(task) for task in tasks))
+        transitions.record([transitions.created(task) for task in tasks])
+        if tasks:
+            versions.touch(user.company_id)
+        queue_task_notifications(tasks)
+        queue_task_changes(tasks, 'created')
+    return tasks, sorted(errors, key=lambda error: error['index'])
+
+
+def bulk_update_tasks(user, items):
+    check_batch(items)
+    valid, errors = validate_items(items, partial=True)
+
+    with transaction.atomic():
+        ids = [data['id'] for _, data in valid if 'id' in data]
+        existing = Task.objects.select_for_update(of=('self',)).select_related(
+            'assigned_to', 'created_by'
+        ).filter(company=user.company, pk__in=ids).in_bulk()
+        members = company_members(
+            user.company, {data['assigned_to'] for _, data in valid if 'assigned_to' in data}
+        )
+
+        changed, fields, deltas, moves = {}, set(), Counter(), []
+        now = timezone.now()
+        for index, data in valid:
+            task = existing.get(data.get('id'))
+            if 'id' not in data:
+                errors.append({'index': index, 'errors': {'id': ['This field is required.']}})
+                continue
+            if task is None:
+                errors.append({'index': index, 'errors': {'id': ['Not found.']}})
+                continue
+            if task.pk in changed:
+                errors.append({'index': index, 'errors': {'id': ['Duplicate id in batch.']}})
+                continue
+            if 'assigned_to' in data and data['assigned_to'] not in members:
+                errors.append({'index': index, 'errors': {'assigned_to': [WRONG_COMPANY]}})
+                continue
+
+            deltas[counters.bucket(task)] -= 1
+            from_status = task.status
+            for name in UPDATABLE_FIELDS:
+                if name in data:
+                    value = members[data[name]] if name == 'assigned_to' else data[name]
+                    setattr(task, name, value)
+                    fields.add(name)
+            task.updated_at = now
+            deltas[counters.bucket(task)] += 1
+            if task.status != from_status:
+                moves.append(transitions.transition(task, from_status, now))
+            changed[task.pk] = task
+
+        tasks = list(changed.values())
+        if tasks:
+            Task.objects.bulk_update(tasks, sorted(fields) + ['updated_at'])
+        counters.record(deltas)
+        transitions.record(moves)
+        if tasks:
+            versions.touch(user.company_id)
+        queue_task_changes(tasks, 'updated')
+    return tasks, sorted(errors, key=lambda error: error['index'])
+
+
+def bulk_delete_tasks(user, ids):
+    check_batch(ids)
+    if not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+        raise serializers.ValidationError('Expected a list of task ids.')
+
+    with transaction.atomic(), counters.deferred(), versions.deferred():
+        tasks = list(Task.objects.filter(company=user.company, pk__in=ids).only(
+            'id', *counters.BUCKET_FIELDS
+        ))
+        Task.objects.filter(pk__in=[task.pk for task in tasks]).delete()
+        queue_task_changes(tasks, 'deleted')
+
+    deleted = {task.pk for task in tasks}
+    errors = [
+        {'id': pk, 'errors': {'detail': ['Not found.']}} for pk in dict.fromkeys(ids) if pk not in deleted
+    ]
+    return sorted(deleted), errors
@@ -0,0 +1,76 @@
+"""
+Conditional GET (``ETag`` / ``Last-Modified``) for the TaskViewSet reads.
+
+Validators come from the per-company version tokens in
+:mod:`tasks.versions` (and a task's own ``updated_at`` for detail
+reads), mixed with the request URL, the negotiated media type and the
+user. Checking them needs no task query, so an unchanged poll is answered
+with a 304 before the queryset is evaluated or the serializer runs.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .models import Task
+from . import versions
+
+
+def make_etag(request, *parts):
+    digest = hashlib.md5(usedforsecurity=False)
+    for part in (
+        request.build_absolute_uri(),
+        getattr(request, 'accepted_media_type', ''),
+        request.user.pk,
+        *parts,
+    ):
+        digest.update(str(part).encode())
+        digest.update(b'\0')
+    return f'"{digest.hexdigest()}"'
+
+
+def collection_validators(request, tokens):
+    """``(etag, last_modified)`` for a read over the whole company, or None without ``tokens``."""
+    if tokens is None:
+        return None
+    etag = make_etag(request, *(token for token, _ in tokens.values()))
+    return etag, int(max(modified for _, modified in tokens.values()))
+
+
+def task_validators(request, pk):
+    """Validators for one task of the company, or None (e.g. it does not exist)."""
+    tokens = versions.current(request.user.company_id, ('members',))
+    if tokens is None:
+        return None
+    try:
+        updated_at = Task.objects.filter(
+            company_id=request.user.company_id, pk=pk
+        ).values_list('updated_at', flat=True).first()
+    except (TypeError, ValueError):
+        return None
+    if updated_at is None:
+        return None
+    token, members_modified = tokens['members']
+    etag = make_etag(request, updated_at.isoformat(), token)
+    return etag, int(max(updated_at.timestamp(), members_modified))
+
+
+def conditional_response(request, validators, respond):
+    """
+    Answer 304 when the client's copy matches ``validators``, else ``respond()``.
+
+    ``If-None-Match`` takes precedence over ``If-Modified-Since``, whose
+    one-second resolution can miss a second write within the same second.
+    """
+    if validators is None:
+        return respond()
+    etag, last_modified = validators
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = respond()
+    # A stale body served during a recomputation (see tasks.response_cache)
+    # is older than these validators.
+    if response.status_code in (200, 304) and not getattr(response, 'stale', False):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+    return response
@@ -1,31 +1,96 @@
 import json
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from channels.exceptions import StopConsumer
+from channels.consumer import get_handler_name
+from task_manager import metrics
 from urllib.parse import parse_qs
+from . import replay
+from .subscriptions import Subscription
 
 class TaskConsumer(AsyncWebsocketConsumer):
+    async def dispatch(self, message):
+        # Every handler (connect, receive, group events) is measured.
+        user = getattr(self, 'user', None)
+        with metrics.measure('websocket', get_handler_name(message), getattr(user, 'company_id', None),
+                             expected=(StopConsumer,)):
+            await super().dispatch(message)
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        metrics.add_bytes(len(text_data or bytes_data or ''))
+        await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
+
     async def connect(self):
         # Try to authenticate user from JWT token
         self.user = await self.authenticate_user()
+        metrics.tag_company(getattr(self.user, 'company_id', None))
         
         if self.user.is_anonymous or not hasattr(self.user, 'company') or not self.user.company:
             await self.close(code=4001)  # Unauthorized
             return
         
-        self.company_group_name = f"company_{self.user.company.id}"
-        
+        try:
+            self.subscription = Subscription.from_query(self.query_params())
+        except ValueError:
+            await self.close(code=4400)  # Invalid subscription
+            return
+        self.group_name = self.subscription.group(self.user)
+
         await self.channel_layer.group_add(
-            self.company_group_name,
+            self.group_name,
             self.channel_name
         )
         
         await self.accept()
-  
+
+        # Events queued for this socket while connect() runs are delivered
+        # afterwards; the ones already replayed are skipped by sequence.
+        self.replayed_through = 0
+        since = self.query_params().get('since', [None])[0]
+        if since is not None:
+            await self.replay(since)
+            return
+
+        try:
+            seq = await sync_to_async(replay.log.last)(self.user.company_id)
+        except replay.Unavailable:
+            seq = None
         await self.send(text_data=json.dumps({
             'type': 'connection_established',
+            'seq': seq,
+            'subscription': self.subscription.as_dict(),
             'message': f'Connected to {self.user.company.name} task updates'
         }))
 
+    async def replay(self, since):
+        """Send the events after sequence number ``since``, or ask the client to resync."""
+        try:
+            current, events = await sync_to_async(replay.log.since)(self.user.company_id, int(since))
+        except (ValueError, replay.Unavailable):
+            current, events = None, None
+        if events is None:
+            # Reload over REST, then continue from `seq`.
+            if current is not None:
+                self.replayed_through = current
+            await self.send(text_data=json.dumps({
+                'type': 'resync_required',
+                'seq': current,
+                'message': 'Missed task changes are no longer available; reload the task list'
+            }))
+            return
+        for seq, changes in events:
+            await self.send_changes(seq, changes)
+        self.replayed_through = current
+        await self.send(text_data=json.dumps({
+            'type': 'replay_complete',
+            'seq': current,
+            'message': f'Replayed {len(events)} missed event(s)'
+        }))
+
+    def query_params(self):
+        return parse_qs(self.scope.get('query_string', b'').decode())
+
     async def authenticate_user(self):
         """Authenticate user from JWT token in headers or query params"""
         from django.contrib.auth.models import AnonymousUser
@@ -45,8 +110,7 @@ class TaskConsumer(AsyncWebsocketConsumer):
         
         # If no token in headers, try query parameters
         if not token:
-            query_string = self.scope.get('query_string', b'').decode()
-            query_params = parse_qs(query_string)
+            query_params = self.query_params()
             if 'token' in query_params:
                 token = query_params['token'][0]
         
@@ -64,20 +128,19 @@ class TaskConsumer(AsyncWebsocketConsumer):
     
     @database_sync_to_async
     def get_user(self, user_id):
-        from django.contrib.auth import get_user_model
         from django.contrib.auth.models import AnonymousUser
-        
-        User = get_user_model()
-        try:
-            return User.objects.select_related('company').get(id=user_id)
-        except User.DoesNotExist:
+        from accounts.cache import get_cached_user
+
+        user = get_cached_user(user_id)
+        if user is None or not user.is_active:
             return AnonymousUser()
+        return user
 
     async def disconnect(self, close_code):
     
-        if hasattr(self, 'company_group_name'):
+        if hasattr(self, 'group_name'):
             await self.channel_layer.group_discard(
-                self.company_group_name,
+                self.group_name,
                 self.channel_name
             )
 
@@ -91,24 +154,55 @@ class TaskConsumer(AsyncWebsocketConsumer):
                     'type': 'pong',
                     'message': 'Connection alive'
                 }))
-        except json.JSONDecodeError:
+            elif message_type in ('subscribe', 'unsubscribe'):
+                await self.subscribe(text_data_json if message_type == 'subscribe' else {})
+        except (json.JSONDecodeError, AttributeError):
             pass
 
-    async def task_created(self, event):
+    async def subscribe(self, data):
+        """Replace the socket's subscription, moving it to the matching group"""
+        try:
+            subscription = Subscription.parse(data)
+        except ValueError as error:
+            await self.send(text_data=json.dumps({
+                'type': 'subscription_error',
+                'message': str(error)
+            }))
+            return
+        group_name = subscription.group(self.user)
+        if group_name != self.group_name:
+            await self.channel_layer.group_add(group_name, self.channel_name)
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+            self.group_name = group_name
+        self.subscription = subscription
         await self.send(text_data=json.dumps({
-            'type': 'task_created',
-            'task': event['task'],
-            'message': f"New task created: {event['task']['title']}"
+            'type': 'subscribed',
+            'subscription': subscription.as_dict(),
+            'message': 'Subscription updated'
         }))
 
+    async def tasks_changed(self, event):
+        seq = event.get('seq')
+        if seq is not None and seq <= self.replayed_through:
+            return
+        await self.send_changes(seq, event['changes'])
+
+    # Deprecated: the per-task events of the previous release, which its
+    # processes may still send to the groups during a rolling deploy. They
+    # are passed on as unsequenced tasks_changed events; remove next release.
+    async def task_created(self, event):
+        await self.send_changes(None, [{'action': 'created', 'fields': None, 'task': event['task']}])
 
     async def task_updated(self, event):
+        await self.send_changes(None, [{'action': 'updated', 'fields': None, 'task': event['task']}])
+
+    async def send_changes(self, seq, changes):
+        changes = self.subscription.select(changes, self.user.pk)
+        if not changes:
+            return
         await self.send(text_data=json.dumps({
-            'type': 'task_updated',
-            'task': event['task'],
-            'message': f"Task updated: {event['task']['title']}"
+            'type': 'tasks_changed',
+            'seq': seq,
+            'changes': changes,
+            'message': f"{len(changes)} task(s) changed"
         }))
-
-    @database_sync_to_async
-    def get_user_company(self, user):
-        return user.company if hasattr(user, 'company') else None
@@ -0,0 +1,107 @@
+"""
+Incremental maintenance of the per-company task statistics.
+
+Every task is counted in exactly one bucket, ``(company_id, status,
+assigned_to_id)``. Writes move a task between buckets by decrementing the
+old one and incrementing the new one inside the writing transaction, so
+``TaskViewSet.statistics`` can read the counters instead of aggregating
+the task table.
+"""
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+BUCKET_FIELDS = ('company_id', 'status', 'assigned_to_id')
+
+_local = threading.local()
+
+
+def bucket(task):
+    return tuple(getattr(task, name) for name in BUCKET_FIELDS)
+
+
+def saved_bucket(task, previous, update_fields=None):
+    """Bucket the stored row is in after ``save(update_fields=...)``."""
+    current = bucket(task)
+    if update_fields is None or previous is None:
+        return current
+    update_fields = set(update_fields)
+    return tuple(
+        new if name in update_fields or name.removesuffix('_id') in update_fields else old
+        for name, new, old in zip(BUCKET_FIELDS, current, previous)
+    )
+
+
+def move(previous, current):
+    """Count one task out of ``previous`` and into ``current`` (either may be None)."""
+    if previous == current:
+        return
+    deltas = Counter()
+    if previous is not None:
+        deltas[previous] -= 1
+    if current is not None:
+        deltas[current] += 1
+    record(deltas)
+
+
+def record(deltas):
+    """Apply ``{bucket: delta}``, or queue it while inside :func:`deferred`."""
+    pending = getattr(_local, 'pending', None)
+    if pending is not None:
+        pending.update(deltas)
+    else:
+        apply(deltas)
+
+
+@contextmanager
+def deferred():
+    """
+    Collect counter deltas and apply them once per bucket on exit.
+
+    Bulk paths wrap their writes in this so that per-row signals (for
+    example ``post_delete`` during a queryset delete) cost one UPDATE per
+    bucket instead of one per row.
+    """
+    if getattr(_local, 'pending', None) is not None:
+        yield
+        return
+    _local.pending = Counter()
+    try:
+        yield
+        pending = _local.pending
+    finally:
+        _local.pending = None
+    apply(pending)
+
+
+def apply(deltas):
+    from .models import TaskCounter
+
+    for (company_id, status, assigned_to_id), delta in deltas.items():
+        if not delta:
+            continue
+        counter = TaskCounter.objects.filter(
+            company_id=company_id, status=status, assigned_to_id=assigned_to_id
+        )
+        if counter.update(count=F('count') + delta) or delta < 0:
+            # A missing bucket can only be decremented while its company or
+            # assignee is being cascade-deleted, so there is nothing to do.
+            continue
+        try:
+            with transaction.atomic():
+                TaskCounter.objects.create(
+                    company_id=company_id, status=status,
+                    assigned_to_id=assigned_to_id, count=delta,
+                )
+        except IntegrityError:
+            # Another transaction created the bucket first.
+            counter.update(count=F('count') + delta)
+
+
+def live_counts(queryset):
+    """Aggregate ``{bucket: count}`` straight from a Task queryset."""
+    rows = queryset.order_by().values_list(*BUCKET_FIELDS).annotate(n=Count('id'))
+    return {tuple(row[:3]): row[3] for row in rows}
@@ -0,0 +1,146 @@
+"""
+Client for the external todo API merged into ``external_tasks_view``.
+
+One pooled ``httpx.AsyncClient`` is kept per event loop so connections
+are reused with keep-alive across requests; under WSGI, where every
+request runs on a loop of its own, the clients of finished loops are
+closed. Results are cached for
+``ttl`` seconds and then served stale for up to ``stale_ttl`` seconds
+while a single background request refreshes them. After
+``failure_threshold`` consecutive failures the circuit opens: for
+``reset_timeout`` seconds callers get the cached (or an empty) result
+immediately instead of waiting on the upstream.
+"""
+import asyncio
+import logging
+import time
+
+import httpx
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ExternalTaskFetcher:
+    def __init__(self, url, limit=5, ttl=30, stale_ttl=300, timeout=2.0,
+                 failure_threshold=3, reset_timeout=30, max_connections=20,
+                 transport=None):
+        self.url = url
+        self.limit = limit
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_connections = max_connections
+        self.transport = transport
+
+        self.data = None
+        self.fetched_at = 0.0
+        self.failures = 0
+        self.open_until = 0.0
+        self._loop = None
+        self._clients = {}
+        self._refresh = None
+
+    async def get(self):
+        """Return ``(tasks, source)`` where source is live, cached, stale or unavailable."""
+        await self._bind_loop()
+        age = time.monotonic() - self.fetched_at
+
+        if self.data is not None and age < self.ttl:
+            return self.data, 'cached'
+        if self.data is not None and age < self.stale_ttl:
+            self._refresh_in_background()
+            return self.data, 'stale'
+        if self.circuit_open():
+            return self.fallback()
+
+        refreshed = await self._start_refresh()
+        if refreshed:
+            return self.data, 'live'
+        return self.fallback()
+
+    def circuit_open(self):
+        return time.monotonic() < self.open_until
+
+    def fallback(self):
+        if self.data is not None:
+            return self.data, 'stale'
+        return [], 'unavailable'
+
+    def client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=60,
+                ),
+                transport=self.transport,
+            )
+        return client
+
+    async def _bind_loop(self):
+        # Clients and tasks belong to the loop that created them; a new
+        # loop (e.g. async_to_sync per WSGI request) gets a fresh pool, and
+        # the pools of loops that have finished are closed.
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._refresh = None
+            for old_loop in list(self._clients):
+                client = self._clients.pop(old_loop, None) if old_loop.is_closed() else None
+                if client is None:
+                    continue
+                try:
+                    await client.aclose()
+                except Exception:
+                    logger.debug('Could not close the external API client of a finished loop', exc_info=True)
+
+    def _start_refresh(self):
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.ensure_future(self._fetch())
+        return asyncio.shield(self._refresh)
+
+    def _refresh_in_background(self):
+        if not self.circuit_open():
+            self._start_refresh()
+
+    async def _fetch(self):
+        try:
+            # Ask the upstream for only the rows we show.
+            response = await self.client().get(self.url, params={'_limit': self.limit})
+            response.raise_for_status()
+            tasks = response.json()[:self.limit]
+        except (httpx.HTTPError, ValueError) as exc:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.open_until = time.monotonic() + self.reset_timeout
+                logger.warning('External tasks API failing (%s); circuit open for %ss', exc, self.reset_timeout)
+            return False
+
+        self.data = [
+            {
+                'id': task['id'],
+                'title': task['title'],
+                'completed': task['completed'],
+                'source': 'external'
+            }
+            for task in tasks
+        ]
+        self.fetched_at = time.monotonic()
+        self.failures = 0
+        self.open_until = 0.0
+        return True
+
+
+fetcher = ExternalTaskFetcher(
+    getattr(settings, 'EXTERNAL_TASKS_URL', 'https://jsonplaceholder.typicode.com/todos'),
+    ttl=getattr(settings, 'EXTERNAL_TASKS_CACHE_TTL', 30),
+    stale_ttl=getattr(settings, 'EXTERNAL_TASKS_STALE_TTL', 300),
+    timeout=getattr(settings, 'EXTERNAL_TASKS_TIMEOUT', 2.0),
+)
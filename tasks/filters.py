@@ -0,0 +1,147 @@
+"""
+Query parameters of the TaskViewSet read endpoints.
+
+* Filters: ``status``, ``assigned_to`` and ``created_by`` take one value or
+  a comma-separated list; ``created_after``/``created_before`` and
+  ``updated_after``/``updated_before`` take an ISO date or datetime
+  (after is inclusive, before exclusive).
+* ``ordering`` picks one of :data:`ORDERINGS`. Each key maps to a full
+  ordering ending in ``id`` that an index on ``(company, ...)`` serves,
+  so sorting never needs an in-memory sort of the tenant's rows and
+  keyset pagination stays a seek.
+* ``fields`` (see :func:`sparse_fields`) narrows the serialized fields
+  and, through :func:`only_columns`, the columns and joins fetched.
+"""
+from datetime import datetime
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import serializers
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Task
+
+ORDERINGS = {
+    '-created_at': ('-created_at', '-id'),  # task_company_created_idx
+    'created_at': ('created_at', 'id'),
+    '-updated_at': ('-updated_at', '-id'),  # task_company_updated_idx
+    'updated_at': ('updated_at', 'id'),
+    'status': ('status', '-created_at', '-id'),  # task_company_status_idx
+    '-status': ('-status', 'created_at', 'id'),
+}
+DEFAULT_ORDERING = '-created_at'
+
+RANGES = {
+    'created_after': 'created_at__gte',
+    'created_before': 'created_at__lt',
+    'updated_after': 'updated_at__gte',
+    'updated_before': 'updated_at__lt',
+}
+STATUSES = {choice for choice, _ in Task.STATUS_CHOICES}
+
+# Model fields (and related objects to join) behind each serializer field.
+COLUMNS = {
+    'assigned_to_detail': ('assigned_to',),
+    'created_by_detail': ('created_by',),
+    # Search annotations are computed in SQL from title/description.
+    'rank': (),
+    'title_highlight': (),
+    'description_highlight': (),
+}
+RELATED = {
+    'assigned_to_detail': 'assigned_to',
+    'created_by_detail': 'created_by',
+}
+
+
+def split(value):
+    return [item for item in (part.strip() for part in value.split(',')) if item]
+
+
+def parse_ids(name, value):
+    try:
+        return [int(item) for item in split(value)]
+    except ValueError:
+        raise serializers.ValidationError({name: ['Expected an id or a comma-separated list of ids.']})
+
+
+def parse_moment(name, value):
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise serializers.ValidationError({name: ['Expected an ISO 8601 date or datetime.']})
+        moment = datetime(day.year, day.month, day.day)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class TaskFilterBackend(BaseFilterBackend):
+    """Server-side filters; unknown statuses and malformed values are a 400."""
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+
+        if params.get('status'):
+            statuses = split(params['status'])
+            unknown = sorted(set(statuses) - STATUSES)
+            if unknown:
+                raise serializers.ValidationError({'status': [f"Unknown status: {', '.join(unknown)}"]})
+            queryset = queryset.filter(status__in=statuses)
+
+        for name in ('assigned_to', 'created_by'):
+            if params.get(name):
+                queryset = queryset.filter(**{f'{name}__in': parse_ids(name, params[name])})
+
+        for name, lookup in RANGES.items():
+            if params.get(name):
+                queryset = queryset.filter(**{lookup: parse_moment(name, params[name])})
+        return queryset
+
+
+class TaskOrderingBackend(BaseFilterBackend):
+    """``?ordering=`` restricted to the index-backed keys in ORDERINGS."""
+    ordering_param = 'ordering'
+
+    def filter_queryset(self, request, queryset, view):
+        return queryset.order_by(*self.get_ordering(request, queryset, view))
+
+    def get_ordering(self, request, queryset, view):
+        key = request.query_params.get(self.ordering_param) or DEFAULT_ORDERING
+        if key not in ORDERINGS:
+            raise serializers.ValidationError({
+                self.ordering_param: [f"Unsupported ordering '{key}'; use one of {', '.join(ORDERINGS)}"]
+            })
+        return ORDERINGS[key]
+
+
+def sparse_fields(request, allowed):
+    """The ``?fields=`` selection as a list, or None when absent; unknown names are a 400."""
+    value = request.query_params.get('fields')
+    if not value:
+        return None
+    fields = split(value)
+    unknown = [name for name in fields if name not in allowed]
+    if unknown:
+        raise serializers.ValidationError({'fields': [f"Unknown field: {', '.join(unknown)}"]})
+    return fields
+
+
+def only_columns(queryset, fields, ordering=()):
+    """
+    Restrict ``queryset`` to the columns (and joins) the selected fields need.
+
+    ``id`` and ``company`` are always kept for lookups and permission
+    checks, and the ordering columns for keyset cursors.
+    """
+    columns = {'id', 'company'}
+    related = []
+    for name in [field.lstrip('-') for field in ordering] + list(fields):
+        columns.update(COLUMNS.get(name, (name,)))
+        if name in RELATED:
+            related.append(RELATED[name])
+    queryset = queryset.select_related(None)
+    if related:
+        queryset = queryset.select_related(*related)
+    return queryset.only(*columns)
@@ -0,0 +1,149 @@
+"""
+Lead time and cycle time percentiles from the TaskTransition log.
+
+Lead time runs from a task's creation to its first move to ``done``;
+cycle time from its first move to ``in_progress`` to its first ``done``.
+Tasks are picked by completion time through the (company, to_status, at)
+index. The database groups their transitions into one span per task and
+ranks the durations with ``ROW_NUMBER()`` / ``COUNT()`` window functions
+over the company and over each assignee. Percentiles are nearest-rank,
+and only one summary row per assignee leaves the database.
+Backends without a duration expression below (e.g. MySQL) fall back to
+loading one span per task and ranking in Python, which is only meant for
+development databases.
+"""
+import math
+from collections import defaultdict
+
+from django.db import connections, router
+from django.db.models import Min, Q
+
+from accounts.models import User
+from .models import Task, TaskTransition
+
+METRICS = {
+    'lead_time': "MIN(CASE WHEN tr.from_status = '' THEN tr.at END)",
+    'cycle_time': "MIN(CASE WHEN tr.to_status = 'in_progress' THEN tr.at END)",
+}
+PERCENTILES = (50, 75, 90, 95)
+
+# Seconds between two timestamp columns.
+DURATION = {
+    'postgresql': 'CAST(EXTRACT(EPOCH FROM ({end} - {start})) AS double precision)',
+    'sqlite': '(julianday({end}) - julianday({start})) * 86400.0',
+}
+
+SUMMARY = ', '.join(
+    [
+        'MAX({n}) AS count',
+        'AVG(seconds) AS avg',
+        *[f'MIN(CASE WHEN {{rank}} >= {p / 100} * {{n}} THEN seconds END) AS p{p}' for p in PERCENTILES],
+    ]
+)
+
+QUERY = """
+WITH completed AS (
+    SELECT DISTINCT task_id FROM {transitions}
+    WHERE company_id = %(company)s AND to_status = 'done' AND at >= %(since)s
+),
+spans AS (
+    SELECT tr.task_id, {start} AS started_at,
+           MIN(CASE WHEN tr.to_status = 'done' THEN tr.at END) AS done_at
+    FROM {transitions} tr
+    WHERE tr.company_id = %(company)s AND tr.task_id IN (SELECT task_id FROM completed)
+    GROUP BY tr.task_id
+),
+durations AS (
+    SELECT task.assigned_to_id AS assignee, {duration} AS seconds
+    FROM spans
+    JOIN {tasks} task ON task.id = spans.task_id AND task.company_id = %(company)s
+    WHERE spans.started_at IS NOT NULL AND spans.done_at >= spans.started_at
+),
+ranked AS (
+    SELECT assignee, seconds,
+           ROW_NUMBER() OVER (ORDER BY seconds) AS company_rank,
+           COUNT(*) OVER () AS company_n,
+           ROW_NUMBER() OVER (PARTITION BY assignee ORDER BY seconds) AS assignee_rank,
+           COUNT(*) OVER (PARTITION BY assignee) AS assignee_n
+    FROM durations
+)
+SELECT NULL AS assignee, {company_summary} FROM ranked
+UNION ALL
+SELECT assignee, {assignee_summary} FROM ranked GROUP BY assignee
+"""
+
+
+def flow_sql(metric, connection):
+    duration = DURATION[connection.vendor]
+    return QUERY.format(
+        transitions=TaskTransition._meta.db_table,
+        tasks=Task._meta.db_table,
+        start=METRICS[metric],
+        duration=duration.format(start='spans.started_at', end='spans.done_at'),
+        company_summary=SUMMARY.format(rank='company_rank', n='company_n'),
+        assignee_summary=SUMMARY.format(rank='assignee_rank', n='assignee_n'),
+    )
+
+
+def flow_metrics(company, metric, since):
+    """Percentiles (in seconds) of ``metric`` for tasks the company completed since ``since``."""
+    connection = connections[router.db_for_read(TaskTransition)]
+    if connection.vendor not in DURATION:
+        rows = summarize_in_python(company, metric, since)
+    else:
+        with connection.cursor() as cursor:
+            cursor.execute(flow_sql(metric, connection), {
+                'company': company.pk,
+                'since': connection.ops.adapt_datetimefield_value(since),
+            })
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    summary = {'count': 0, 'avg': None, **{f'p{p}': None for p in PERCENTILES}}
+    by_assignee = []
+    for row in rows:
+        assignee = row.pop('assignee')
+        row = {key: round(value, 1) if isinstance(value, float) else value for key, value in row.items()}
+        row['count'] = row['count'] or 0
+        if assignee is None:
+            summary = row
+        else:
+            by_assignee.append({'assigned_to': assignee, **row})
+
+    usernames = dict(User.objects.filter(
+        pk__in=[row['assigned_to'] for row in by_assignee]
+    ).values_list('id', 'username'))
+    for row in by_assignee:
+        row['username'] = usernames.get(row['assigned_to'])
+    by_assignee.sort(key=lambda row: (-row['count'], row['assigned_to']))
+    return {'company': summary, 'by_assignee': by_assignee}
+
+
+def summarize_in_python(company, metric, since):
+    """The rows of :data:`QUERY`, computed from the per-task spans."""
+    completed = TaskTransition.objects.filter(company=company, to_status='done', at__gte=since).values('task_id')
+    start = Q(from_status='') if metric == 'lead_time' else Q(to_status='in_progress')
+    spans = TaskTransition.objects.filter(company=company, task_id__in=completed).values('task_id').annotate(
+        started_at=Min('at', filter=start), done_at=Min('at', filter=Q(to_status='done')),
+    )
+    assignees = dict(Task.objects.filter(
+        company=company, pk__in=completed
+    ).values_list('id', 'assigned_to_id'))
+
+    durations = defaultdict(list)
+    for span in spans:
+        if span['task_id'] not in assignees or span['started_at'] is None or span['done_at'] < span['started_at']:
+            continue
+        seconds = (span['done_at'] - span['started_at']).total_seconds()
+        durations[None].append(seconds)
+        durations[assignees[span['task_id']]].append(seconds)
+    return [{'assignee': assignee, **summarize(seconds)} for assignee, seconds in durations.items()]
+
+
+def summarize(seconds):
+    seconds = sorted(seconds)
+    summary = {'count': len(seconds), 'avg': sum(seconds) / len(seconds)}
+    for p in PERCENTILES:
+        # Nearest rank, as in SUMMARY: the first value ranked at p% or above.
+        summary[f'p{p}'] = seconds[math.ceil(p / 100 * len(seconds)) - 1]
+    return summary
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import random
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from accounts.models import Company, User
+from notifications import dispatch
+from tasks import benchmark, external
+from tasks.models import Task
+from tasks.seed import seed_tasks
+
+SCENARIOS = ('list', 'create', 'statistics', 'external', 'websocket', 'notifications')
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test the task API, the external tasks endpoint, TaskConsumer and the Celery '
+        'notification relay in-process and print throughput, latency percentiles and queries per '
+        'request as JSON. Works with '
+        'PostgreSQL and Redis or, with DJANGO_SETTINGS_MODULE=task_manager.settings_benchmark, '
+        'SQLite and the in-memory channel layer. Run it against a scratch database: the seeded '
+        'tenants are kept and reused by later runs.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=100_000,
+                            help='Number of tasks to seed if the benchmark tenants do not exist yet')
+        parser.add_argument('--companies', type=int, default=20,
+                            help='Number of synthetic companies to seed')
+        parser.add_argument('--users-per-company', type=int, default=20)
+        parser.add_argument('--skew', type=float, default=1.0,
+                            help='Zipf skew of tasks across companies (0 = even)')
+        parser.add_argument('--prefix', default='apibench',
+                            help='Name prefix of the seeded companies and users')
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                            help=f"Comma-separated scenarios to run, from: {', '.join(SCENARIOS)}")
+        parser.add_argument('--requests', type=int, default=500,
+                            help='Requests per HTTP scenario')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Concurrent clients per HTTP scenario')
+        parser.add_argument('--warmup', type=int, default=20,
+                            help='Unmeasured requests before each HTTP scenario')
+        parser.add_argument('--sockets', type=int, default=500,
+                            help='Concurrent WebSocket connections')
+        parser.add_argument('--events', type=int, default=20,
+                            help='Task writes broadcast to the connected sockets')
+        parser.add_argument('--upstream-latency', type=float, default=0.05,
+                            help='Seconds the mocked external API takes to answer')
+        parser.add_argument('--upstream-ttl', type=float, default=0,
+                            help='Seconds external results are cached (0 = call the mock every time)')
+        parser.add_argument('--notifications', type=int, default=2000,
+                            help='New-task notifications queued for the relay to publish')
+        parser.add_argument('--relay-batch-size', type=int, default=None,
+                            help='Notifications per relayed Celery job (default: NOTIFICATION_RELAY_BATCH_SIZE)')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed')
+
+    def handle(self, *args, **options):
+        scenarios = [name for name in options['scenarios'].split(',') if name]
+        unknown = sorted(set(scenarios) - set(SCENARIOS))
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(unknown)}")
+
+        seed_seconds = self.seed(options)
+        rng = random.Random(options['seed'])
+        users = benchmark.Users(
+            list(User.objects.filter(username__startswith=f"{options['prefix']}-").order_by('pk')), rng
+        )
+        if not users.users:
+            raise CommandError('No benchmark users found')
+
+        # Allows the test client's host and keeps notification emails in memory.
+        setup_test_environment()
+        try:
+            results = {}
+            for name in scenarios:
+                self.stderr.write(f'Running {name}...')
+                results[name] = getattr(self, f'run_{name}')(users, rng, options)
+        finally:
+            teardown_test_environment()
+
+        self.stdout.write(json.dumps({
+            'database': connection.vendor,
+            'channel_layer': settings.CHANNEL_LAYERS['default']['BACKEND'],
+            'cache': settings.CACHES['default']['BACKEND'],
+            'celery_eager': getattr(settings, 'CELERY_TASK_ALWAYS_EAGER', False),
+            'companies': len(users.by_company),
+            'users': len(users.users),
+            'seed_seconds': seed_seconds,
+            'scenarios': results,
+        }, indent=2))
+
+    def seed(self, options):
+        prefix = options['prefix']
+        if Company.objects.filter(name__startswith=f'{prefix}-company-').exists():
+            return None
+        self.stderr.write(f"Seeding {options['tasks']} tasks over {options['companies']} companies...")
+        started = time.perf_counter()
+        companies = seed_tasks(
+            companies=options['companies'],
+            users_per_company=options['users_per_company'],
+            tasks=options['tasks'],
+            skew=options['skew'],
+            prefix=prefix,
+            rng=random.Random(options['seed']),
+        )
+        # Seeded rows bypass Task.save(), so build their statistics counters.
+        call_command('task_counters', rebuild=True, companies=[company.pk for company in companies],
+                     stdout=self.stderr)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        return round(time.perf_counter() - started, 2)
+
+    def run_list(self, users, rng, options):
+        def send(client):
+            return client.get('/api/tasks/', headers=users.headers(users.pick()))
+        return self.run_http(send, options)
+
+    def run_create(self, users, rng, options):
+        def send(client):
+            user = users.pick()
+            return client.post('/api/tasks/', {
+                'title': 'benchmark task',
+                'assigned_to': users.colleague(user).pk,
+            }, content_type='application/json', headers=users.headers(user))
+        return self.run_http(send, options)
+
+    def run_statistics(self, users, rng, options):
+        def send(client):
+            return client.get('/api/tasks/statistics/', headers=users.headers(users.pick()))
+        return self.run_http(send, options)
+
+    def run_http(self, send, options):
+        return benchmark.run_http(send, options['requests'], options['concurrency'], options['warmup'])
+
+    def run_external(self, users, rng, options):
+        async def send(client):
+            return await client.get('/api/external-tasks/', headers=users.headers(users.pick()))
+
+        fetcher, external.fetcher = external.fetcher, benchmark.mocked_fetcher(
+            options['upstream_latency'], options['upstream_ttl']
+        )
+        try:
+            result = asyncio.run(benchmark.run_async_http(
+                send, options['requests'], options['concurrency'], options['warmup']
+            ))
+        finally:
+            external.fetcher = fetcher
+        result['upstream_latency_ms'] = options['upstream_latency'] * 1000
+        return result
+
+    def run_websocket(self, users, rng, options):
+        return asyncio.run(benchmark.run_websockets(users, options['sockets'], options['events']))
+
+    def run_notifications(self, users, rng, options):
+        task_ids = list(Task.objects.filter(
+            company_id__in=list(users.by_company)
+        ).values_list('id', flat=True)[:options['notifications']])
+        if not task_ids:
+            raise CommandError('No benchmark tasks found')
+        return benchmark.run_relay(
+            [rng.choice(task_ids) for _ in range(options['notifications'])],
+            options['relay_batch_size'] or dispatch.RELAY_BATCH_SIZE,
+        )
@@ -0,0 +1,88 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from accounts.models import Company
+from tasks import analytics
+from tasks.seed import seed_tasks
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the task_analytics engine on a seeded database. Run it against a scratch '
+        'database: the seeded tenants are kept and reused by later runs.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=1_000_000,
+                            help='Number of tasks to seed if the benchmark tenants do not exist yet')
+        parser.add_argument('--companies', type=int, default=50,
+                            help='Number of synthetic companies to seed')
+        parser.add_argument('--users-per-company', type=int, default=20)
+        parser.add_argument('--skew', type=float, default=1.0,
+                            help='Zipf skew of tasks across companies (0 = even)')
+        parser.add_argument('--workers', default='1,2,4',
+                            help='Comma-separated worker counts to time')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Runs per worker count')
+        parser.add_argument('--prefix', default='analyticsbench',
+                            help='Name prefix of the seeded companies and users')
+
+    def handle(self, *args, **options):
+        try:
+            worker_counts = [int(value) for value in options['workers'].split(',')]
+        except ValueError:
+            raise CommandError('--workers must be a comma-separated list of integers')
+
+        company_ids = self.seeded_companies(options['prefix'])
+        seed_seconds = None
+        if not company_ids:
+            self.stderr.write(f"Seeding {options['tasks']} tasks over {options['companies']} companies...")
+            started = time.perf_counter()
+            seed_tasks(
+                companies=options['companies'],
+                users_per_company=options['users_per_company'],
+                tasks=options['tasks'],
+                skew=options['skew'],
+                prefix=options['prefix'],
+            )
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            seed_seconds = round(time.perf_counter() - started, 2)
+            company_ids = self.seeded_companies(options['prefix'])
+
+        task_count = Company.objects.filter(pk__in=company_ids).aggregate(n=Count('tasks'))['n']
+        runs = []
+        for workers in worker_counts:
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                companies = analytics.collect(company_ids, workers=workers)
+                timings.append(time.perf_counter() - started)
+            runs.append({
+                'workers': workers,
+                'min_seconds': round(min(timings), 3),
+                'median_seconds': round(statistics.median(timings), 3),
+                'tasks_per_second': round(task_count / min(timings)),
+            })
+            self.stderr.write(f"workers={workers}: {min(timings):.2f}s")
+
+        if sum(company['total_tasks'] for company in companies) != task_count:
+            raise CommandError('Analytics totals do not match the seeded task count')
+
+        self.stdout.write(json.dumps({
+            'database': connection.vendor,
+            'companies': len(company_ids),
+            'tasks': task_count,
+            'seed_seconds': seed_seconds,
+            'runs': runs,
+        }, indent=2))
+
+    def seeded_companies(self, prefix):
+        return list(
+            Company.objects.filter(name__startswith=f'{prefix}-company-')
+            .order_by('pk').values_list('pk', flat=True)
+        )
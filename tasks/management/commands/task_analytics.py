@@ -1,75 +1,127 @@
-from django.core.management.base import BaseCommand
-from django.db.models import Count, Q, Avg
-from django.db.models.functions import TruncDate
-from tasks.models import Task
-from accounts.models import User, Company
+import contextlib
+import csv
+import json
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from task_manager import db_router
+from tasks import analytics
+
 
 class Command(BaseCommand):
-    help = 'Display advanced task analytics using complex queries'
+    help = 'Display per-company task analytics, computed in one grouped pass per company shard'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, action='append', dest='companies',
+                            help='Restrict to this company id (repeatable)')
+        parser.add_argument('--since',
+                            help='Only count tasks created at or after this date or ISO datetime')
+        parser.add_argument('--format', choices=['text', 'json', 'csv'], default='text',
+                            help='Output format (default: text)')
+        parser.add_argument('--csv-rows', choices=['companies', 'users'], default='companies',
+                            help='With --format csv, emit one row per company or per user')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Process company shards in this many worker processes')
+        parser.add_argument('--shards', type=int,
+                            help='Number of company shards (default: four per worker)')
+        parser.add_argument('--primary', action='store_true',
+                            help='Read from the primary database even when replicas are configured')
 
     def handle(self, *args, **options):
+        since = self.parse_since(options['since'])
+        started = time.perf_counter()
+        with contextlib.nullcontext() if options['primary'] else db_router.replica_reads():
+            companies = analytics.collect(
+                options['companies'], since=since, workers=options['workers'], shards=options['shards'],
+            )
+        elapsed = time.perf_counter() - started
+
+        if options['format'] == 'json':
+            self.write_json(companies, since, elapsed)
+        elif options['format'] == 'csv':
+            self.write_csv(companies, options['csv_rows'])
+        else:
+            self.write_text(companies)
+        if options['verbosity'] > 1:
+            self.stderr.write(f'Computed analytics for {len(companies)} companies in {elapsed:.2f}s')
+
+    def parse_since(self, value):
+        if not value:
+            return None
+        since = parse_datetime(value)
+        if since is None:
+            day = parse_date(value)
+            if day is None:
+                raise CommandError(f'Invalid --since value: {value!r}')
+            since = datetime(day.year, day.month, day.day)
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        return since
+
+    def write_json(self, companies, since, elapsed):
+        self.stdout.write(json.dumps({
+            'generated_at': timezone.now().isoformat(),
+            'since': since.isoformat() if since else None,
+            'elapsed_seconds': round(elapsed, 3),
+            'totals': analytics.summarize(companies),
+            'companies': companies,
+        }, indent=2))
+
+    def write_csv(self, companies, rows):
+        if rows == 'users':
+            columns, records = analytics.USER_COLUMNS, analytics.user_rows(companies)
+        else:
+            columns, records = analytics.COMPANY_COLUMNS, analytics.company_rows(companies)
+        writer = csv.DictWriter(self.stdout, fieldnames=columns, lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(records)
+
+    def write_text(self, companies):
         self.stdout.write(self.style.SUCCESS('=== TASK ANALYTICS ===\n'))
-        self.stdout.write(self.style.WARNING('1. Tasks per User:'))
-        user_task_counts = User.objects.annotate(
-            total_tasks=Count('assigned_tasks'),
-            completed_tasks=Count('assigned_tasks', filter=Q(assigned_tasks__status='done')),
-            pending_tasks=Count('assigned_tasks', filter=Q(assigned_tasks__status__in=['todo', 'in_progress']))
-        ).filter(total_tasks__gt=0).order_by('-total_tasks')
 
-        for user in user_task_counts:
+        self.stdout.write(self.style.WARNING('1. Tasks per User:'))
+        users = sorted(
+            ((company, user) for company in companies for user in company['users']),
+            key=lambda pair: -pair[1]['total_tasks'],
+        )
+        for company, user in users:
             self.stdout.write(
-                f"  {user.username} ({user.company.name if user.company else 'No Company'}): "
-                f"{user.total_tasks} total, {user.completed_tasks} completed, {user.pending_tasks} pending"
+                f"  {user['username']} ({company['company_name']}): "
+                f"{user['total_tasks']} total, {user['completed_tasks']} completed, "
+                f"{user['pending_tasks']} pending"
             )
 
         self.stdout.write(self.style.WARNING('\n2. Tasks by Status:'))
-        total_tasks = Task.objects.count()
-        status_counts = Task.objects.values('status').annotate(
-            count=Count('id')
-        ).order_by('-count')
-
-        for status in status_counts:
-            percentage = (status['count'] / total_tasks * 100) if total_tasks > 0 else 0
-            self.stdout.write(
-                f"  {status['status'].title()}: {status['count']} tasks ({percentage:.1f}%)"
-            )
+        totals = analytics.summarize(companies)
+        for status, count in sorted(totals['by_status'].items(), key=lambda item: -item[1]):
+            percentage = (count / totals['total_tasks'] * 100) if totals['total_tasks'] > 0 else 0
+            self.stdout.write(f"  {status.title()}: {count} tasks ({percentage:.1f}%)")
 
-       
         self.stdout.write(self.style.WARNING('\n3. Company Performance:'))
-        company_stats = Company.objects.annotate(
-            total_tasks=Count('tasks'),
-            completed_tasks=Count('tasks', filter=Q(tasks__status='done')),
-            total_users=Count('users'),
-            avg_tasks_per_user=Avg('users__assigned_tasks__id')
-        ).filter(total_tasks__gt=0).order_by('-total_tasks')
-
-        for company in company_stats:
-            completion_rate = (company.completed_tasks / company.total_tasks * 100) if company.total_tasks > 0 else 0
+        for company in companies:
+            if not company['total_tasks']:
+                continue
             self.stdout.write(
-                f"  {company.name}: {company.total_tasks} tasks, "
-                f"{company.completed_tasks} completed ({completion_rate:.1f}%), "
-                f"{company.total_users} users"
+                f"  {company['company_name']}: {company['total_tasks']} tasks, "
+                f"{company['completed_tasks']} completed ({company['completion_rate']:.1f}%), "
+                f"{company['total_users']} users, "
+                f"{company['avg_tasks_per_user']:.1f} tasks per user"
             )
 
-        self.stdout.write(self.style.WARNING('\n4. Daily Task Creation (Last 7 Days):'))
-        daily_tasks = Task.objects.annotate(
-            date=TruncDate('created_at')
-        ).values('date').annotate(
-            count=Count('id')
-        ).order_by('-date')[:7]
+        self.stdout.write(self.style.WARNING(f'\n4. Daily Task Creation (Last {analytics.DAILY_DAYS} Days):'))
+        daily = {}
+        for company in companies:
+            for day, count in company['daily_created'].items():
+                daily[day] = daily.get(day, 0) + count
+        for day in sorted(daily, reverse=True):
+            self.stdout.write(f"  {day}: {daily[day]} tasks created")
 
-        for day in daily_tasks:
-            self.stdout.write(f"  {day['date']}: {day['count']} tasks created")
-
-    
         self.stdout.write(self.style.WARNING('\n5. Task Assignment Analysis:'))
-        users_with_multiple_assignments = User.objects.annotate(
-            assigned_count=Count('assigned_tasks')
-        ).filter(assigned_count__gte=2).order_by('-assigned_count')
-
-        for user in users_with_multiple_assignments:
-            self.stdout.write(
-                f"  {user.username}: {user.assigned_count} assigned tasks"
-            )
+        for company, user in users:
+            if user['total_tasks'] >= 2:
+                self.stdout.write(f"  {user['username']}: {user['total_tasks']} assigned tasks")
 
         self.stdout.write(self.style.SUCCESS('\n=== END ANALYTICS ==='))
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from tasks import counters
+from tasks.models import Task, TaskCounter
+
+
+class Command(BaseCommand):
+    help = 'Verify or rebuild the materialized task statistics counters against live aggregates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recompute the counters from the task table instead of only checking them')
+        parser.add_argument('--company', type=int, action='append', dest='companies',
+                            help='Restrict to this company id (repeatable)')
+
+    def handle(self, *args, **options):
+        tasks = Task.objects.all()
+        stored = TaskCounter.objects.all()
+        if options['companies']:
+            tasks = tasks.filter(company_id__in=options['companies'])
+            stored = stored.filter(company_id__in=options['companies'])
+
+        if options['rebuild']:
+            self.rebuild(tasks, stored)
+            return
+
+        live = counters.live_counts(tasks)
+        # Every stored bucket, so negative counts show up as drift too.
+        current = {
+            (row.company_id, row.status, row.assigned_to_id): row.count
+            for row in stored
+        }
+        drift = sorted(
+            (key, current.get(key, 0), live.get(key, 0))
+            for key in set(live) | set(current)
+            if current.get(key, 0) != live.get(key, 0)
+        )
+        for (company_id, status, assigned_to_id), stored_count, live_count in drift:
+            self.stdout.write(
+                f"  company={company_id} status={status} assigned_to={assigned_to_id}: "
+                f"counter {stored_count}, live {live_count}"
+            )
+        if drift:
+            raise CommandError(f'{len(drift)} counter bucket(s) out of sync; rerun with --rebuild')
+        self.stdout.write(self.style.SUCCESS(f'{len(live)} counter bucket(s) match the task table.'))
+
+    def rebuild(self, tasks, stored):
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # Block task writes until the new counters are committed.
+                with connection.cursor() as cursor:
+                    cursor.execute('LOCK TABLE tasks_task IN SHARE MODE')
+            stored.delete()
+            live = counters.live_counts(tasks)
+            TaskCounter.objects.bulk_create([
+                TaskCounter(company_id=company_id, status=status,
+                            assigned_to_id=assigned_to_id, count=count)
+                for (company_id, status, assigned_to_id), count in live.items()
+            ], batch_size=1000)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {len(live)} counter bucket(s).'))
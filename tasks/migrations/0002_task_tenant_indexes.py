@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                fields=["company", "-created_at", "-id"],
+                name="task_company_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                fields=["company", "status"], name="task_company_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                fields=["company", "assigned_to", "-created_at", "-id"],
+                name="task_company_assignee_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                condition=models.Q(("status__in", ["todo", "in_progress"])),
+                fields=["company", "assigned_to"],
+                name="task_company_open_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:21
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+
+def backfill_counters(apps, schema_editor):
+    Task = apps.get_model("tasks", "Task")
+    TaskCounter = apps.get_model("tasks", "TaskCounter")
+    rows = (
+        Task.objects.order_by()
+        .values_list("company_id", "status", "assigned_to_id")
+        .annotate(count=Count("id"))
+    )
+    TaskCounter.objects.bulk_create(
+        [
+            TaskCounter(
+                company_id=company_id,
+                status=status,
+                assigned_to_id=assigned_to_id,
+                count=count,
+            )
+            for company_id, status, assigned_to_id, count in rows.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("accounts", "0001_initial"),
+        ("tasks", "0002_task_tenant_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TaskCounter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("todo", "To Do"),
+                            ("in_progress", "In Progress"),
+                            ("done", "Done"),
+                            ("cancelled", "Cancelled"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("count", models.IntegerField(default=0)),
+                (
+                    "assigned_to",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "company",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="task_counters",
+                        to="accounts.company",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="taskcounter",
+            constraint=models.UniqueConstraint(
+                fields=("company", "status", "assigned_to"),
+                name="task_counter_bucket_unique",
+            ),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
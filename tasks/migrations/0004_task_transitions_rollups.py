@@ -0,0 +1,124 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Existing tasks have no history, so log each as created in "todo" at
+# created_at and, unless still in "todo", moved to its current status at
+# updated_at. The rollup job picks these rows up on its first run.
+BACKFILL_CREATED = """
+INSERT INTO tasks_tasktransition (company_id, task_id, from_status, to_status, at)
+SELECT company_id, id, '', 'todo', created_at FROM tasks_task ORDER BY created_at, id
+"""
+BACKFILL_MOVED = """
+INSERT INTO tasks_tasktransition (company_id, task_id, from_status, to_status, at)
+SELECT company_id, id, 'todo', status, updated_at FROM tasks_task
+WHERE status <> 'todo' ORDER BY updated_at, id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0001_initial"),
+        ("tasks", "0003_task_counters"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RollupWatermark",
+            fields=[
+                (
+                    "name",
+                    models.CharField(max_length=50, primary_key=True, serialize=False),
+                ),
+                ("position", models.BigIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="TaskRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "granularity",
+                    models.CharField(
+                        choices=[("hour", "Hour"), ("day", "Day")], max_length=4
+                    ),
+                ),
+                ("period_start", models.DateTimeField()),
+                ("created", models.PositiveIntegerField(default=0)),
+                ("completed", models.PositiveIntegerField(default=0)),
+                ("cancelled", models.PositiveIntegerField(default=0)),
+                ("transitions", models.PositiveIntegerField(default=0)),
+                (
+                    "company",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="task_rollups",
+                        to="accounts.company",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="TaskTransition",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("from_status", models.CharField(blank=True, max_length=20)),
+                ("to_status", models.CharField(max_length=20)),
+                ("at", models.DateTimeField()),
+                (
+                    "company",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="accounts.company",
+                    ),
+                ),
+                (
+                    "task",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        db_index=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="transitions",
+                        to="tasks.task",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["company", "task", "at"], name="task_transition_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="taskrollup",
+            constraint=models.UniqueConstraint(
+                fields=("company", "granularity", "period_start"),
+                name="task_rollup_period_unique",
+            ),
+        ),
+        migrations.RunSQL(BACKFILL_CREATED, migrations.RunSQL.noop),
+        migrations.RunSQL(BACKFILL_MOVED, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0004_task_transitions_rollups"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="tasktransition",
+            index=models.Index(
+                fields=["company", "to_status", "at"], name="task_transition_status_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:52
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Full-text search is PostgreSQL-only; on other backends the column stays
+# empty and tasks.search falls back to substring matching.
+SEARCH_SQL = """
+CREATE EXTENSION IF NOT EXISTS btree_gin;
+
+CREATE OR REPLACE FUNCTION tasks_task_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(NEW.description, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tasks_task_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, description ON tasks_task
+    FOR EACH ROW EXECUTE FUNCTION tasks_task_search_vector_update();
+
+UPDATE tasks_task SET search_vector =
+    setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(description, '')), 'B');
+
+-- company_id leads (via btree_gin) so a search only visits its tenant's entries.
+CREATE INDEX task_company_search_idx ON tasks_task USING gin (company_id, search_vector);
+"""
+
+DROP_SEARCH_SQL = """
+DROP INDEX IF EXISTS task_company_search_idx;
+DROP TRIGGER IF EXISTS tasks_task_search_vector_trigger ON tasks_task;
+DROP FUNCTION IF EXISTS tasks_task_search_vector_update();
+"""
+
+
+def create_search(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(SEARCH_SQL)
+
+
+def drop_search(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(DROP_SEARCH_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0005_task_transition_status_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="task",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(create_search, drop_search),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0006_task_search_vector"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="task",
+            name="task_company_status_idx",
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                fields=["company", "-updated_at", "-id"],
+                name="task_company_updated_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                fields=["company", "status", "-created_at", "-id"],
+                name="task_company_status_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:07
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0007_task_sort_indexes"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="task",
+            name="task_company_open_idx",
+        ),
+    ]
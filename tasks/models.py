@@ -1,7 +1,9 @@
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from . import counters, transitions, versions
 
 class Task(models.Model):
     STATUS_CHOICES = [
@@ -10,6 +12,7 @@ class Task(models.Model):
         ('done', 'Done'),
         ('cancelled', 'Cancelled'),
     ]
+    TRACKED_FIELDS = ('title', 'description', 'status', 'assigned_to_id')
 
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True)
@@ -31,25 +34,187 @@ class Task(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Weighted title/description lexemes, kept current by a database
+    # trigger (see migration 0006) so bulk writes are covered too.
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Tenant-scoped access paths used by TaskViewSet filters and the
+            # sort keys in tasks.filters.ORDERINGS; the trailing id keeps
+            # keyset pagination an index seek.
+            models.Index(fields=['company', '-created_at', '-id'], name='task_company_created_idx'),
+            models.Index(fields=['company', '-updated_at', '-id'], name='task_company_updated_idx'),
+            models.Index(fields=['company', 'status', '-created_at', '-id'], name='task_company_status_idx'),
+            models.Index(
+                fields=['company', 'assigned_to', '-created_at', '-id'],
+                name='task_company_assignee_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.title} - {self.company.name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored values of the fields clients see change, so
+        # broadcasts can send only what changed and notify the old assignee.
+        instance._loaded_values = {
+            name: value for name, value in zip(field_names, values) if name in cls.TRACKED_FIELDS
+        }
+        return instance
+
+    def changed_fields(self):
+        """
+        Names of the tracked fields that differ from the loaded row, or None
+        for a task that was not loaded from the database.
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return None
+        return [
+            name.removesuffix('_id') for name in self.TRACKED_FIELDS
+            if name in self.__dict__ and (name not in loaded or self.__dict__[name] != loaded[name])
+        ]
+
+    def loaded_value(self, name):
+        return getattr(self, '_loaded_values', {}).get(name)
+
     def save(self, *args, **kwargs):
         # Automatically set company from assigned_to user
         if not self.company_id and self.assigned_to:
             self.company = self.assigned_to.company
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            previous = self._previous_bucket()
+            super().save(*args, **kwargs)
+            current = counters.saved_bucket(self, previous, kwargs.get('update_fields'))
+            counters.move(previous, current)
+            transitions.record_change(self, previous, current)
+            versions.touch(self.company_id)
+
+    def _previous_bucket(self):
+        if self._state.adding:
+            return None
+        # Read (and lock) the stored row rather than trusting this instance:
+        # another save may have moved the task since it was loaded.
+        return Task.objects.select_for_update().filter(pk=self.pk).values_list(
+            *counters.BUCKET_FIELDS
+        ).first()
+
+
+class TaskCounter(models.Model):
+    """Number of tasks per company, status and assignee, kept in step with Task writes."""
+    company = models.ForeignKey(
+        'accounts.Company',
+        on_delete=models.CASCADE,
+        related_name='task_counters'
+    )
+    status = models.CharField(max_length=20, choices=Task.STATUS_CHOICES)
+    assigned_to = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['company', 'status', 'assigned_to'],
+                name='task_counter_bucket_unique',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.company_id}/{self.status}/{self.assigned_to_id}: {self.count}"
+
+
+class TaskTransition(models.Model):
+    """
+    Append-only log of task status changes.
+
+    Creation is logged with an empty ``from_status``. Rows are kept when
+    their task is deleted, so there is no foreign key constraint on task.
+    """
+    company = models.ForeignKey(
+        'accounts.Company',
+        on_delete=models.CASCADE,
+        related_name='+',
+        db_index=False
+    )
+    task = models.ForeignKey(
+        Task,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='transitions',
+        db_index=False
+    )
+    from_status = models.CharField(max_length=20, blank=True)
+    to_status = models.CharField(max_length=20)
+    at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', 'task', 'at'], name='task_transition_idx'),
+            # Completions in a time window, for lead/cycle time queries.
+            models.Index(fields=['company', 'to_status', 'at'], name='task_transition_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.task_id}: {self.from_status or '-'} -> {self.to_status} at {self.at}"
+
+
+class TaskRollup(models.Model):
+    """Per-company transition counts for one hour or one day, built from TaskTransition."""
+    GRANULARITY_CHOICES = [
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    ]
+
+    company = models.ForeignKey(
+        'accounts.Company',
+        on_delete=models.CASCADE,
+        related_name='task_rollups'
+    )
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES)
+    period_start = models.DateTimeField()
+    created = models.PositiveIntegerField(default=0)
+    completed = models.PositiveIntegerField(default=0)
+    cancelled = models.PositiveIntegerField(default=0)
+    transitions = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['company', 'granularity', 'period_start'],
+                name='task_rollup_period_unique',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.company_id}/{self.granularity}/{self.period_start:%Y-%m-%d %H:%M}"
+
+
+class RollupWatermark(models.Model):
+    """Id of the last TaskTransition folded into the rollups."""
+    name = models.CharField(max_length=50, primary_key=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.position}"
+
+@receiver(post_delete, sender=Task)
+def task_deleted_handler(sender, instance, **kwargs):
+    """Signal handler to take deleted tasks out of the statistics counters"""
+    counters.move(counters.bucket(instance), None)
+    versions.touch(instance.company_id)
 
 @receiver(post_save, sender=Task)
 def task_created_handler(sender, instance, created, **kwargs):
-    """Signal handler to send email notification when task is created"""
+    """Signal handler to queue the email notification of a created task in its transaction"""
     if created:
-        from notifications.tasks import send_task_notification_email
-        send_task_notification_email.apply_async(
-            args=[instance.id, instance.assigned_to.id],
-            countdown=10
-        )
\ No newline at end of file
+        from notifications.dispatch import queue_task_notifications
+        queue_task_notifications([instance])
\ No newline at end of file
@@ -0,0 +1,174 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Seek-based pagination for a company's tasks.
+
+    The cursor is an opaque token holding the company id, the ordering and
+    the ordering values of the last row served. The next page is fetched
+    with a ``WHERE (created_at, id) < (...)`` seek inside the company, so
+    deep pages cost the same as the first one and no COUNT(*) is issued.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.model = queryset.model
+        self.company_id = request.user.company_id
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.seek_filter(position))
+
+        # Fetch one extra row to learn whether a next page exists.
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_ordering(self, request, queryset, view):
+        """The view's ordering filter decides the ordering, as with DRF's CursorPagination."""
+        for backend in getattr(view, 'filter_backends', ()):
+            if hasattr(backend, 'get_ordering'):
+                return tuple(backend().get_ordering(request, queryset, view))
+        return self.ordering
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        url = self.request.build_absolute_uri()
+        cursor = self.encode_cursor(self.page[-1])
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def seek_filter(self, position):
+        """Expand a row-value comparison into an OR of prefix-equal terms."""
+        condition = Q()
+        prefix = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= prefix & Q(**{f'{name}__{lookup}': value})
+            prefix &= Q(**{name: value})
+        return condition
+
+    def encode_cursor(self, obj):
+        position = []
+        for field in self.ordering:
+            value = getattr(obj, field.lstrip('-'))
+            if isinstance(value, (datetime, date)):
+                value = value.isoformat()
+            position.append(value)
+        payload = json.dumps(
+            {'c': self.company_id, 'o': ','.join(self.ordering), 'p': position}, separators=(',', ':')
+        )
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            position = payload['p']
+            # Cursors from before orderings were selectable carry no 'o'.
+            ordering = payload.get('o', ','.join(type(self).ordering))
+            if (payload['c'] != self.company_id or ordering != ','.join(self.ordering)
+                    or len(position) != len(self.ordering)):
+                raise ValueError
+            return [
+                self.to_python(field.lstrip('-'), value)
+                for field, value in zip(self.ordering, position)
+            ]
+        except (TypeError, ValueError, KeyError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def to_python(self, name, value):
+        try:
+            field = self.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # Annotated ordering values (e.g. a search rank) are stored as-is.
+            return value
+        return field.to_python(value)
+
+
+class SearchPagination(KeysetPagination):
+    """Keyset pagination over search results, best match first."""
+    ordering = ('-rank', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        return self.ordering
+
+
+class TaskPagination(PageNumberPagination):
+    """
+    Page-number pagination with an opt-in keyset mode.
+
+    Clients switch to keyset mode with ``?pagination=cursor`` on the first
+    request and then simply follow the ``next`` links, which carry the
+    ``cursor`` parameter.
+    """
+    keyset_class = KeysetPagination
+    mode_query_param = 'pagination'
+    keyset_mode = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.keyset_requested(request):
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def keyset_requested(self, request):
+        params = request.query_params
+        return (
+            params.get(self.mode_query_param) == self.keyset_mode
+            or self.keyset_class.cursor_query_param in params
+        )
@@ -9,4 +9,4 @@ class SameCompanyPermission(permissions.BasePermission):
         return request.user and request.user.is_authenticated and request.user.company
 
     def has_object_permission(self, request, view, obj):
-        return obj.company == request.user.company
+        return obj.company_id == request.user.company_id
@@ -0,0 +1,129 @@
+"""
+Per-company sequence numbers and replay log for WebSocket task events.
+
+Every ``tasks_changed`` event sent to a company group is first appended to
+that company's log, which assigns it the next sequence number. The log
+keeps the last ``TASK_REPLAY_LOG_SIZE`` events, so a client reconnecting
+with ``?since=<seq>`` is sent just the events it missed, or told to
+resync over REST when they have already been trimmed.
+
+``TASK_REPLAY_LOG = 'redis'`` (the default) keeps the log in a Redis
+stream shared by all processes; ``'local'`` keeps it in process memory,
+which is only correct with a single server process (development, the
+in-memory channel layer).
+"""
+import json
+import logging
+import threading
+from collections import deque
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+TASK_REPLAY_LOG_SIZE = getattr(settings, 'TASK_REPLAY_LOG_SIZE', 1000)
+
+
+class Unavailable(Exception):
+    """The log could not be read; clients should resync."""
+
+
+class RedisReplayLog:
+    """
+    A capped Redis stream per company, with entry ids ``<seq>-0``.
+
+    The counter increment and the append run in one Lua script, so
+    sequence numbers are gap-free and in stream order across processes.
+    """
+    APPEND = """
+    local seq = redis.call('INCR', KEYS[1])
+    redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[2], seq .. '-0', 'changes', ARGV[1])
+    return seq
+    """
+
+    def __init__(self, url, size):
+        import redis
+
+        self.size = size
+        self.client = redis.Redis.from_url(url)
+        self.append_script = self.client.register_script(self.APPEND)
+
+    def keys(self, company_id):
+        return [f'tasks:replay:{company_id}:seq', f'tasks:replay:{company_id}:log']
+
+    def append(self, company_id, changes):
+        return int(self.append_script(keys=self.keys(company_id), args=[json.dumps(changes), self.size]))
+
+    def last(self, company_id):
+        try:
+            return int(self.client.get(self.keys(company_id)[0]) or 0)
+        except Exception as error:
+            raise Unavailable from error
+
+    def since(self, company_id, seq):
+        """``(current_seq, [(seq, changes), ...])``, or ``(current_seq, None)`` if ``seq`` was trimmed."""
+        seq_key, log_key = self.keys(company_id)
+        try:
+            with self.client.pipeline(transaction=True) as pipe:
+                current, entries = pipe.get(seq_key).xrange(log_key, min=f'{seq + 1}-0').execute()
+        except Exception as error:
+            raise Unavailable from error
+        current = int(current or 0)
+        events = [(int(entry_id.split(b'-')[0]), json.loads(fields[b'changes'])) for entry_id, fields in entries]
+        return current, check(seq, current, events)
+
+
+class LocalReplayLog:
+    """In-process equivalent of RedisReplayLog, for a single server process."""
+
+    def __init__(self, size):
+        self.size = size
+        self._lock = threading.Lock()
+        self._seqs = {}
+        self._logs = {}
+
+    def append(self, company_id, changes):
+        with self._lock:
+            seq = self._seqs.get(company_id, 0) + 1
+            self._seqs[company_id] = seq
+            self._logs.setdefault(company_id, deque(maxlen=self.size)).append((seq, changes))
+            return seq
+
+    def last(self, company_id):
+        with self._lock:
+            return self._seqs.get(company_id, 0)
+
+    def since(self, company_id, seq):
+        with self._lock:
+            current = self._seqs.get(company_id, 0)
+            events = [event for event in self._logs.get(company_id, ()) if event[0] > seq]
+        return current, check(seq, current, events)
+
+
+def check(seq, current, events):
+    """The missed ``events``, or None when some of them are no longer in the log."""
+    if seq > current:
+        # The client saw a log that has since been lost (e.g. Redis flushed).
+        return None
+    expected = current - seq
+    if len(events) != expected:
+        return None
+    return events
+
+
+def build_log():
+    if getattr(settings, 'TASK_REPLAY_LOG', 'redis') == 'local':
+        return LocalReplayLog(TASK_REPLAY_LOG_SIZE)
+    return RedisReplayLog(settings.REDIS_URL, TASK_REPLAY_LOG_SIZE)
+
+
+def append(company_id, changes):
+    """Log ``changes`` for the company and return their sequence number, or None on failure."""
+    try:
+        return log.append(company_id, changes)
+    except Exception:
+        logger.warning('Task replay log unavailable; sending company %s changes unsequenced', company_id, exc_info=True)
+        return None
+
+
+log = build_log()
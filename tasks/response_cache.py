@@ -0,0 +1,135 @@
+"""
+Per-tenant cache of TaskViewSet read responses.
+
+Entries are keyed by company, endpoint and full request URL (plus the
+user for per-user endpoints) and remember the company's generation, the
+pair of version tokens from :mod:`tasks.versions` that every committed
+task or member write replaces. An entry is served only while its
+generation is current and it is younger than ``RESPONSE_CACHE_TTL``, so
+a write invalidates every cached page of its tenant at once without
+deleting keys.
+
+Hits are answered from a small in-process LRU first and from Redis next;
+either way the only round trip is reading the generation.
+
+Endpoints that tolerate slightly old data (``statistics``) are
+stampede-protected: when their entry is outdated, one worker takes a
+short lock and recomputes it while the others keep serving the old value.
+"""
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+from task_manager.caching import LocalTTLCache
+from . import versions
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_TTL = getattr(settings, 'RESPONSE_CACHE_TTL', 300)
+# How long an outdated entry may still be served while it is recomputed.
+RESPONSE_CACHE_STALE_TTL = getattr(settings, 'RESPONSE_CACHE_STALE_TTL', 600)
+RESPONSE_CACHE_LOCK_TIMEOUT = getattr(settings, 'RESPONSE_CACHE_LOCK_TIMEOUT', 30)
+
+local_responses = LocalTTLCache(
+    maxsize=getattr(settings, 'RESPONSE_CACHE_LOCAL_SIZE', 1024),
+    ttl=getattr(settings, 'RESPONSE_CACHE_LOCAL_TTL', 30),
+)
+
+
+def generation(tokens):
+    return ':'.join(tokens[scope][0] for scope in versions.SCOPES)
+
+
+def response_key(request, endpoint, per_user=False):
+    parts = [request.build_absolute_uri()]
+    if per_user:
+        parts.append(str(request.user.pk))
+    digest = hashlib.md5('\0'.join(parts).encode(), usedforsecurity=False).hexdigest()
+    return f'tasks:response:{request.user.company_id}:{endpoint}:{digest}'
+
+
+def cached_response(request, endpoint, tokens, compute, per_user=False, serve_stale=False):
+    """
+    Serve ``endpoint`` from the cache, or ``compute()`` it and cache a 200.
+
+    ``tokens`` are the company's current version tokens; without them
+    (cache down) every request is computed.
+    """
+    if tokens is None:
+        return compute()
+    current = generation(tokens)
+    key = response_key(request, endpoint, per_user)
+
+    entry = local_responses.get(key)
+    if not is_fresh(entry, current):
+        entry = cache_get(key) or entry
+        if is_fresh(entry, current):
+            local_responses.set(key, entry)
+    if is_fresh(entry, current):
+        return Response(entry['data'])
+
+    lock_key = f'{key}:lock'
+    if serve_stale and entry is not None:
+        if not cache_add(lock_key):
+            # Another worker is recomputing; don't pile onto the database.
+            response = Response(entry['data'])
+            # The body predates the current generation, so it must not be
+            # tagged with validators built from it.
+            response.stale = True
+            return response
+        try:
+            return store(key, current, compute())
+        finally:
+            cache_delete(lock_key)
+    return store(key, current, compute())
+
+
+def is_fresh(entry, current):
+    return (
+        entry is not None and entry['generation'] == current
+        and time.time() - entry['computed_at'] < RESPONSE_CACHE_TTL
+    )
+
+
+def store(key, current, response):
+    if response.status_code == 200:
+        entry = {'generation': current, 'computed_at': time.time(), 'data': response.data}
+        local_responses.set(key, entry)
+        cache_set(key, entry, RESPONSE_CACHE_TTL + RESPONSE_CACHE_STALE_TTL)
+    return response
+
+
+# Redis being unreachable must degrade to computing responses, not errors.
+
+def cache_get(key):
+    try:
+        return cache.get(key)
+    except Exception:
+        logger.warning('Response cache unavailable; computing the response', exc_info=True)
+        return None
+
+
+def cache_set(key, value, timeout):
+    try:
+        cache.set(key, value, timeout)
+    except Exception:
+        logger.warning('Response cache unavailable; not caching %s', key, exc_info=True)
+
+
+def cache_add(key):
+    try:
+        return cache.add(key, 1, RESPONSE_CACHE_LOCK_TIMEOUT)
+    except Exception:
+        logger.warning('Response cache unavailable; recomputing without a lock', exc_info=True)
+        return True
+
+
+def cache_delete(key):
+    try:
+        cache.delete(key)
+    except Exception:
+        logger.warning('Response cache unavailable; could not release %s', key, exc_info=True)
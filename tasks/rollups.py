@@ -0,0 +1,138 @@
+"""
+Hourly and daily per-company rollups of the TaskTransition log.
+
+``update_rollups()`` (run by Celery beat) folds transitions with an id
+above the stored watermark into TaskRollup rows, one batch per
+transaction, and advances the watermark in that same transaction, so
+every transition is counted exactly once. Transitions newer than
+``TASK_ROLLUP_LAG`` seconds are left for the next run: a slow
+transaction may still commit a lower id, and the watermark must not move
+past it.
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from .models import TaskRollup, TaskTransition, RollupWatermark
+
+WATERMARK = 'task_rollups'
+BATCH_SIZE = 50000
+TRUNCATE = {'hour': TruncHour, 'day': TruncDay}
+MAX_PERIODS = {'hour': 14 * 24, 'day': 366}
+METRICS = ('created', 'completed', 'cancelled', 'transitions')
+
+AGGREGATES = {
+    'created': Count('id', filter=Q(from_status='')),
+    'completed': Count('id', filter=Q(to_status='done')),
+    'cancelled': Count('id', filter=Q(to_status='cancelled')),
+    'transitions': Count('id', filter=~Q(from_status='')),
+}
+
+
+def update_rollups(batch_size=BATCH_SIZE, lag=None):
+    """Fold all settled transitions into the rollups; returns how many were processed."""
+    if lag is None:
+        lag = getattr(settings, 'TASK_ROLLUP_LAG', 60)
+    total = 0
+    while True:
+        processed = process_batch(batch_size, timezone.now() - timedelta(seconds=lag))
+        total += processed
+        if processed < batch_size:
+            return total
+
+
+def process_batch(batch_size, cutoff):
+    with transaction.atomic():
+        watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=WATERMARK)
+        pending = TaskTransition.objects.filter(id__gt=watermark.position).order_by('id')
+
+        last_id = None
+        processed = 0
+        for pk, at in pending.values_list('id', 'at')[:batch_size]:
+            if at >= cutoff:
+                break
+            last_id = pk
+            processed += 1
+        if last_id is None:
+            return 0
+
+        batch = TaskTransition.objects.filter(id__gt=watermark.position, id__lte=last_id)
+        for granularity in TRUNCATE:
+            merge(granularity, aggregate(batch, granularity))
+        watermark.position = last_id
+        watermark.save()
+    return processed
+
+
+def aggregate(transitions, granularity):
+    rows = (
+        transitions.order_by()
+        .annotate(period=TRUNCATE[granularity]('at'))
+        .values('company_id', 'period')
+        .annotate(**AGGREGATES)
+    )
+    return {(row['company_id'], row['period']): row for row in rows}
+
+
+def merge(granularity, totals):
+    """Add ``{(company_id, period_start): counts}`` to the stored rollups."""
+    if not totals:
+        return
+    existing = {
+        (rollup.company_id, rollup.period_start): rollup
+        for rollup in TaskRollup.objects.filter(
+            granularity=granularity,
+            company_id__in={company_id for company_id, _ in totals},
+            period_start__in={period for _, period in totals},
+        )
+    }
+    updated, created = [], []
+    for key, counts in totals.items():
+        rollup = existing.get(key)
+        if rollup is None:
+            company_id, period = key
+            rollup = TaskRollup(company_id=company_id, granularity=granularity, period_start=period)
+            created.append(rollup)
+        else:
+            updated.append(rollup)
+        for metric in METRICS:
+            setattr(rollup, metric, getattr(rollup, metric) + counts[metric])
+    TaskRollup.objects.bulk_update(updated, METRICS, batch_size=1000)
+    TaskRollup.objects.bulk_create(created, batch_size=1000)
+
+
+def period_starts(granularity, periods, now=None):
+    """Start of the last ``periods`` hours or local days up to now, oldest first."""
+    now = timezone.localtime(now)
+    if granularity == 'hour':
+        current = now.replace(minute=0, second=0, microsecond=0)
+        return [current - timedelta(hours=offset) for offset in range(periods - 1, -1, -1)]
+    today = now.date()
+    return [
+        timezone.make_aware(datetime.combine(today - timedelta(days=offset), time.min))
+        for offset in range(periods - 1, -1, -1)
+    ]
+
+
+def trend(company, granularity='day', periods=30):
+    """Zero-filled series of the company's rollups for the last ``periods`` periods."""
+    starts = period_starts(granularity, periods)
+    stored = {
+        row['period_start']: row
+        for row in TaskRollup.objects.filter(
+            company=company, granularity=granularity, period_start__gte=starts[0]
+        ).values('period_start', *METRICS)
+    }
+    series = []
+    for start in starts:
+        row = stored.get(start, {})
+        series.append({'period': start.isoformat(), **{metric: row.get(metric, 0) for metric in METRICS}})
+    return series
+
+
+def last_update():
+    return RollupWatermark.objects.filter(name=WATERMARK).values_list('updated_at', flat=True).first()
@@ -0,0 +1,39 @@
+"""
+Full-text search over a company's tasks.
+
+On PostgreSQL the query is matched against ``Task.search_vector`` (title
+weighted above description) through the (company_id, search_vector) GIN
+index, ranked with ``ts_rank`` and highlighted with ``ts_headline``.
+Other backends fall back to case-insensitive substring matching with a
+constant rank, which is only meant for development databases.
+"""
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import Cast
+
+SEARCH_CONFIG = 'english'
+HIGHLIGHT = {'start_sel': '<mark>', 'stop_sel': '</mark>'}
+
+
+def search_tasks(queryset, text):
+    """Filter ``queryset`` to tasks matching ``text``, annotated with rank and highlights."""
+    if connection.vendor != 'postgresql':
+        return queryset.filter(Q(title__icontains=text) | Q(description__icontains=text)).annotate(
+            rank=Value(0.0, output_field=FloatField()),
+            title_highlight=F('title'),
+            description_highlight=F('description'),
+        )
+
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+    return queryset.filter(search_vector=query).annotate(
+        # ts_rank returns real; as double precision the rank survives the
+        # round trip through a pagination cursor and compares equal again.
+        rank=Cast(SearchRank(F('search_vector'), query), FloatField()),
+        title_highlight=SearchHeadline(
+            'title', query, config=SEARCH_CONFIG, highlight_all=True, **HIGHLIGHT
+        ),
+        description_highlight=SearchHeadline(
+            'description', query, config=SEARCH_CONFIG, max_fragments=2, **HIGHLIGHT
+        ),
+    )
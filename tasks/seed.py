@@ -0,0 +1,74 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+
+from accounts.models import User, Company
+from .models import Task
+
+
+def seed_tasks(companies=10, users_per_company=20, tasks=10000, skew=1.0,
+               prefix='seed', batch_size=5000, rng=None):
+    """
+    Bulk-insert synthetic companies, users and tasks.
+
+    Tasks are spread across companies with a Zipf-like weight of
+    ``1 / rank ** skew``, so ``skew=0`` gives evenly sized tenants and larger
+    values concentrate rows in the first few. Rows are written with
+    ``bulk_create`` and bypass ``Task.save()`` and its signals. Returns the
+    created companies, largest tenant first.
+    """
+    rng = rng or random.Random(0)
+    password = make_password(None)
+    now = timezone.now()
+
+    company_objs = Company.objects.bulk_create([
+        Company(name=f'{prefix}-company-{i}') for i in range(companies)
+    ])
+    user_objs = User.objects.bulk_create([
+        User(
+            username=f'{prefix}-{company.pk}-{j}',
+            email=f'{prefix}-{company.pk}-{j}@example.com',
+            password=password,
+            company=company,
+        )
+        for company in company_objs
+        for j in range(users_per_company)
+    ])
+    users_by_company = {}
+    for user in user_objs:
+        users_by_company.setdefault(user.company_id, []).append(user)
+
+    weights = [1 / (rank + 1) ** skew for rank in range(companies)]
+    statuses = [choice for choice, _ in Task.STATUS_CHOICES]
+    batch, created_at = [], []
+    for i in range(tasks):
+        company = rng.choices(company_objs, weights)[0]
+        members = users_by_company[company.pk]
+        batch.append(Task(
+            title=f'{prefix} task {i}',
+            description='Synthetic task',
+            status=rng.choice(statuses),
+            assigned_to=rng.choice(members),
+            created_by=rng.choice(members),
+            company=company,
+        ))
+        # Spread over the last year instead of the insert time.
+        created_at.append(now - timedelta(minutes=rng.randrange(525600)))
+        if len(batch) >= batch_size:
+            insert_tasks(batch, created_at)
+            batch, created_at = [], []
+    if batch:
+        insert_tasks(batch, created_at)
+
+    return company_objs
+
+
+def insert_tasks(tasks, created_at):
+    # bulk_create stamps auto_now_add fields with the insert time; bulk_update
+    # writes the given values as they are.
+    Task.objects.bulk_create(tasks)
+    for task, moment in zip(tasks, created_at):
+        task.created_at = moment
+    Task.objects.bulk_update(tasks, ['created_at'], batch_size=1000)
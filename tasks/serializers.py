@@ -1,8 +1,29 @@
 from rest_framework import serializers
+from task_manager.metrics import TimedSerializerMixin
 from .models import Task
 from accounts.serializers import UserSerializer
 
-class TaskSerializer(serializers.ModelSerializer):
+def attach_company(tasks, company):
+    """
+    Point the users of already-loaded tasks at the request's company.
+
+    Every user on a tenant's task belongs to that tenant, so the single
+    Company object loaded for the request is reused instead of lazily
+    fetching it once per nested UserSerializer.
+    """
+    if isinstance(tasks, Task):
+        tasks = [tasks]
+    relations = [Task._meta.get_field('assigned_to'), Task._meta.get_field('created_by')]
+    for task in tasks:
+        for relation in relations:
+            # Users left out of a sparse fieldset are not loaded; don't fetch them.
+            if not relation.is_cached(task):
+                continue
+            user = relation.get_cached_value(task)
+            if user.company_id == company.pk:
+                user.company = company
+
+class TaskSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     assigned_to_detail = UserSerializer(source='assigned_to', read_only=True)
     created_by_detail = UserSerializer(source='created_by', read_only=True)
 
@@ -13,11 +34,29 @@ class TaskSerializer(serializers.ModelSerializer):
                  'company', 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_by', 'company', 'created_at', 'updated_at']
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Sparse fieldsets (?fields=): unselected fields, including the
+        # nested user serializers, are never evaluated.
+        selected = self.context.get('fields')
+        if selected is not None:
+            for name in set(self.fields) - set(selected):
+                self.fields.pop(name)
+
     def create(self, validated_data):
         validated_data['created_by'] = self.context['request'].user
         return super().create(validated_data)
 
-class TaskCreateSerializer(serializers.ModelSerializer):
+class TaskSearchSerializer(TaskSerializer):
+    """A search hit: the task plus its rank and <mark>-highlighted snippets."""
+    rank = serializers.FloatField(read_only=True)
+    title_highlight = serializers.CharField(read_only=True)
+    description_highlight = serializers.CharField(read_only=True)
+
+    class Meta(TaskSerializer.Meta):
+        fields = TaskSerializer.Meta.fields + ['rank', 'title_highlight', 'description_highlight']
+
+class TaskCreateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Task
         fields = ['title', 'description', 'status', 'assigned_to']
@@ -33,3 +72,17 @@ class TaskCreateSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         validated_data['created_by'] = self.context['request'].user
         return super().create(validated_data)
+
+class TaskBulkItemSerializer(serializers.ModelSerializer):
+    """
+    One task of a bulk write.
+
+    ``assigned_to`` is taken as a plain id so that tenant membership can be
+    checked for the whole batch in one query instead of one per item.
+    """
+    id = serializers.IntegerField(required=False)
+    assigned_to = serializers.IntegerField()
+
+    class Meta:
+        model = Task
+        fields = ['id', 'title', 'description', 'status', 'assigned_to']
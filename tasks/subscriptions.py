@@ -0,0 +1,116 @@
+"""
+What a TaskConsumer socket wants to receive.
+
+By default a socket gets every change in its company. A subscription can
+narrow that to the user's own tasks (``assigned``; the socket then listens
+on its ``user_<id>`` group instead of the company group, so other users'
+changes never reach it), to some ``statuses`` or to some ``task_ids``, and
+can ask for ``compact`` payloads that carry only the changed fields of an
+updated task.
+
+A change matches a status or assignee filter if the task had that value
+before the change or has it after, so subscribers also learn about tasks
+leaving their view.
+"""
+
+PAYLOADS = ('full', 'compact')
+STATUSES = ('todo', 'in_progress', 'done', 'cancelled')
+# Always kept in compact payloads of updated tasks.
+COMPACT_FIELDS = ('id', 'updated_at')
+
+
+class Subscription:
+
+    def __init__(self, assigned=False, statuses=None, task_ids=None, payload='full'):
+        self.assigned = assigned
+        self.statuses = statuses
+        self.task_ids = task_ids
+        self.payload = payload
+
+    @classmethod
+    def parse(cls, data):
+        """Build a subscription from a ``subscribe`` message; ValueError describes what is wrong."""
+        assigned = data.get('assigned', False)
+        if not isinstance(assigned, bool):
+            raise ValueError("'assigned' must be true or false")
+
+        statuses = data.get('statuses')
+        if statuses is not None:
+            if not isinstance(statuses, list) or not set(statuses) <= set(STATUSES):
+                raise ValueError(f"'statuses' must be a list of: {', '.join(STATUSES)}")
+            statuses = frozenset(statuses)
+
+        task_ids = data.get('task_ids')
+        if task_ids is not None:
+            if not isinstance(task_ids, list) or not all(
+                isinstance(pk, int) and not isinstance(pk, bool) for pk in task_ids
+            ):
+                raise ValueError("'task_ids' must be a list of task ids")
+            task_ids = frozenset(task_ids)
+
+        payload = data.get('payload', 'full')
+        if payload not in PAYLOADS:
+            raise ValueError(f"'payload' must be one of: {', '.join(PAYLOADS)}")
+        return cls(assigned, statuses, task_ids, payload)
+
+    @classmethod
+    def from_query(cls, params):
+        """The same, from connection query parameters (``?assigned=1&statuses=todo,done``)."""
+        data = {}
+        if 'assigned' in params:
+            data['assigned'] = params['assigned'][0] in ('1', 'true')
+        if 'statuses' in params:
+            data['statuses'] = [item for item in params['statuses'][0].split(',') if item]
+        if 'task_ids' in params:
+            try:
+                data['task_ids'] = [int(item) for item in params['task_ids'][0].split(',') if item]
+            except ValueError:
+                raise ValueError("'task_ids' must be a comma-separated list of task ids")
+        if 'payload' in params:
+            data['payload'] = params['payload'][0]
+        return cls.parse(data)
+
+    def as_dict(self):
+        return {
+            'assigned': self.assigned,
+            'statuses': None if self.statuses is None else sorted(self.statuses),
+            'task_ids': None if self.task_ids is None else sorted(self.task_ids),
+            'payload': self.payload,
+        }
+
+    def group(self, user):
+        if self.assigned:
+            return f"user_{user.pk}"
+        return f"company_{user.company_id}"
+
+    def select(self, items, user_id):
+        """The ``tasks_changed`` items this subscription wants, rendered for it."""
+        return [self.render(item) for item in items if self.matches(item, user_id)]
+
+    def matches(self, item, user_id):
+        task = item['task']
+        previous = item.get('previous') or {}
+        if self.assigned and user_id not in assignees(item):
+            return False
+        if self.statuses is not None and not (
+            task.get('status') in self.statuses or previous.get('status') in self.statuses
+        ):
+            return False
+        if self.task_ids is not None and task['id'] not in self.task_ids:
+            return False
+        return True
+
+    def render(self, item):
+        if self.payload == 'full':
+            return item
+        fields = item.get('fields')
+        task = item['task']
+        if item['action'] == 'updated' and fields is not None:
+            task = {name: task[name] for name in (*COMPACT_FIELDS, *fields) if name in task}
+        return {'action': item['action'], 'fields': fields, 'task': task}
+
+
+def assignees(item):
+    """Users a change concerns: the task's assignee before and after it."""
+    previous = item.get('previous') or {}
+    return {item['task'].get('assigned_to'), previous.get('assigned_to')} - {None}
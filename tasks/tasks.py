@@ -0,0 +1,15 @@
+from celery import shared_task
+import logging
+
+from .rollups import update_rollups
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def update_task_rollups():
+    """Fold new task transitions into the hourly and daily rollups (run by Celery beat)"""
+    processed = update_rollups()
+    if processed:
+        logger.info(f"Rolled up {processed} task transition(s)")
+    return f"{processed} task transition(s) rolled up"
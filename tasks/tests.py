@@ -1,3 +1,1007 @@
-from django.test import TestCase
+import re
+from datetime import datetime, time as dt_time, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import httpx
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.http import StreamingHttpResponse
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.cache import local_users
+from accounts.models import Company, User
+from notifications.models import NotificationOutbox
+from task_manager import db_router
+from .consumers import TaskConsumer
+from .external import ExternalTaskFetcher
+from .models import RollupWatermark, Task, TaskCounter, TaskTransition
+from .response_cache import local_responses
+from . import analytics, broadcast, bulk, flow, replay, rollups, versions
+from .seed import seed_tasks
+
+# Plan fragments that mean the tasks table is being read in full.
+SEQUENTIAL_SCANS = {
+    'postgresql': re.compile(r'Seq Scan on tasks_task\b'),
+    'sqlite': re.compile(r'\bSCAN tasks_task\b(?! USING)'),
+}
+
+
+class TenantTestCase(TestCase):
+    """A company with two members, and helpers to create their tasks."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Acme')
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pw', company=cls.company)
+        cls.bob = User.objects.create_user('bob', 'bob@example.com', 'pw', company=cls.company)
+
+    def setUp(self):
+        self.clear_caches()
+
+    def clear_caches(self):
+        # Cached responses and users would outlive each test's rollback.
+        cache.clear()
+        local_responses.clear()
+        local_users.clear()
+
+    def create_task(self, **kwargs):
+        kwargs.setdefault('title', 'task')
+        kwargs.setdefault('assigned_to', self.bob)
+        return Task.objects.create(company=self.company, created_by=self.alice, **kwargs)
+
+
+class TaskCounterTests(TenantTestCase):
+
+    def counts(self):
+        return dict(TaskCounter.objects.filter(company=self.company).values_list('status', 'count'))
+
+    def test_saves_of_stale_instances_move_the_stored_bucket(self):
+        task = self.create_task()
+        first, second = Task.objects.get(pk=task.pk), Task.objects.get(pk=task.pk)
+        first.status = 'done'
+        first.save()
+        second.status = 'in_progress'
+        second.save()
+
+        self.assertEqual(self.counts(), {'todo': 0, 'done': 0, 'in_progress': 1})
+        self.assertEqual(
+            list(TaskTransition.objects.filter(task=task).order_by('id').values_list('from_status', 'to_status')),
+            [('', 'todo'), ('todo', 'done'), ('done', 'in_progress')],
+        )
+        call_command('task_counters', stdout=StringIO())
+
+    def test_verify_reports_negative_buckets(self):
+        TaskCounter.objects.create(company=self.company, status='done', assigned_to=self.bob, count=-1)
+        with self.assertRaisesMessage(CommandError, '1 counter bucket(s) out of sync'):
+            call_command('task_counters', stdout=StringIO())
+
+
+class TaskViewSetTests(TenantTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def outsider(self):
+        return User.objects.create_user('mallory', 'mallory@example.com', 'pw', company=Company.objects.create(name='Other'))
+
+    def counts(self):
+        rows = TaskCounter.objects.filter(company=self.company).values_list('status', 'assigned_to', 'count')
+        return {(status, assigned_to): count for status, assigned_to, count in rows}
+
+    def test_bulk_delete_reports_missing_ids_like_field_errors(self):
+        task = self.create_task()
+        other = Task.objects.create(
+            title='other', company=Company.objects.create(name='Other'), created_by=self.alice, assigned_to=self.bob
+        )
+
+        response = self.client.post('/api/tasks/bulk_delete/', [task.pk, other.pk, 0], format='json')
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.data, {
+            'deleted': [task.pk],
+            'errors': [
+                {'id': other.pk, 'errors': {'detail': ['Not found.']}},
+                {'id': 0, 'errors': {'detail': ['Not found.']}},
+            ],
+        })
+        self.assertTrue(Task.objects.filter(pk=other.pk).exists())
+
+    def test_bulk_delete_rejects_non_integer_ids(self):
+        task = self.create_task()
+        response = self.client.post('/api/tasks/bulk_delete/', [True], format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(Task.objects.filter(pk=task.pk).exists())
+
+    def test_bulk_create_writes_the_valid_items_and_reports_the_rest_by_index(self):
+        mallory = self.outsider()
+        items = [
+            {'title': 'first', 'assigned_to': self.bob.pk},
+            {'assigned_to': self.bob.pk},
+            {'title': 'foreign', 'assigned_to': mallory.pk},
+            {'title': 'second', 'status': 'done', 'assigned_to': self.alice.pk},
+        ]
+        with mock.patch('tasks.broadcast.outbox') as outbox, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/tasks/bulk_create/', items, format='json')
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([task['title'] for task in response.data['created']], ['first', 'second'])
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2])
+        self.assertIn('title', response.data['errors'][0]['errors'])
+        self.assertEqual(response.data['errors'][1]['errors'], {'assigned_to': [bulk.WRONG_COMPANY]})
+
+        created = set(Task.objects.filter(company=self.company).values_list('pk', flat=True))
+        self.assertEqual(len(created), 2)
+        self.assertEqual(self.counts(), {('todo', self.bob.pk): 1, ('done', self.alice.pk): 1})
+        self.assertEqual(set(NotificationOutbox.objects.values_list('task_id', flat=True)), created)
+        (changes,), _ = outbox.add_many.call_args
+        self.assertEqual({change['action'] for change in changes.values()}, {'created'})
+        self.assertEqual({task_id for _, task_id in changes}, created)
+
+    def test_bulk_create_with_no_valid_items_writes_nothing(self):
+        response = self.client.post('/api/tasks/bulk_create/', [{'title': 'unassigned'}], format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['created'], [])
+        self.assertFalse(Task.objects.exists())
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+    def test_bulk_update_applies_each_task_once_and_reports_the_rest_by_index(self):
+        first, second = self.create_task(), self.create_task()
+        mallory = self.outsider()
+        foreign = Task.objects.create(title='foreign', company=mallory.company, created_by=mallory, assigned_to=mallory)
+        items = [
+            {'id': first.pk, 'status': 'done'},
+            {'id': first.pk, 'title': 'again'},
+            {'id': foreign.pk, 'title': 'mine now'},
+            {'title': 'no id'},
+            {'id': second.pk, 'assigned_to': mallory.pk},
+            {'id': second.pk, 'assigned_to': self.alice.pk},
+        ]
+        with mock.patch('tasks.broadcast.outbox') as outbox, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch('/api/tasks/bulk_update/', items, format='json')
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([task['id'] for task in response.data['updated']], [first.pk, second.pk])
+        self.assertEqual(response.data['errors'], [
+            {'index': 1, 'errors': {'id': ['Duplicate id in batch.']}},
+            {'index': 2, 'errors': {'id': ['Not found.']}},
+            {'index': 3, 'errors': {'id': ['This field is required.']}},
+            {'index': 4, 'errors': {'assigned_to': [bulk.WRONG_COMPANY]}},
+        ])
+        first.refresh_from_db()
+        foreign.refresh_from_db()
+        self.assertEqual((first.title, first.status), ('task', 'done'))
+        self.assertEqual(foreign.title, 'foreign')
+        self.assertEqual(Task.objects.get(pk=second.pk).assigned_to, self.alice)
+        self.assertEqual(self.counts(), {('todo', self.bob.pk): 0, ('done', self.bob.pk): 1, ('todo', self.alice.pk): 1})
+        self.assertEqual(
+            list(TaskTransition.objects.filter(task=first).order_by('id').values_list('from_status', 'to_status')),
+            [('', 'todo'), ('todo', 'done')],
+        )
+        (changes,), _ = outbox.add_many.call_args
+        self.assertEqual(set(changes), {(self.company.pk, first.pk), (self.company.pk, second.pk)})
+        self.assertEqual({change['action'] for change in changes.values()}, {'updated'})
+
+    def test_exports_stream_asynchronously_only_under_asgi(self):
+        self.create_task(title='exported')
+        response = self.client.get('/api/tasks/export/')
+        self.assertFalse(response.is_async)
+        self.assertIn(b'"exported"', b''.join(response.streaming_content))
+
+        async def fetch():
+            response = await AsyncClient().get(
+                '/api/tasks/export/', {'output': 'csv'},
+                headers={'Authorization': f'Bearer {AccessToken.for_user(self.alice)}'},
+            )
+            self.assertTrue(response.is_async)
+            return b''.join([chunk async for chunk in response.streaming_content])
+
+        self.assertIn(b'exported', async_to_sync(fetch)())
+
+    def test_delete_broadcasts_the_deletion(self):
+        task = self.create_task()
+        with mock.patch('tasks.broadcast.outbox') as outbox, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f'/api/tasks/{task.pk}/')
+
+        self.assertEqual(response.status_code, 204)
+        (changes,), _ = outbox.add_many.call_args
+        self.assertEqual(changes[(self.company.pk, task.pk)]['action'], 'deleted')
+
+
+class TaskFilterTests(TenantTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for day, (status, assignee) in enumerate(
+            [('todo', self.bob), ('in_progress', self.alice), ('done', self.bob), ('todo', self.alice)], start=1
+        ):
+            task = self.create_task(title=f't{day}', status=status, assigned_to=assignee)
+            Task.objects.filter(pk=task.pk).update(created_at=timezone.make_aware(datetime(2024, 1, day, 12)))
+        Task.objects.create(
+            title='theirs', company=Company.objects.create(name='Other'), created_by=self.bob, assigned_to=self.bob
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def titles(self, **params):
+        response = self.client.get('/api/tasks/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [task['title'] for task in response.data['results']]
+
+    def test_filters_combine(self):
+        self.assertEqual(self.titles(status='todo,done'), ['t4', 't3', 't1'])
+        self.assertEqual(self.titles(status='todo', assigned_to=str(self.bob.pk)), ['t1'])
+        self.assertEqual(self.titles(assigned_to=f'{self.alice.pk},{self.bob.pk}', created_by=str(self.bob.pk)), [])
+        self.assertEqual(self.titles(created_after='2024-01-02', created_before='2024-01-04'), ['t3', 't2'])
+        self.assertEqual(self.titles(created_after='2024-01-03T12:00:00Z', status='todo'), ['t4'])
+
+    def test_orderings(self):
+        self.assertEqual(self.titles(ordering='created_at'), ['t1', 't2', 't3', 't4'])
+        self.assertEqual(self.titles(ordering='status'), ['t3', 't2', 't4', 't1'])
+        self.assertEqual(self.titles(ordering='-status'), ['t1', 't4', 't2', 't3'])
+        self.assertEqual(self.titles(ordering='-status', status='done,in_progress'), ['t2', 't3'])
+
+    def test_cursors_continue_the_filtered_ordering(self):
+        response = self.client.get('/api/tasks/', {
+            'pagination': 'cursor', 'page_size': 1, 'ordering': 'status', 'status': 'todo,in_progress',
+        })
+        second_page = response.data['next']
+        titles = [task['title'] for task in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            titles += [task['title'] for task in response.data['results']]
+        self.assertEqual(titles, ['t2', 't4', 't1'])
+
+        # A cursor only continues the ordering it was made for.
+        response = self.client.get(second_page.replace('ordering=status', 'ordering=created_at'))
+        self.assertEqual(response.status_code, 404)
+
+    def test_malformed_parameters_are_a_400(self):
+        for name, value in (
+            ('status', 'todo,someday'), ('assigned_to', 'bob'), ('created_after', 'yesterday'),
+            ('ordering', 'title'), ('fields', 'title,password'),
+        ):
+            with self.subTest(name=name):
+                response = self.client.get('/api/tasks/', {name: value})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(name, response.data)
+
+    def test_sparse_fields(self):
+        response = self.client.get('/api/tasks/', {'fields': 'id,title', 'ordering': 'created_at'})
+        self.assertEqual(response.data['results'][0], {'id': response.data['results'][0]['id'], 'title': 't1'})
+        self.assertTrue(all(set(task) == {'id', 'title'} for task in response.data['results']))
+
+        task = Task.objects.get(title='t1')
+        response = self.client.get(f'/api/tasks/{task.pk}/', {'fields': 'status,assigned_to_detail'})
+        self.assertEqual(set(response.data), {'status', 'assigned_to_detail'})
+        self.assertEqual(response.data['assigned_to_detail']['username'], 'bob')
+
+
+class QueryBudgetTests(TenantTestCase):
+    """Each read endpoint costs a fixed number of queries, however many tasks it shows."""
+
+    budgets = [
+        ('list', '/api/tasks/', {}, 2),
+        ('list (keyset)', '/api/tasks/', {'pagination': 'cursor', 'page_size': 50}, 1),
+        ('retrieve', '/api/tasks/{pk}/', {}, 2),
+        ('my_tasks', '/api/tasks/my_tasks/', {}, 2),
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.bob)
+
+    def assert_budgets(self):
+        task = Task.objects.filter(assigned_to=self.bob).first()
+        for label, url, params, budget in self.budgets:
+            with self.subTest(label):
+                self.clear_caches()
+                with self.assertNumQueries(budget):
+                    response = self.client.get(url.format(pk=task.pk), params)
+                self.assertEqual(response.status_code, 200)
+
+    def test_one_task(self):
+        self.create_task()
+        self.assert_budgets()
+
+    def test_full_pages_of_tasks_by_many_users(self):
+        users = [self.alice, self.bob] + [
+            User.objects.create_user(f'user{i}', f'user{i}@example.com', 'pw', company=self.company)
+            for i in range(5)
+        ]
+        for i in range(30):
+            Task.objects.create(
+                title=f'task {i}', company=self.company, created_by=users[i % 3],
+                assigned_to=self.bob if i % 2 else users[i % len(users)],
+            )
+        self.assert_budgets()
+
+    def test_repeated_reads_are_answered_from_the_cache(self):
+        self.create_task()
+        self.client.get('/api/tasks/')
+        with self.assertNumQueries(0):
+            self.client.get('/api/tasks/')
+
+
+class ConditionalRequestTests(TenantTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.task = self.create_task()
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def urls(self):
+        return ['/api/tasks/', f'/api/tasks/{self.task.pk}/', '/api/tasks/my_tasks/', '/api/tasks/statistics/']
+
+    def revalidate(self, url, **headers):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'], **headers)
+
+    def test_unchanged_reads_are_answered_with_304(self):
+        for url in self.urls():
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                with self.assertNumQueries(1 if url == self.urls()[1] else 0):
+                    revalidated = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(revalidated.status_code, 304)
+                self.assertEqual(revalidated['ETag'], response['ETag'])
+
+    def test_writes_and_member_changes_change_the_tags(self):
+        def patch_task():
+            self.client.patch(f'/api/tasks/{self.task.pk}/', {'status': 'done'}, format='json')
+
+        def rename_member():
+            self.bob.first_name = 'Bob'
+            self.bob.save()
+
+        for change in (patch_task, rename_member):
+            for url in self.urls():
+                with self.subTest(change=change.__name__, url=url):
+                    etag = self.client.get(url)['ETag']
+                    with self.captureOnCommitCallbacks(execute=True):
+                        change()
+                    self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_switching_company_changes_the_tags(self):
+        etag = self.client.get('/api/tasks/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.company = Company.objects.create(name='Other')
+            self.alice.save()
+
+        response = self.client.get('/api/tasks/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [])
+
+    def test_tags_never_match_for_other_users_or_companies(self):
+        mallory = User.objects.create_user(
+            'mallory', 'mallory@example.com', 'pw', company=Company.objects.create(name='Other')
+        )
+        for url in ('/api/tasks/', '/api/tasks/my_tasks/', '/api/tasks/statistics/'):
+            etag = self.client.get(url)['ETag']
+            for user in (self.bob, mallory):
+                with self.subTest(url=url, user=user.username):
+                    client = APIClient()
+                    client.force_authenticate(user)
+                    self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_if_modified_since_has_one_second_resolution(self):
+        # Last-Modified is truncated to whole seconds, so a client sending
+        # only If-Modified-Since misses a write in the same second; the
+        # ETag does not.
+        with mock.patch.object(versions.time, 'time', return_value=1700000000.25):
+            first = self.client.get('/api/tasks/')
+            with self.captureOnCommitCallbacks(execute=True):
+                self.create_task(title='second')
+        self.assertEqual(first['Last-Modified'], 'Tue, 14 Nov 2023 22:13:20 GMT')
+
+        since_only = self.client.get('/api/tasks/', HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(since_only.status_code, 304)
+        both = self.client.get(
+            '/api/tasks/', HTTP_IF_NONE_MATCH=first['ETag'], HTTP_IF_MODIFIED_SINCE=first['Last-Modified']
+        )
+        self.assertEqual(both.status_code, 200)
+
+
+class RollupTests(TenantTestCase):
+
+    def today(self, granularity='day'):
+        return rollups.trend(self.company, granularity, 1)[0]
+
+    def counts(self, row):
+        return {metric: row[metric] for metric in rollups.METRICS}
+
+    def test_settled_transitions_are_counted_once(self):
+        task = self.create_task()
+        task.status = 'done'
+        task.save()
+        self.create_task(status='cancelled')
+        Task.objects.create(
+            title='theirs', company=Company.objects.create(name='Other'), created_by=self.bob, assigned_to=self.bob
+        )
+
+        self.assertEqual(rollups.update_rollups(batch_size=1, lag=0), 4)
+        self.assertEqual(rollups.update_rollups(lag=0), 0)
+        expected = {'created': 2, 'completed': 1, 'cancelled': 1, 'transitions': 1}
+        self.assertEqual(self.counts(self.today()), expected)
+        self.assertEqual(self.counts(self.today('hour')), expected)
+        self.assertEqual(
+            RollupWatermark.objects.get(name=rollups.WATERMARK).position, TaskTransition.objects.latest('id').pk
+        )
+
+    def test_recent_transitions_wait_for_the_lag(self):
+        self.create_task()
+
+        self.assertEqual(rollups.update_rollups(lag=60), 0)
+        self.assertEqual(self.today()['created'], 0)
+        self.assertEqual(rollups.update_rollups(lag=0), 1)
+        self.assertEqual(self.today()['created'], 1)
+
+    def test_late_transitions_are_added_to_their_own_period(self):
+        task = self.create_task()
+        rollups.update_rollups(lag=0)
+        # Committed after the run, with a time from the day before.
+        TaskTransition.objects.create(
+            company=self.company, task=task, from_status='todo', to_status='done',
+            at=timezone.now() - timedelta(days=1),
+        )
+
+        self.assertEqual(rollups.update_rollups(lag=0), 1)
+        yesterday, today = rollups.trend(self.company, 'day', 2)
+        self.assertEqual((yesterday['completed'], yesterday['created']), (1, 0))
+        self.assertEqual((today['completed'], today['created']), (0, 1))
+
+    def test_trends_validates_its_parameters(self):
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        for params in (
+            {'granularity': 'week'}, {'periods': 'many'}, {'periods': 0}, {'periods': 367},
+            {'granularity': 'hour', 'periods': 14 * 24 + 1},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(client.get('/api/tasks/trends/', params).status_code, 400)
+
+        self.assertEqual(len(client.get('/api/tasks/trends/').data['series']), 30)
+        response = client.get('/api/tasks/trends/', {'granularity': 'hour'})
+        self.assertEqual((response.data['granularity'], len(response.data['series'])), ('hour', 48))
+
+
+class AnalyticsTests(TenantTestCase):
+
+    def created_on(self, day, hour):
+        task = self.create_task()
+        at = timezone.make_aware(datetime.combine(day, dt_time(hour)))
+        TaskTransition.objects.filter(task=task).update(at=at)
+        return task
+
+    def daily(self, since=None):
+        company, = analytics.collect([self.company.pk], since=since)
+        return company['daily_created']
+
+    def test_daily_creation_includes_what_the_rollups_have_not_folded_in(self):
+        today = timezone.localdate()
+        yesterday = today - timedelta(days=1)
+        self.create_task()
+        self.created_on(yesterday, 8)
+        self.assertEqual(self.daily()[today.isoformat()], 1)
+
+        rollups.update_rollups(lag=0)
+        self.create_task()
+        self.created_on(yesterday, 9)
+        daily = self.daily()
+        self.assertEqual((daily[yesterday.isoformat()], daily[today.isoformat()]), (2, 2))
+
+    def test_since_keeps_the_rest_of_its_day(self):
+        yesterday = timezone.localdate() - timedelta(days=1)
+        self.created_on(yesterday, 8)
+        self.created_on(yesterday, 18)
+        rollups.update_rollups(lag=0)
+
+        since = timezone.make_aware(datetime.combine(yesterday, dt_time(12)))
+        self.assertEqual(self.daily(since)[yesterday.isoformat()], 1)
+        out = StringIO()
+        call_command('task_analytics', since=since.isoformat(), stdout=out)
+        self.assertIn(f'{yesterday.isoformat()}: 1 tasks created', out.getvalue())
+
+
+class FlowMetricsTests(TenantTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+        self.now = timezone.now()
+
+    def completed_task(self, assignee, lead_hours, cycle_hours=None, done_days_ago=0):
+        """A task created ``lead_hours`` before it was done, in progress for the last ``cycle_hours``."""
+        task = self.create_task(assigned_to=assignee)
+        done_at = self.now - timedelta(days=done_days_ago)
+        TaskTransition.objects.filter(task=task).update(at=done_at - timedelta(hours=lead_hours))
+        if cycle_hours:
+            moves = [('todo', 'in_progress', cycle_hours), ('in_progress', 'done', 0)]
+        else:
+            moves = [('todo', 'done', 0)]
+        TaskTransition.objects.bulk_create(
+            TaskTransition(
+                company=self.company, task=task, from_status=from_status, to_status=to_status,
+                at=done_at - timedelta(hours=hours),
+            )
+            for from_status, to_status, hours in moves
+        )
+
+    def metrics(self, metric, **params):
+        """The endpoint's answer from the SQL query and from the Python fallback, which must agree."""
+        response = self.client.get(f'/api/tasks/{metric}/', params)
+        with mock.patch.dict(flow.DURATION, clear=True):
+            fallback = self.client.get(f'/api/tasks/{metric}/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(fallback.data['company'], response.data['company'])
+        self.assertEqual(fallback.data['by_assignee'], response.data['by_assignee'])
+        return response.data
+
+    def test_percentiles_are_nearest_rank_over_the_company_and_each_assignee(self):
+        for hours in (1, 2, 3, 4):
+            self.completed_task(self.bob, hours, cycle_hours=hours / 2)
+        self.completed_task(self.alice, 10)
+
+        lead_time = self.metrics('lead_time')
+        hour = 3600.0
+        self.assertEqual(lead_time['company'], {
+            'count': 5, 'avg': 4 * hour, 'p50': 3 * hour, 'p75': 4 * hour, 'p90': 10 * hour, 'p95': 10 * hour,
+        })
+        self.assertEqual(lead_time['by_assignee'], [
+            {'assigned_to': self.bob.pk, 'username': 'bob', 'count': 4, 'avg': 2.5 * hour,
+             'p50': 2 * hour, 'p75': 3 * hour, 'p90': 4 * hour, 'p95': 4 * hour},
+            {'assigned_to': self.alice.pk, 'username': 'alice', 'count': 1, 'avg': 10 * hour,
+             'p50': 10 * hour, 'p75': 10 * hour, 'p90': 10 * hour, 'p95': 10 * hour},
+        ])
+
+        # Alice's task never went through in_progress.
+        cycle_time = self.metrics('cycle_time')
+        self.assertEqual(cycle_time['company'], {
+            'count': 4, 'avg': 1.25 * hour, 'p50': hour, 'p75': 1.5 * hour, 'p90': 2 * hour, 'p95': 2 * hour,
+        })
+        self.assertEqual([row['username'] for row in cycle_time['by_assignee']], ['bob'])
+
+    def test_only_tasks_completed_in_the_window_count(self):
+        self.completed_task(self.bob, 1, done_days_ago=2)
+        self.assertEqual(self.metrics('lead_time', days=1)['company']['count'], 0)
+        self.assertEqual(self.metrics('lead_time', days=3)['company']['count'], 1)
+        self.assertEqual(self.client.get('/api/tasks/lead_time/', {'days': 0}).status_code, 400)
+
+    def test_tasks_created_done_take_no_time(self):
+        self.create_task(status='done')
+
+        lead_time = self.metrics('lead_time')['company']
+        self.assertEqual((lead_time['count'], lead_time['p95']), (1, 0.0))
+        self.assertEqual(self.metrics('cycle_time')['company'], {
+            'count': 0, 'avg': None, 'p50': None, 'p75': None, 'p90': None, 'p95': None,
+        })
+
+
+class ReplicaRoutingTests(TenantTestCase):
+    """Routing between ``default`` and a second SQLite database standing in for a replica."""
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # "Replicate" the tenant, then give each database a task of its own.
+        for obj in (cls.company, cls.alice, cls.bob):
+            obj.save(using='replica', force_insert=True)
+        for using in ('default', 'replica'):
+            Task.objects.using(using).bulk_create([
+                Task(title=f'on {using}', company=cls.company, created_by=cls.alice, assigned_to=cls.bob)
+            ])
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(db_router, 'REPLICAS', ('replica',))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Versions from before the sticky window: nothing needs the primary yet.
+        for scope in versions.SCOPES:
+            cache.set(versions.version_key(self.company.pk, scope), ('old', 0), None)
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def titles(self, response):
+        return [task['title'] for task in response.data['results']]
+
+    def test_reads_go_to_the_replica(self):
+        response = self.client.get('/api/tasks/', {'pagination': 'cursor'})
+        self.assertEqual(self.titles(response), ['on replica'])
+        self.assertNotIn(db_router.STICKY_COOKIE, response.cookies)
+
+    def test_writes_stick_the_client_to_the_primary(self):
+        response = self.client.post('/api/tasks/', {'title': 'new', 'assigned_to': self.bob.pk})
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(db_router.STICKY_COOKIE, response.cookies)
+
+        response = self.client.get('/api/tasks/', {'pagination': 'cursor'})
+        self.assertEqual(self.titles(response), ['new', 'on default'])
+
+    def test_streamed_exports_read_from_the_replica(self):
+        response = self.client.get('/api/tasks/export/')
+        self.assertIn(b'on replica', b''.join(response.streaming_content))
+
+    def test_async_streams_keep_their_routing(self):
+        async def view(request):
+            db_router.read_from_replica()
+
+            async def content():
+                yield db_router.read_alias()
+
+            return StreamingHttpResponse(content())
+
+        async def fetch():
+            middleware = db_router.ReplicaRoutingMiddleware(view)
+            response = await middleware(RequestFactory().get('/'))
+            return [chunk async for chunk in response.streaming_content]
+
+        self.assertEqual(async_to_sync(fetch)(), [b'replica'])
+
+    def test_commands_read_from_the_replica_inside_replica_reads(self):
+        self.assertEqual(list(Task.objects.values_list('title', flat=True)), ['on default'])
+        with db_router.replica_reads():
+            self.assertEqual(list(Task.objects.values_list('title', flat=True)), ['on replica'])
+            Task.objects.filter(title='on default').update(title='moved')
+            self.assertEqual(list(Task.objects.values_list('title', flat=True)), ['moved'])
+
+
+class ExternalTaskFetcherTests(SimpleTestCase):
+
+    def setUp(self):
+        self.requests = []
+        self.status = 200
+
+    def handle(self, request):
+        self.requests.append(request)
+        todos = [{'id': i, 'title': f'todo {i}', 'completed': False, 'userId': 1} for i in range(10)]
+        return httpx.Response(self.status, json=todos)
+
+    def fetcher(self, **kwargs):
+        return ExternalTaskFetcher('https://upstream.test/todos', transport=httpx.MockTransport(self.handle), **kwargs)
+
+    def test_fetches_the_shown_rows_once_then_serves_them_cached(self):
+        fetcher = self.fetcher(limit=2)
+
+        async def get_twice():
+            return await fetcher.get(), await fetcher.get()
+
+        (tasks, source), (_, cached) = async_to_sync(get_twice)()
+        self.assertEqual((source, cached), ('live', 'cached'))
+        self.assertEqual(tasks, [
+            {'id': 0, 'title': 'todo 0', 'completed': False, 'source': 'external'},
+            {'id': 1, 'title': 'todo 1', 'completed': False, 'source': 'external'},
+        ])
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(self.requests[0].url.params['_limit'], '2')
+
+    def test_failures_open_the_circuit(self):
+        self.status = 503
+        fetcher = self.fetcher(failure_threshold=2)
+
+        async def get_three_times():
+            return [await fetcher.get() for _ in range(3)]
+
+        with self.assertLogs('tasks.external', 'WARNING'):
+            self.assertEqual(async_to_sync(get_three_times)(), [([], 'unavailable')] * 3)
+        self.assertEqual(len(self.requests), 2)
+
+    def test_clients_of_finished_loops_are_closed(self):
+        fetcher = self.fetcher(ttl=0, stale_ttl=0)
+        async_to_sync(fetcher.get)()
+        (first,) = fetcher._clients.values()
+        async_to_sync(fetcher.get)()
+
+        self.assertTrue(first.is_closed)
+        self.assertEqual(len(fetcher._clients), 1)
+        self.assertEqual(len(self.requests), 2)
+
+
+class SearchTests(TenantTestCase):
+
+    def test_pages_follow_each_other_without_repeats(self):
+        # Titles with the term once, twice and three times rank differently, and tie among themselves.
+        expected = {
+            self.create_task(title=' '.join(['deploy'] * (i % 3 + 1)) + f' step {i}').pk for i in range(9)
+        }
+        self.create_task(title='unrelated')
+        client = APIClient()
+        client.force_authenticate(self.bob)
+
+        seen, url, params = [], '/api/tasks/search/', {'q': 'deploy', 'page_size': 2}
+        while url:
+            response = client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            seen += [task['id'] for task in response.data['results']]
+            url, params = response.data['next'], None
+            self.assertLessEqual(len(seen), len(expected))
+
+        self.assertCountEqual(seen, expected)
+
+
+class ConsumerTestCase(TransactionTestCase):
+    """
+    TaskConsumer sockets of two companies' users, with a replay log of their own.
+
+    Not a TestCase: database_sync_to_async closes connections left inside
+    a transaction, which would end the test's.
+    """
+
+    def setUp(self):
+        cache.clear()
+        local_users.clear()
+        self.company = Company.objects.create(name='Acme')
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'pw', company=self.company)
+        self.bob = User.objects.create_user('bob', 'bob@example.com', 'pw', company=self.company)
+        self.mallory = User.objects.create_user(
+            'mallory', 'mallory@example.com', 'pw', company=Company.objects.create(name='Other')
+        )
+        patcher = mock.patch.object(replay, 'log', replay.LocalReplayLog(3))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.sockets = []
+
+    async def connect(self, user, query=''):
+        communicator = WebsocketCommunicator(
+            TaskConsumer.as_asgi(), f'/ws/tasks/?token={AccessToken.for_user(user)}{query}'
+        )
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.sockets.append(communicator)
+        return communicator
+
+    async def disconnect(self):
+        for communicator in self.sockets:
+            await communicator.disconnect()
+
+    def change(self, task_id, status='done'):
+        return {
+            'action': 'updated', 'fields': ['status'],
+            'previous': {'status': 'todo', 'assigned_to': self.bob.pk},
+            'task': {'id': task_id, 'title': 'task', 'status': status, 'assigned_to': self.bob.pk,
+                     'updated_at': '2024-01-01T00:00:00Z'},
+        }
+
+    async def publish(self, company_id, items):
+        """Log ``items`` and send them to the company group, as tasks.broadcast does."""
+        seq = replay.append(company_id, items)
+        await get_channel_layer().group_send(
+            f'company_{company_id}', {'type': 'tasks_changed', 'seq': seq, 'changes': items}
+        )
+        return seq
+
+
+class ReplayTests(ConsumerTestCase):
+
+    async def test_reconnecting_sockets_are_sent_what_they_missed(self):
+        for task_id in (1, 2, 3):
+            replay.append(self.company.pk, [self.change(task_id)])
+        replay.append(self.mallory.company_id, [self.change(99)])
+
+        communicator = await self.connect(self.alice, '&since=1')
+        replayed = [await communicator.receive_json_from() for _ in range(3)]
+        self.assertEqual(
+            [(message['type'], message['seq']) for message in replayed],
+            [('tasks_changed', 2), ('tasks_changed', 3), ('replay_complete', 3)],
+        )
+        self.assertEqual([message['changes'][0]['task']['id'] for message in replayed[:2]], [2, 3])
+
+        await self.publish(self.company.pk, [self.change(4)])
+        message = await communicator.receive_json_from()
+        self.assertEqual((message['seq'], message['changes'][0]['task']['id']), (4, 4))
+        await self.disconnect()
+
+    async def test_trimmed_logs_ask_for_a_resync(self):
+        for task_id in range(1, 6):
+            replay.append(self.company.pk, [self.change(task_id)])
+
+        communicator = await self.connect(self.alice, '&since=1')
+        message = await communicator.receive_json_from()
+        self.assertEqual((message['type'], message['seq']), ('resync_required', 5))
+
+        # Events up to the resync point are part of the reload.
+        await get_channel_layer().group_send(
+            f'company_{self.company.pk}', {'type': 'tasks_changed', 'seq': 5, 'changes': [self.change(5)]}
+        )
+        self.assertTrue(await communicator.receive_nothing())
+        await self.publish(self.company.pk, [self.change(6)])
+        self.assertEqual((await communicator.receive_json_from())['seq'], 6)
+        await self.disconnect()
+
+    async def test_sockets_only_see_their_company(self):
+        await self.publish(self.mallory.company_id, [self.change(99)])
+        communicator = await self.connect(self.alice, '&since=0')
+        message = await communicator.receive_json_from()
+        self.assertEqual((message['type'], message['seq']), ('replay_complete', 0))
+
+        await self.publish(self.mallory.company_id, [self.change(100)])
+        self.assertTrue(await communicator.receive_nothing())
+        established = await (await self.connect(self.mallory)).receive_json_from()
+        self.assertEqual((established['type'], established['seq']), ('connection_established', 2))
+        await self.disconnect()
+
+
+class SubscriptionTests(ConsumerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.task = Task.objects.create(title='ours', company=self.company, created_by=self.alice, assigned_to=self.bob)
+        self.foreign = Task.objects.create(
+            title='theirs', company=self.mallory.company, created_by=self.mallory, assigned_to=self.mallory
+        )
+
+    async def subscribe(self, communicator, **data):
+        await communicator.send_json_to({'type': 'subscribe', **data})
+        return await communicator.receive_json_from()
+
+    async def broadcast(self, *tasks):
+        changes = {
+            (task.company_id, task.pk): {
+                'action': 'updated', 'fields': ['status'],
+                'previous': {'status': 'todo', 'assigned_to': task.assigned_to_id},
+            }
+            for task in tasks
+        }
+        await database_sync_to_async(broadcast.send_changes)(changes)
+
+    async def test_subscriptions_narrow_and_unsubscribing_widens_the_stream(self):
+        communicator = await self.connect(self.alice)
+        await communicator.receive_json_from()
+
+        reply = await self.subscribe(communicator, statuses=['done'])
+        self.assertEqual(reply['type'], 'subscribed')
+        self.assertEqual(reply['subscription']['statuses'], ['done'])
+        await self.publish(self.company.pk, [self.change(1, status='in_progress')])
+        self.assertTrue(await communicator.receive_nothing())
+
+        await communicator.send_json_to({'type': 'unsubscribe'})
+        self.assertEqual((await communicator.receive_json_from())['subscription']['statuses'], None)
+        await self.publish(self.company.pk, [self.change(2, status='in_progress')])
+        self.assertEqual((await communicator.receive_json_from())['changes'][0]['task']['id'], 2)
+
+        reply = await self.subscribe(communicator, statuses='done')
+        self.assertEqual(reply['type'], 'subscription_error')
+        await self.disconnect()
+
+    async def test_assigned_subscriptions_listen_on_the_user_group(self):
+        communicator = await self.connect(self.bob, '&assigned=1')
+        established = await communicator.receive_json_from()
+        self.assertTrue(established['subscription']['assigned'])
+
+        await self.broadcast(self.task)
+        message = await communicator.receive_json_from()
+        self.assertEqual([item['task']['id'] for item in message['changes']], [self.task.pk])
+        await self.publish(self.company.pk, [self.change(3)])
+        self.assertTrue(await communicator.receive_nothing())
+        await self.disconnect()
+
+    async def test_task_ids_of_other_companies_are_ignored(self):
+        communicator = await self.connect(self.alice)
+        await communicator.receive_json_from()
+        reply = await self.subscribe(communicator, task_ids=[self.foreign.pk, self.task.pk])
+        self.assertEqual(reply['subscription']['task_ids'], sorted([self.foreign.pk, self.task.pk]))
+
+        await self.broadcast(self.foreign)
+        self.assertTrue(await communicator.receive_nothing())
+        await self.broadcast(self.task, self.foreign)
+        message = await communicator.receive_json_from()
+        self.assertEqual([item['task']['id'] for item in message['changes']], [self.task.pk])
+        await self.disconnect()
+
+    async def test_events_of_the_previous_release_are_passed_on_as_tasks_changed(self):
+        communicator = await self.connect(self.alice, '&statuses=done')
+        await communicator.receive_json_from()
+
+        group = f'company_{self.company.pk}'
+        for event_type, status in (('task_created', 'todo'), ('task_updated', 'done')):
+            task = {**self.change(7)['task'], 'status': status}
+            await get_channel_layer().group_send(group, {'type': event_type, 'task': task})
+        message = await communicator.receive_json_from()
+        self.assertEqual((message['type'], message['seq']), ('tasks_changed', None))
+        # The subscription filter applies to them too.
+        changes = [(item['action'], item['task']['status']) for item in message['changes']]
+        self.assertEqual(changes, [('updated', 'done')])
+        self.assertTrue(await communicator.receive_nothing())
+        await self.disconnect()
+
+    async def test_compact_payloads_carry_only_the_changed_fields(self):
+        communicator = await self.connect(self.alice, '&payload=compact')
+        await communicator.receive_json_from()
+
+        await self.broadcast(self.task)
+        item, = (await communicator.receive_json_from())['changes']
+        self.assertEqual(set(item), {'action', 'fields', 'task'})
+        self.assertEqual(item['fields'], ['status'])
+        self.assertEqual(set(item['task']), {'id', 'updated_at', 'status'})
+        await self.disconnect()
+
+
+class SeedTests(TestCase):
+
+    def test_tasks_are_spread_over_the_last_year(self):
+        seed_tasks(companies=2, users_per_company=2, tasks=50, batch_size=20)
+
+        now = timezone.now()
+        created = list(Task.objects.values_list('created_at', flat=True))
+        self.assertEqual(len(created), 50)
+        self.assertGreater(len(set(created)), 40)
+        self.assertTrue(all(now - timedelta(days=366) < moment <= now for moment in created))
+        # Later writes are still stamped with their own time.
+        user = User.objects.first()
+        task = Task.objects.create(title='new', company=user.company, created_by=user, assigned_to=user)
+        self.assertGreaterEqual(task.created_at, now)
+
+
+class QueryPlanTests(TestCase):
+    """EXPLAIN every query of the read endpoints and fail on sequential scans of tasks."""
+
+    endpoints = [
+        ('list', '/api/tasks/', {}),
+        ('list (keyset)', '/api/tasks/', {'pagination': 'cursor'}),
+        ('list (status filter)', '/api/tasks/', {'status': 'done', 'pagination': 'cursor'}),
+        ('list (by updated_at)', '/api/tasks/', {'ordering': '-updated_at', 'pagination': 'cursor'}),
+        ('list (by status)', '/api/tasks/', {'ordering': 'status', 'pagination': 'cursor'}),
+        ('my_tasks', '/api/tasks/my_tasks/', {'pagination': 'cursor'}),
+        ('retrieve', '/api/tasks/{pk}/', {}),
+        ('statistics', '/api/tasks/statistics/', {}),
+        ('export', '/api/tasks/export/', {}),
+        ('search', '/api/tasks/search/', {'q': 'task'}),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        # Enough evenly sized tenants that reading one in full is never the cheap plan.
+        seed_tasks(companies=20, users_per_company=5, tasks=20000, skew=0, prefix='plan')
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.task = Task.objects.order_by('-created_at').first()
+
+    def setUp(self):
+        cache.clear()
+        local_responses.clear()
+        local_users.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.task.assigned_to)
+        self.pattern = SEQUENTIAL_SCANS.get(connection.vendor)
+        if self.pattern is None:
+            self.skipTest(f'No plan checks for {connection.vendor}')
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}')
+            return '\n'.join(' '.join(str(col) for col in row) for row in cursor.fetchall())
+
+    def test_read_endpoints_use_indexes(self):
+        for label, url, params in self.endpoints:
+            if label == 'search' and connection.vendor != 'postgresql':
+                # Full-text search has no index outside PostgreSQL.
+                continue
+            with self.subTest(label):
+                with CaptureQueriesContext(connection) as captured:
+                    response = self.client.get(url.format(pk=self.task.pk), params)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                self.assertEqual(response.status_code, 200)
+                for query in captured.captured_queries:
+                    if 'tasks_task' in query['sql']:
+                        plan = self.explain(query['sql'])
+                        self.assertIsNone(self.pattern.search(plan), f"{query['sql']}\n{plan}")
@@ -0,0 +1,39 @@
+"""
+Writes to the append-only TaskTransition log.
+
+``Task.save()`` logs creation and status changes through
+:func:`record_change`; bulk paths build the rows with :func:`transition`
+and insert them with one :func:`record` call.
+"""
+from django.utils import timezone
+
+
+def transition(task, from_status, at=None):
+    from .models import TaskTransition
+
+    return TaskTransition(
+        company_id=task.company_id,
+        task_id=task.pk,
+        from_status=from_status or '',
+        to_status=task.status,
+        at=at or timezone.now(),
+    )
+
+
+def created(task):
+    return transition(task, '', task.created_at)
+
+
+def record_change(task, previous, current):
+    """Log a save that moved ``task`` from bucket ``previous`` (None when new) to ``current``."""
+    if previous is None:
+        record([created(task)])
+    elif previous[1] != current[1]:
+        record([transition(task, previous[1])])
+
+
+def record(rows):
+    from .models import TaskTransition
+
+    if rows:
+        TaskTransition.objects.bulk_create(rows, batch_size=1000)
@@ -0,0 +1,94 @@
+"""
+Per-company version tokens for cheap HTTP validators.
+
+Every committed write to a company's tasks replaces its ``tasks`` token,
+and every change to its users or the company itself replaces its
+``members`` token (task payloads embed user details). A token is a random
+string plus the time it was replaced, kept in the shared cache without
+expiry, so comparing a client's ETag costs one cache round trip instead
+of a query and a serialization.
+"""
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+SCOPES = ('tasks', 'members')
+
+_local = threading.local()
+
+
+def version_key(company_id, scope):
+    return f'tasks:version:{company_id}:{scope}'
+
+
+def new_version():
+    return (uuid.uuid4().hex, time.time())
+
+
+def touch(company_id, scope='tasks'):
+    """Replace the company's ``scope`` token once the current transaction commits."""
+    if company_id is None:
+        return
+    pending = getattr(_local, 'pending', None)
+    if pending is not None:
+        pending.add((company_id, scope))
+    else:
+        transaction.on_commit(lambda: bump(company_id, scope))
+
+
+@contextmanager
+def deferred():
+    """Touch each company once on exit instead of once per row (e.g. per ``post_delete``)."""
+    if getattr(_local, 'pending', None) is not None:
+        yield
+        return
+    _local.pending = set()
+    try:
+        yield
+        pending = _local.pending
+    finally:
+        _local.pending = None
+    for company_id, scope in pending:
+        touch(company_id, scope)
+
+
+def bump(company_id, scope='tasks'):
+    try:
+        cache.set(version_key(company_id, scope), new_version(), None)
+    except Exception:
+        logger.warning('Version cache unavailable; could not bump %s', version_key(company_id, scope), exc_info=True)
+
+
+def current(company_id, scopes=SCOPES):
+    """
+    ``{scope: (token, modified_at)}`` for the company, or None when the cache is down.
+
+    Missing tokens (a cold or flushed cache) are started afresh, which only
+    costs clients one full response.
+    """
+    if company_id is None:
+        return None
+    keys = {version_key(company_id, scope): scope for scope in scopes}
+    try:
+        found = cache.get_many(list(keys))
+        for key in set(keys) - set(found):
+            cache.add(key, new_version(), None)
+            found[key] = cache.get(key)
+    except Exception:
+        logger.warning('Version cache unavailable; serving without validators', exc_info=True)
+        return None
+    if None in found.values():
+        return None
+    return {scope: found[key] for key, scope in keys.items()}
+
+
+def changed_within(tokens, seconds):
+    """Whether any of ``tokens`` (from :func:`current`) was replaced in the last ``seconds``."""
+    return any(time.time() - modified < seconds for _, modified in tokens.values())
@@ -1,114 +1,312 @@
+from collections import Counter
+from datetime import timedelta
 from rest_framework import viewsets, status
-from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from django.db.models import Q, Count
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-from .models import Task
-from .serializers import TaskSerializer, TaskCreateSerializer
+from django.db import transaction
+from django.utils import timezone
+from task_manager import db_router
+from .models import Task, TaskCounter
+from .serializers import TaskSerializer, TaskCreateSerializer, TaskSearchSerializer, attach_company
+from .broadcast import queue_task_change
+from . import bulk, conditional, export, filters, flow, response_cache, rollups, search, versions
+from .filters import TaskFilterBackend, TaskOrderingBackend
+from .pagination import SearchPagination, TaskPagination
 from .permissions import SameCompanyPermission
 
+
 class TaskViewSet(viewsets.ModelViewSet):
     serializer_class = TaskSerializer
     permission_classes = [IsAuthenticated, SameCompanyPermission]
+    pagination_class = TaskPagination
+    filter_backends = [TaskFilterBackend, TaskOrderingBackend]
+    # Read-only actions, served from a replica when there is one.
+    replica_actions = frozenset({
+        'list', 'retrieve', 'export', 'search', 'my_tasks', 'statistics', 'trends', 'lead_time', 'cycle_time',
+    })
+
+    def initial(self, request, *args, **kwargs):
+        # Authenticate on the primary: a user who just registered may not
+        # have reached the replica yet.
+        super().initial(request, *args, **kwargs)
+        if self.action in self.replica_actions:
+            db_router.read_from_replica()
 
     def get_queryset(self):
         user = self.request.user
         if user.company:
-            return Task.objects.filter(company=user.company)
+            # The search vector is only used inside SQL; don't ship it to Python.
+            queryset = Task.objects.filter(company=user.company).select_related(
+                'assigned_to', 'created_by'
+            ).defer('search_vector')
+            fields = self.get_sparse_fields()
+            if fields is not None:
+                queryset = filters.only_columns(queryset, fields, self.get_ordering())
+            return queryset
         return Task.objects.none()
 
+    def get_sparse_fields(self):
+        """Fields selected with ?fields= on read requests, or None for all of them"""
+        if not hasattr(self, '_sparse_fields'):
+            self._sparse_fields = None
+            if self.request.method == 'GET':
+                serializer_class = TaskSearchSerializer if self.action == 'search' else TaskSerializer
+                self._sparse_fields = filters.sparse_fields(self.request, serializer_class.Meta.fields)
+        return self._sparse_fields
+
+    def get_ordering(self):
+        if self.action == 'search':
+            return SearchPagination.ordering
+        return TaskOrderingBackend().get_ordering(self.request, None, self)
+
+    def get_serializer(self, *args, **kwargs):
+        if args and self.request.user.company:
+            attach_company(args[0], self.request.user.company)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['company_cache'] = {}
+        context['fields'] = self.get_sparse_fields()
+        return context
+
     def get_serializer_class(self):
         if self.action == 'create':
             return TaskCreateSerializer
         return TaskSerializer
 
+    def list(self, request, *args, **kwargs):
+        return self.cached_read(request, 'list', lambda: super(TaskViewSet, self).list(request, *args, **kwargs))
+
+    def cached_read(self, request, endpoint, compute, per_user=False, serve_stale=False):
+        """Answer a company-wide read with a 304, from the response cache, or by computing it"""
+        tokens = versions.current(request.user.company_id)
+        if tokens is not None and versions.changed_within(tokens, db_router.REPLICA_STICKY_SECONDS):
+            # A replica may not have the write that started this generation
+            # yet, and a response computed now is cached under it.
+            db_router.pin_primary()
+        return conditional.conditional_response(
+            request, conditional.collection_validators(request, tokens),
+            lambda: response_cache.cached_response(
+                request, endpoint, tokens, compute, per_user=per_user, serve_stale=serve_stale
+            )
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return conditional.conditional_response(
+            request, conditional.task_validators(request, kwargs[self.lookup_field]),
+            lambda: super(TaskViewSet, self).retrieve(request, *args, **kwargs)
+        )
+
     def perform_create(self, serializer):
         task = serializer.save()
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f"company_{task.company.id}",
-            {
-                "type": "task_created",
-                "task": TaskSerializer(task).data
-            }
-        )
+        queue_task_change(task, 'created')
 
     def perform_update(self, serializer):
         task = serializer.save()
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f"company_{task.company.id}",
-            {
-                "type": "task_updated",
-                "task": TaskSerializer(task).data
-            }
+        queue_task_change(task, 'updated')
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            # Queued first: delete() clears the primary key.
+            queue_task_change(instance, 'deleted')
+            instance.delete()
+
+    @action(detail=False, methods=['post'])
+    def bulk_create(self, request):
+        """Create many tasks in one request, reporting invalid items by index"""
+        tasks, errors = bulk.bulk_create_tasks(request.user, request.data)
+        attach_company(tasks, request.user.company)
+        return self.bulk_response(
+            {'created': TaskSerializer(tasks, many=True, context=self.get_serializer_context()).data},
+            tasks, errors, success_status=status.HTTP_201_CREATED
+        )
+
+    @action(detail=False, methods=['patch'])
+    def bulk_update(self, request):
+        """Partially update many tasks; each item needs an 'id'"""
+        tasks, errors = bulk.bulk_update_tasks(request.user, request.data)
+        attach_company(tasks, request.user.company)
+        return self.bulk_response(
+            {'updated': TaskSerializer(tasks, many=True, context=self.get_serializer_context()).data},
+            tasks, errors
+        )
+
+    @action(detail=False, methods=['post'])
+    def bulk_delete(self, request):
+        """Delete many tasks given a list of ids"""
+        deleted, errors = bulk.bulk_delete_tasks(request.user, request.data)
+        return self.bulk_response({'deleted': deleted}, deleted, errors)
+
+    def bulk_response(self, data, done, errors, success_status=status.HTTP_200_OK):
+        if errors and not done:
+            response_status = status.HTTP_400_BAD_REQUEST
+        elif errors:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = success_status
+        data['errors'] = errors
+        return Response(data, status=response_status)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream the company's full task set as NDJSON or CSV (?output=csv)"""
+        output = request.query_params.get('output', 'ndjson')
+        if output not in export.FORMATS:
+            return Response(
+                {'error': f"Unsupported output '{output}'; use one of {', '.join(export.FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return export.export_response(
+            self.filter_queryset(self.get_queryset()), output, is_async=export.served_by_asgi(request),
+            filename=f'tasks-{request.user.company_id}'
         )
 
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Full-text search over title and description (?q=), best match first, keyset paginated"""
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return Response({'error': 'Missing search query ?q='}, status=status.HTTP_400_BAD_REQUEST)
+        results = search.search_tasks(self.filter_queryset(self.get_queryset()), text)
+        paginator = SearchPagination()
+        page = paginator.paginate_queryset(results, request, self)
+        attach_company(page, request.user.company)
+        serializer = TaskSearchSerializer(page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
+
     @action(detail=False, methods=['get'])
     def my_tasks(self, request):
         """Get tasks assigned to current user"""
-        tasks = self.get_queryset().filter(assigned_to=request.user)
+        return self.cached_read(request, 'my_tasks', lambda: self.my_tasks_response(request), per_user=True)
+
+    def my_tasks_response(self, request):
+        tasks = self.filter_queryset(self.get_queryset().filter(assigned_to=request.user))
+        page = self.paginate_queryset(tasks)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
         serializer = self.get_serializer(tasks, many=True)
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
     def statistics(self, request):
         """Get task statistics for the company"""
-        queryset = self.get_queryset()
+        # Polled by every dashboard; a few seconds of lag is fine, a
+        # recomputation stampede after each write is not.
+        return self.cached_read(request, 'statistics', lambda: self.statistics_response(request), serve_stale=True)
+
+    def statistics_response(self, request):
+        # Read the incrementally maintained counters instead of aggregating
+        # the company's whole task set on every poll.
+        buckets = TaskCounter.objects.filter(
+            company=request.user.company, count__gt=0
+        ).values_list('status', 'assigned_to__username', 'count')
+        by_status, by_user = Counter(), Counter()
+        for task_status, username, count in buckets:
+            by_status[task_status] += count
+            by_user[username] += count
         stats = {
-            'total_tasks': queryset.count(),
-            'by_status': dict(queryset.values_list('status').annotate(count=Count('status'))),
-            'by_user': dict(queryset.values_list('assigned_to__username').annotate(count=Count('assigned_to')))
+            'total_tasks': sum(by_status.values()),
+            'by_status': dict(by_status),
+            'by_user': dict(by_user)
         }
         return Response(stats)
 
-import httpx
+    @action(detail=False, methods=['get'])
+    def trends(self, request):
+        """Created/completed/cancelled/transition counts per day or hour (?granularity=hour&periods=48)"""
+        granularity = request.query_params.get('granularity', 'day')
+        if granularity not in rollups.TRUNCATE:
+            return Response(
+                {'error': f"Unsupported granularity '{granularity}'; use one of {', '.join(rollups.TRUNCATE)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        max_periods = rollups.MAX_PERIODS[granularity]
+        try:
+            periods = int(request.query_params.get('periods', 30 if granularity == 'day' else 48))
+        except ValueError:
+            periods = 0
+        if not 1 <= periods <= max_periods:
+            return Response(
+                {'error': f'periods must be an integer between 1 and {max_periods}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        # Served from the pre-aggregated rollups: at most `periods` rows
+        # read through the (company, granularity, period_start) index.
+        return Response({
+            'granularity': granularity,
+            'updated_at': rollups.last_update(),
+            'series': rollups.trend(request.user.company, granularity, periods)
+        })
+
+    @action(detail=False, methods=['get'])
+    def lead_time(self, request):
+        """Creation-to-done percentiles for tasks completed in the last ?days= (default 90)"""
+        return self.flow_response(request, 'lead_time')
+
+    @action(detail=False, methods=['get'])
+    def cycle_time(self, request):
+        """In-progress-to-done percentiles for tasks completed in the last ?days= (default 90)"""
+        return self.flow_response(request, 'cycle_time')
+
+    def flow_response(self, request, metric):
+        try:
+            days = int(request.query_params.get('days', 90))
+        except ValueError:
+            days = 0
+        if not 1 <= days <= 366:
+            return Response(
+                {'error': 'days must be an integer between 1 and 366'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        since = timezone.now() - timedelta(days=days)
+        return Response({
+            'metric': metric,
+            'unit': 'seconds',
+            'since': since,
+            **flow.flow_metrics(request.user.company, metric, since)
+        })
+
 import asyncio
 from django.views.decorators.http import require_http_methods
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
-from asgiref.sync import sync_to_async
+from task_manager.async_api import AsyncAPIView
+from . import external
+
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-async def external_tasks_view(request):
+class ExternalTasksView(AsyncAPIView):
     """Async endpoint that fetches external data and merges with local tasks"""
-    try:
-        # Fetch external data asynchronously
-        async with httpx.AsyncClient() as client:
-            response = await client.get('https://jsonplaceholder.typicode.com/todos', timeout=10.0)
-            external_tasks = response.json()[:5]
-        
-        # Fetch local tasks asynchronously  
-        user = request.user
-        if user.company:
-            local_tasks = await sync_to_async(list)(
-                Task.objects.filter(company=user.company)[:5]
-            )
-            local_tasks_data = await sync_to_async(lambda: TaskSerializer(local_tasks, many=True).data)()
-        else:
-            local_tasks_data = []
-        
-        merged_data = {
+    permission_classes = [IsAuthenticated]
+
+    async def get(self, request):
+        # The upstream call and the local query run concurrently; the
+        # fetcher answers from its cache or circuit breaker when the
+        # upstream is slow or down, so this never waits on it for long.
+        (external_tasks, source), local_tasks_data = await asyncio.gather(
+            external.fetcher.get(),
+            self.local_tasks(request.user),
+        )
+
+        return Response({
             'local_tasks': local_tasks_data,
-            'external_tasks': [
-                {
-                    'id': task['id'],
-                    'title': task['title'],
-                    'completed': task['completed'],
-                    'source': 'external'
-                }
-                for task in external_tasks
-            ],
+            'external_tasks': external_tasks,
+            'external_source': source,
             'merged_count': len(local_tasks_data) + len(external_tasks)
-        }
-        
-        return Response(merged_data)
-    
-    except Exception as e:
-        return Response(
-            {'error': f'Failed to fetch external data: {str(e)}'}, 
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
\ No newline at end of file
+        })
+
+    async def local_tasks(self, user):
+        if not user.company:
+            return []
+        local_tasks = [
+            task async for task in
+            Task.objects.filter(company=user.company).select_related('assigned_to', 'created_by')[:5]
+        ]
+        # With the company attached serialization needs no further queries.
+        attach_company(local_tasks, user.company)
+        return TaskSerializer(local_tasks, many=True, context={'company_cache': {}}).data
+
+
+external_tasks_view = ExternalTasksView.as_view()